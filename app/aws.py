@@ -3,9 +3,10 @@
 # AWS interface definitions.
 
 
-from app.aws_s3     import *
-from app.aws_sqs    import *
-from app.aws_lambda import *
+from app.aws_session import *
+from app.aws_s3      import *
+from app.aws_sqs     import *
+from app.aws_lambda  import *
 
 
 # =============================================================================
@@ -3,10 +3,15 @@
 # AWS Lambda interface definitions.
 
 
-import boto3
-import boto3_type_annotations.lambda_ as lam
+from __future__ import annotations
 
-from app.common import *
+from typing import TYPE_CHECKING
+
+from app.common      import *
+from app.aws_session import *
+
+if TYPE_CHECKING:
+    import boto3_type_annotations.lambda_ as lam
 
 
 # =============================================================================
@@ -41,7 +46,7 @@ LAMBDA_RUNTIMES = [
 
 
 def get_lambda_client() -> lam.Client:
-    return boto3.client('lambda')
+    return aws_client('lambda')
 
 
 def get_lambda_functions(cli=None, all_versions=False) -> List[Dict]:
@@ -3,13 +3,52 @@
 # AWS S3 interface definitions.
 
 
+from __future__ import annotations
+
+import io
+import math
+import queue
 import re
-import boto3
-import boto3_type_annotations.s3 as s3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing             import TYPE_CHECKING
+
+from app.common      import *
+from app.aws_session import *
+
+if TYPE_CHECKING:
+    import boto3_type_annotations.s3 as s3
+
+botocore_exceptions = lazy_module('botocore.exceptions')
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# The maximum number of object keys in a single DeleteObjects request, and in
+# a single page of ListObjectsV2 results.
+S3_DELETE_LIMIT   = 1000
+S3_LIST_PAGE_SIZE = 1000
+
+# Bytes per read when writing a byte range to its place in the file.
+RANGE_READ_SIZE = 1 << 20
+
+# Characters used to split the key space into ranges for parallel listing.
+# (Keys sorting before the first or after the last fall into the first or last
+# range.)
+LIST_SHARD_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
 
-from botocore.exceptions import ClientError
+# Most characters by which key prefixes are extended, and most single-key
+# listing requests made, when probing the keys before the key space is split.
+LIST_SHARD_DEPTH  = 4
+LIST_SHARD_PROBES = 100
 
-from app.common import *
+# Sorts after any character which may follow a key prefix.
+LAST_KEY_CHAR = chr(0x10FFFF)
 
 
 # =============================================================================
@@ -18,35 +57,43 @@ from app.common import *
 
 
 def is_s3_client(item) -> bool:
-    return 'list_objects' in dir(item)
+    return 'list_objects' in aws_attributes(item)
 
 
 def is_s3_resource(item) -> bool:
-    return 'buckets' in dir(item)
+    return 'buckets' in aws_attributes(item)
 
 
 def is_s3_bucket(item) -> bool:
-    return 'objects' in dir(item)
+    return 'objects' in aws_attributes(item)
 
 
 def is_s3_object(item) -> bool:
-    return '_bucket_name' in dir(item)
+    return 'bucket_name' in aws_attributes(item)
 
 
-def s3_client(item) -> s3.Client:
+def s3_client(item, connections=None) -> s3.Client:
+    """
+    The client of an S3 object, or the shared S3 client.
+
+    :param object   item:           Client, resource, bucket or None.
+    :param int|None connections:    Concurrent threads the shared client must
+                                        support.
+
+    """
     if is_s3_client(item):
         return item
     elif is_s3_resource(item) or is_s3_bucket(item):
         return item.meta.client
     else:
-        return boto3.client('s3')
+        return aws_client('s3', connections=connections)
 
 
 def s3_resource(item) -> s3.ServiceResource:
     if is_s3_resource(item):
         return item
     else:
-        return boto3.resource('s3')
+        return aws_resource('s3')
 
 
 # =============================================================================
@@ -111,7 +158,7 @@ def create_s3_bucket(name, region=None, s3_item=None) -> bool:
         config['LocationConstraint'] = region
     try:
         s3_item.create_bucket(Bucket=name, CreateBucketConfiguration=config)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         log_error(error)
         return False
     return True
@@ -153,7 +200,7 @@ def upload_to_s3_bucket(file_path, bucket, object_key=None, s3_item=None):
         else:
             bucket = get_s3_bucket(bucket, s3_item)
             bucket.upload_file(file_path, object_key)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         log_error(error)
         return False
     return True
@@ -183,12 +230,138 @@ def download_from_s3_bucket(object_key, bucket, file_path=None, s3_item=None):
         else:
             bucket = get_s3_bucket(bucket, s3_item)
             bucket.download_file(object_key, file_path)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         log_error(error)
         return False
     return True
 
 
+def download_ranges_from_s3_bucket(
+        object_key,
+        bucket,
+        file_path=None,
+        size=None,
+        parts=RANGED_DOWNLOAD_PARTS,
+        s3_item=None) -> bool:
+    """
+    Download a file from an S3 bucket by fetching byte ranges concurrently.
+
+    The local file is preallocated to the full size of the object and each
+    range is written to its place with positioned writes, so the ranges can
+    arrive in any order.  All ranges are requested on the condition that the
+    object has not changed since its size was determined.
+
+    :param str           object_key:    Source S3 object name.
+    :param str|s3.Bucket bucket:        Source bucket name or instance.
+    :param str           file_path:     Local name for the downloaded file;
+                                            defaults to object_key.
+    :param int           size:          The object's content_length if known.
+    :param int           parts:         Number of concurrent range requests.
+    :param s3.Client     s3_item:       Default: the shared client with a
+                                            connection pool sized for *parts*.
+
+    :return: Whether file was downloaded.
+    :rtype:  bool
+
+    """
+    file_path   = file_path or object_key
+    bucket_name = bucket if isinstance(bucket, str) else bucket.name
+    parts       = max(1, parts)
+    s3_cli      = s3_client(s3_item, parts)
+    start_time  = time.time()
+    fd          = None
+    try:
+        head = s3_cli.head_object(Bucket=bucket_name, Key=object_key)
+        etag = head['ETag']
+        size = head['ContentLength'] if size is None else size
+        span = max(1, math.ceil(size / parts))
+
+        def fetch(start):
+            end      = min(start + span, size) - 1
+            response = s3_cli.get_object(
+                Bucket=bucket_name,
+                Key=object_key,
+                Range=f"bytes={start}-{end}",
+                IfMatch=etag
+            )
+            body     = response['Body']
+            offset   = start
+            chunk    = memoryview(body.read(RANGE_READ_SIZE))
+            while chunk:
+                count   = os.pwrite(fd, chunk, offset)
+                offset += count
+                chunk   = chunk[count:]
+                if not chunk:
+                    chunk = memoryview(body.read(RANGE_READ_SIZE))
+            return offset - start
+
+        fd = os.open(file_path, (os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 0o644)
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=parts) as pool:
+            received = sum(pool.map(fetch, range(0, size, span)))
+        length = os.fstat(fd).st_size
+        if received != size or length != size:
+            raise ValueError(
+                f"{object_key}: {received} bytes received and {length} bytes "
+                f"written but content_length is {size}"
+            )
+    except Exception as error:
+        log_error(error)
+        if fd is not None:
+            os.close(fd)
+            fd = None
+            os.remove(file_path)
+        return False
+    finally:
+        if fd is not None:
+            os.close(fd)
+    if AWS_DEBUG:
+        elapsed = max((time.time() - start_time), 0.001)
+        rate    = size / elapsed / (1 << 20)
+        show(f"{object_key}: {size} bytes in {parts} ranges {rate:.1f} MB/s")
+    return True
+
+
+def read_from_s3_bucket(object_key, bucket, s3_item=None) -> io.BytesIO:
+    """
+    Get the contents of an S3 object with a single GET request.
+
+    Unlike download_fileobj(), this does not involve the machinery for
+    multi-part transfers, which is only a burden when fetching small objects.
+
+    :param str           object_key:    Source S3 object name.
+    :param str|s3.Bucket bucket:        Source bucket name or instance.
+    :param s3.Client|s3.ServiceResource s3_item:
+
+    :return: The object contents.
+
+    """
+    bucket_name = bucket if isinstance(bucket, str) else bucket.name
+    s3_cli      = s3_client(s3_item or bucket)
+    response    = s3_cli.get_object(Bucket=bucket_name, Key=object_key)
+    return io.BytesIO(response['Body'].read())
+
+
+def open_from_s3_bucket(object_key, bucket, s3_item=None):
+    """
+    Start a single GET request for an S3 object, leaving its contents to be
+    read by the caller as they arrive.
+
+    :param str           object_key:    Source S3 object name.
+    :param str|s3.Bucket bucket:        Source bucket name or instance.
+    :param s3.Client|s3.ServiceResource s3_item:
+
+    :return: The object's body stream (to be closed by the caller) and its
+                content length.
+    :rtype:  tuple[botocore.response.StreamingBody, int]
+
+    """
+    bucket_name = bucket if isinstance(bucket, str) else bucket.name
+    s3_cli      = s3_client(s3_item or bucket)
+    response    = s3_cli.get_object(Bucket=bucket_name, Key=object_key)
+    return response['Body'], response['ContentLength']
+
+
 def delete_from_s3_bucket(object_keys, bucket, s3_item=None):
     """
     Remove a file from an S3 bucket.
@@ -201,21 +374,42 @@ def delete_from_s3_bucket(object_keys, bucket, s3_item=None):
     :rtype:  bool
 
     """
-    object_list = []
-    for key in to_list(object_keys):
-        object_list.append({'Key': key})
-    if object_list:
+    return not remove_from_s3_bucket(object_keys, bucket, s3_item)
+
+
+def remove_from_s3_bucket(object_keys, bucket, s3_item=None) -> Dict[str, str]:
+    """
+    Remove files from an S3 bucket, sending as many DeleteObjects requests as
+    needed to stay within the per-request limit.
+
+    :param str|list[str] object_keys:   Target S3 object name(s).
+    :param str|s3.Bucket bucket:        Target bucket name or instance.
+    :param s3.Client|s3.ServiceResource s3_item:
+
+    :return: Error messages for the object keys that could not be removed.
+
+    """
+    failures = {}
+    keys     = to_list(object_keys)
+    for index in range(0, len(keys), S3_DELETE_LIMIT):
+        batch       = keys[index:(index + S3_DELETE_LIMIT)]
+        object_list = [{'Key': key} for key in batch]
+        request     = {'Objects': object_list, 'Quiet': True}
         try:
             if is_s3_client(s3_item):
                 bucket = bucket if isinstance(bucket, str) else bucket.name
-                s3_item.delete_objects(bucket, Delete={'Objects': object_list})
+                result = s3_item.delete_objects(Bucket=bucket, Delete=request)
             else:
                 bucket = get_s3_bucket(bucket, s3_item)
-                bucket.delete_objects(Delete={'Objects': object_list})
-        except ClientError as error:
+                result = bucket.delete_objects(Delete=request)
+        except botocore_exceptions.ClientError as error:
             log_error(error)
-            return False
-    return True
+            failures.update(dict.fromkeys(batch, str(error)))
+            continue
+        for entry in result.get('Errors', []):
+            message = f"{entry.get('Code')}: {entry.get('Message')}"
+            failures[entry.get('Key')] = message
+    return failures
 
 
 # =============================================================================
@@ -239,6 +433,243 @@ def prefix_of(obj):
     return '/'.join(parts) + '/' if parts else ''
 
 
+def s3_list_objects(
+        bucket,
+        prefix='',
+        delimiter=None,
+        start_after=None,
+        end_at=None,
+        s3_item=None) -> Iterator[dict]:
+    """
+    Generate object summaries from a bucket listing one page at a time, so
+    that the caller can act on the first page before the rest have arrived.
+
+    :param str|s3.Bucket bucket:        Bucket name or instance.
+    :param str           prefix:        Only list keys starting with this.
+    :param str|None      delimiter:     If given (e.g. '/'), keys containing
+                                            it after *prefix* are not listed.
+    :param str|None      start_after:   List keys after this one.
+    :param str|None      end_at:        List keys up to and including this.
+    :param s3.Client|s3.ServiceResource s3_item:
+
+    :return: Dicts with 'Key', 'Size', 'LastModified', 'ETag', etc.
+
+    """
+    bucket_name = bucket if isinstance(bucket, str) else bucket.name
+    paginator   = s3_client(s3_item or bucket).get_paginator('list_objects_v2')
+    params      = {'Bucket': bucket_name, 'Prefix': prefix or ''}
+    if delimiter:
+        params['Delimiter'] = delimiter
+    if start_after:
+        params['StartAfter'] = start_after
+    for page in paginator.paginate(**params):
+        for entry in page.get('Contents', []):
+            if end_at is not None and entry['Key'] > end_at:
+                return
+            yield entry
+
+
+def s3_list_objects_sharded(
+        bucket,
+        prefix='',
+        delimiter=None,
+        shards=LIST_SHARDS,
+        s3_item=None,
+        shard_prefix=LIST_SHARD_PREFIX) -> Iterator[dict]:
+    """
+    Generate object summaries from a bucket by listing several ranges of the
+    key space in parallel.  Pages are yielded as they arrive from any range,
+    so objects are not generated in key order.
+
+    Submission IDs which are generated (e.g. "u" followed by hex digits)
+    share leading characters and use only some of LIST_SHARD_ALPHABET, so
+    splitting on the character after *prefix* would put nearly every key in
+    one range.  Unless *shard_prefix* is given, the keys are probed first to
+    find their shared leading characters and the characters which follow
+    those (see _shard_bounds()).  If *shard_prefix* is given, the ranges are
+    split over LIST_SHARD_ALPHABET after it; keys which do not start with it
+    are still listed, just not in parallel.
+
+    :param str|s3.Bucket bucket:        Bucket name or instance.
+    :param str           prefix:        Only list keys starting with this.
+    :param str|None      delimiter:     If given (e.g. '/'), keys containing
+                                            it after *prefix* are not listed.
+    :param int           shards:        Number of ranges listed in parallel.
+    :param s3.Client     s3_item:       Default: the shared client with a
+                                            connection pool sized for *shards*.
+    :param str|None      shard_prefix:  Common leading characters of the keys
+                                            (starting with *prefix*).
+
+    :return: Dicts with 'Key', 'Size', 'LastModified', 'ETag', etc.
+
+    """
+    shards = max(1, min(shards, len(LIST_SHARD_ALPHABET)))
+    s3_cli = s3_client(s3_item, shards)
+    if shards == 1:
+        yield from s3_list_objects(bucket, prefix, delimiter, s3_item=s3_cli)
+        return
+
+    # Each range starts after the previous range's last possible key.
+    prefix = prefix or ''
+    if shard_prefix:
+        bounds = _split_bounds(shard_prefix, LIST_SHARD_ALPHABET, shards)
+    else:
+        bounds = _shard_bounds(bucket, prefix, delimiter, shards, s3_cli)
+    ranges = list(zip([None, *bounds], [*bounds, None]))
+    pages  = queue.Queue(maxsize=(2 * shards))
+    done   = threading.Event()
+
+    def list_range(start_after, end_at):
+        page = []
+        try:
+            for entry in s3_list_objects(
+                    bucket, prefix, delimiter, start_after, end_at, s3_cli):
+                if done.is_set():
+                    return  # The listing was abandoned.
+                page.append(entry)
+                if len(page) == S3_LIST_PAGE_SIZE:
+                    put(page)
+                    page = []
+            put(page)
+        except Exception as error:
+            put(error)
+        put(None)
+
+    def put(item):
+        while not done.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    workers = [threading.Thread(target=list_range, args=r) for r in ranges]
+    for worker in workers:
+        worker.start()
+    try:
+        remaining = len(workers)
+        while remaining:
+            page = pages.get()
+            if page is None:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        done.set()
+        for worker in workers:
+            worker.join()
+
+
+def _shard_bounds(bucket, prefix, delimiter, shards, s3_item=None):
+    """
+    The keys on which to split the listing of *prefix* into ranges which
+    hold similar numbers of keys.
+
+    The key prefixes one character longer than *prefix* are found by
+    skipping from the first key to the first key after all of those with the
+    same next character, and so on.  While there are fewer than *shards* of
+    them, each is extended by another character (up to LIST_SHARD_DEPTH
+    times), so that leading characters shared by the keys of generated IDs
+    are passed over.  The ranges are split on evenly spaced key prefixes,
+    which assumes that each holds a similar number of keys.  If no prefixes
+    are found within LIST_SHARD_PROBES requests, the ranges are split over
+    LIST_SHARD_ALPHABET.
+
+    :param str|s3.Bucket bucket:        Bucket name or instance.
+    :param str           prefix:
+    :param str|None      delimiter:     Keys grouped by it are not considered.
+    :param int           shards:        Most ranges.
+    :param s3.Client     s3_item:
+
+    :rtype: list[str]
+
+    """
+    probes   = LIST_SHARD_PROBES
+    prefixes = [prefix]
+    for _ in range(LIST_SHARD_DEPTH):
+        extended = []
+        for base in prefixes:
+            found = []
+            key   = _first_key(bucket, base, delimiter, s3_item=s3_item)
+            while key is not None and probes > 0:
+                probes -= 1
+                after   = key  # Only if the key is *base* itself.
+                if len(key) > len(base):
+                    found.append(f"{base}{key[len(base)]}")
+                    after = f"{found[-1]}{LAST_KEY_CHAR}"
+                key = _first_key(bucket, base, delimiter, after, s3_item)
+            if key is not None:
+                break  # Out of probes.
+            extended += found or [base]
+        else:
+            if extended == prefixes:
+                break  # No key extends beyond the current prefixes.
+            prefixes = extended
+        if (len(prefixes) >= shards) or (probes <= 0):
+            break
+    if len(prefixes) == 1:
+        return _split_bounds(prefixes[0], LIST_SHARD_ALPHABET, shards)
+    step   = len(prefixes) / shards
+    bounds = [prefixes[round(i * step)] for i in range(1, shards)]
+    return list(dict.fromkeys(bounds))
+
+
+def _split_bounds(prefix, chars, shards):
+    """
+    The keys on which to split the key space under *prefix* into ranges
+    starting with evenly spaced characters.
+
+    :param str           prefix:
+    :param Sequence[str] chars:     Characters following *prefix*, in order.
+    :param int           shards:    Most ranges.
+
+    :rtype: list[str]
+
+    """
+    step   = len(chars) / shards
+    bounds = [f"{prefix}{chars[round(i * step)]}" for i in range(1, shards)]
+    return list(dict.fromkeys(bounds))
+
+
+def _first_key(
+        bucket,
+        prefix,
+        delimiter=None,
+        start_after=None,
+        s3_item=None) -> Optional[str]:
+    """
+    The first key listed (skipping keys grouped by *delimiter*).
+
+    :param str|s3.Bucket bucket:        Bucket name or instance.
+    :param str           prefix:
+    :param str|None      delimiter:
+    :param str|None      start_after:
+    :param s3.Client     s3_item:
+
+    """
+    s3_cli = s3_client(s3_item or bucket)
+    params = {
+        'Bucket':  bucket if isinstance(bucket, str) else bucket.name,
+        'Prefix':  prefix,
+        'MaxKeys': 1,
+    }
+    if delimiter:
+        params['Delimiter'] = delimiter
+    while True:
+        if start_after:
+            params['StartAfter'] = start_after
+        response = s3_cli.list_objects_v2(**params)
+        contents = response.get('Contents')
+        if contents:
+            return contents[0]['Key']
+        grouped = response.get('CommonPrefixes')
+        if not grouped:
+            return None
+        start_after = f"{grouped[0]['Prefix']}{LAST_KEY_CHAR}"
+
+
 def s3_object_count(obj, bucket=None, s3_item=None) -> int:
     """
     The number of matching objects in the bucket.
@@ -297,6 +728,6 @@ def s3_object_rename(obj, new_key, bucket=None, s3_item=None):
         new_obj.copy_from(CopySource={'Bucket': bucket.name, 'Key': obj_key})
         obj.delete()
         result = new_obj
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         DEBUG and show(f'\tERROR: {error} (obj_key = "{obj_key}")')
     return result
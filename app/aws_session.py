@@ -0,0 +1,142 @@
+# app/aws_session.py
+#
+# Process-wide AWS clients and resources.
+#
+# Creating a boto3 client or resource resolves credentials, loads the service
+# model and starts a new connection pool, so each is created once per service
+# and region and shared by every thread.  (boto3 clients are thread-safe;
+# creating them from a shared session is not, which is why creation is done
+# under a lock.)
+
+
+from __future__ import annotations
+
+import threading
+import weakref
+
+from typing import TYPE_CHECKING, FrozenSet
+
+from app.common import *
+
+if TYPE_CHECKING:
+    import boto3.session
+
+boto3           = lazy_module('boto3')
+botocore_config = lazy_module('botocore.config')
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# The session from which all clients and resources are created.
+_session = None  # type: Optional[boto3.session.Session]
+
+# Pool size and instance for each (kind, service, region).
+_instances: Dict[Tuple[str, str, Optional[str]], Tuple[int, object]] = {}
+_instance_lock = threading.Lock()
+
+# The attribute names of each class of boto3 object that has been examined.
+_attributes = weakref.WeakKeyDictionary()
+_attribute_lock = threading.Lock()
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def aws_client(service, region=None, connections=None):
+    """
+    The shared client for an AWS service.
+
+    :param str      service:        E.g. 's3', 'sqs', 'lambda'.
+    :param str|None region:         Default: the configured region.
+    :param int|None connections:    Concurrent threads the client must
+                                        support; the shared client is replaced
+                                        by one with a larger pool if needed.
+
+    """
+    return _instance('client', service, region, connections)
+
+
+def aws_resource(service, region=None, connections=None):
+    """
+    The shared service resource for an AWS service.
+
+    :param str      service:        E.g. 's3', 'sqs'.
+    :param str|None region:         Default: the configured region.
+    :param int|None connections:    See aws_client().
+
+    """
+    return _instance('resource', service, region, connections)
+
+
+def aws_attributes(item) -> FrozenSet[str]:
+    """
+    The attribute names of the class of a boto3 object.
+
+    boto3 generates its client and resource classes at run time, so they are
+    distinguished by the operations and collections they provide.  The names
+    are determined once per class rather than with dir() on each call.
+
+    :param object item:
+
+    """
+    cls = type(item)
+    try:
+        return _attributes[cls]
+    except (KeyError, TypeError):
+        pass
+    names = frozenset(dir(cls))
+    with _attribute_lock:
+        try:
+            _attributes[cls] = names
+        except TypeError:  # Not weakly referenceable.
+            pass
+    return names
+
+
+def reset_aws_session():
+    """
+    Discard the shared session, clients and resources so that new ones are
+    created on next use (e.g. after credentials or the region have changed).
+    """
+    global _session
+    with _instance_lock:
+        _instances.clear()
+        _session = None
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _instance(kind, service, region, connections):
+    """
+    The shared client or resource, created if necessary.
+
+    :param str      kind:           'client' or 'resource'.
+    :param str      service:
+    :param str|None region:
+    :param int|None connections:
+
+    """
+    global _session
+    key  = (kind, service, region)
+    size = max((connections or 0), AWS_MAX_POOL_CONNECTIONS)
+    pool, instance = _instances.get(key, (0, None))
+    if pool >= size:
+        return instance
+    with _instance_lock:
+        pool, instance = _instances.get(key, (0, None))
+        if pool < size:
+            _session = _session or boto3.session.Session()
+            config   = botocore_config.Config(max_pool_connections=size)
+            factory  = getattr(_session, kind)
+            instance = factory(service, region_name=region, config=config)
+            _instances[key] = (size, instance)
+            AWS_DEBUG and show(f"AWS {service} {kind} POOL {size}")
+        return instance
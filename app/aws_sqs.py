@@ -3,12 +3,17 @@
 # AWS SQS interface definitions.
 
 
-import boto3
-import boto3_type_annotations.sqs as sqs
+from __future__ import annotations
 
-from botocore.exceptions import ClientError
+from typing import TYPE_CHECKING
 
-from app.common import *
+from app.common      import *
+from app.aws_session import *
+
+if TYPE_CHECKING:
+    import boto3_type_annotations.sqs as sqs
+
+botocore_exceptions = lazy_module('botocore.exceptions')
 
 
 # =============================================================================
@@ -18,6 +23,13 @@ from app.common import *
 
 DEF_QUEUE_DELAY = 0
 
+# Maximum messages per receive and per batch delete request.
+SQS_RECEIVE_LIMIT = 10
+SQS_DELETE_LIMIT  = 10
+
+# Maximum seconds that a receive request can wait for messages to arrive.
+SQS_MAX_WAIT = 20
+
 
 # =============================================================================
 # AWS SQS class instances
@@ -25,11 +37,11 @@ DEF_QUEUE_DELAY = 0
 
 
 def is_sqs_client(item) -> bool:
-    return 'list_queues' in dir(item)
+    return 'list_queues' in aws_attributes(item)
 
 
 def is_sqs_resource(item) -> bool:
-    return 'queues' in dir(item)
+    return 'queues' in aws_attributes(item)
 
 
 def sqs_client(item) -> sqs.Client:
@@ -38,14 +50,14 @@ def sqs_client(item) -> sqs.Client:
     elif is_sqs_resource(item):
         return item.meta.client
     else:
-        return boto3.client('sqs')
+        return aws_client('sqs')
 
 
 def sqs_resource(item) -> sqs.ServiceResource:
     if is_sqs_resource(item):
         return item
     else:
-        return boto3.resource('sqs')
+        return aws_resource('sqs')
 
 
 # =============================================================================
@@ -65,7 +77,7 @@ def get_sqs_queue(queue_name, sqs_res=None) -> Optional[sqs.Queue]:
     sqs_res = sqs_resource(sqs_res)
     try:
         queue = sqs_res.get_queue_by_name(QueueName=queue_name)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         log_error(error)
         queue = None
     return queue
@@ -85,7 +97,7 @@ def create_sqs_queue(queue_name, delay=DEF_QUEUE_DELAY, sqs_obj=None):
     attr    = {'DelaySeconds': str(delay)}
     try:
         queue = sqs_obj.create_queue(QueueName=queue_name, Attributes=attr)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         AWS_DEBUG and show(f'QUEUE ALREADY EXISTS? - %{error}')
         queue = get_sqs_queue(queue_name, sqs_obj)
     if queue and AWS_DEBUG:
@@ -101,9 +113,101 @@ def delete_sqs_queue(queue_name, sqs_obj=None):
     """
     try:
         queue = get_sqs_queue(queue_name, sqs_obj)
-    except ClientError as error:
+    except botocore_exceptions.ClientError as error:
         AWS_DEBUG and show(f'\tERROR: {error}')
         queue = None
     if queue:
         sqs_cli = sqs_client(sqs_obj)
         sqs_cli.delete_queue(QueueUrl=queue.url)
+
+
+# =============================================================================
+# AWS SQS messages
+# =============================================================================
+
+
+def sqs_queue_url(queue, sqs_obj=None) -> str:
+    """
+    :param str|sqs.Queue queue:     Queue instance, URL or name.
+    :param sqs.Client|sqs.ServiceResource sqs_obj:
+    """
+    if not isinstance(queue, str):
+        return queue.url
+    elif '://' in queue:
+        return queue
+    else:
+        sqs_cli = sqs_client(sqs_obj)
+        return sqs_cli.get_queue_url(QueueName=queue)['QueueUrl']
+
+
+def receive_sqs_messages(
+        queue,
+        count=SQS_RECEIVE_LIMIT,
+        wait=SQS_MAX_WAIT,
+        sqs_obj=None) -> List[dict]:
+    """
+    Receive up to *count* messages, waiting at most *wait* seconds for the
+    first to arrive (long polling).  Further requests are made only while
+    full batches are being returned.
+
+    :param str|sqs.Queue queue:     Queue instance or URL.
+    :param int           count:
+    :param int           wait:      Seconds (at most SQS_MAX_WAIT).
+    :param sqs.Client|sqs.ServiceResource sqs_obj:
+
+    :return: Message dicts (including 'Body' and 'ReceiptHandle').
+
+    """
+    sqs_cli  = sqs_client(sqs_obj)
+    url      = sqs_queue_url(queue, sqs_cli)
+    wait     = max(0, min(wait, SQS_MAX_WAIT))
+    messages = []
+    while len(messages) < count:
+        limit = min((count - len(messages)), SQS_RECEIVE_LIMIT)
+        response = sqs_cli.receive_message(
+            QueueUrl=url,
+            MaxNumberOfMessages=limit,
+            WaitTimeSeconds=(0 if messages else wait)
+        )
+        received = response.get('Messages', [])
+        messages.extend(received)
+        if len(received) < limit:
+            break
+    AWS_DEBUG and show(f"{len(messages)} SQS MESSAGES RECEIVED")
+    return messages
+
+
+def delete_sqs_messages(queue, receipts, sqs_obj=None) -> List[str]:
+    """
+    Delete messages, SQS_DELETE_LIMIT receipt handles per request.
+
+    :param str|sqs.Queue queue:     Queue instance or URL.
+    :param Iterable[str] receipts:  Receipt handles of received messages.
+    :param sqs.Client|sqs.ServiceResource sqs_obj:
+
+    :return: The receipt handles of messages which were not deleted.
+
+    """
+    sqs_cli  = sqs_client(sqs_obj)
+    url      = sqs_queue_url(queue, sqs_cli)
+    receipts = list(receipts)
+    failed   = []
+    for start in range(0, len(receipts), SQS_DELETE_LIMIT):
+        batch   = receipts[start:(start + SQS_DELETE_LIMIT)]
+        entries = [
+            {'Id': str(index), 'ReceiptHandle': receipt}
+            for index, receipt in enumerate(batch)
+        ]
+        try:
+            response = sqs_cli.delete_message_batch(
+                QueueUrl=url,
+                Entries=entries
+            )
+        except botocore_exceptions.ClientError as error:
+            log_error(error)
+            failed.extend(batch)
+            continue
+        for entry in response.get('Failed', []):
+            log_error(f"{url}: message not deleted: {entry.get('Message')}")
+            failed.append(batch[int(entry['Id'])])
+    return failed
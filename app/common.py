@@ -3,6 +3,7 @@
 # Common definitions.
 
 from typing import Union, Dict, List, Optional, ItemsView, KeysView, ValuesView, Set
+from typing import Iterable, Iterator, Tuple
 
 from app.util   import *
 from app.var    import *
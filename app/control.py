@@ -0,0 +1,167 @@
+# app/control.py
+#
+# Pause/resume control files in the EMMA storage buckets.
+
+
+import threading
+import time
+
+from enum import Enum, auto
+
+from app.aws_s3 import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+CONTROL_PREFIX      = 'control/'
+PAUSE_KEY_TEMPLATE  = 'control/paused-{repo}-{deployment}'
+RESUME_KEY_TEMPLATE = 'control/active-{repo}-{deployment}'
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Action(Enum):
+    Clear  = auto()
+    Pause  = auto()
+    Resume = auto()
+
+
+class ControlState:
+    """
+    A snapshot of the control files for each deployment, taken with a single
+    listing of the "control/" prefix of its EMMA storage bucket, from which
+    the pause state of every queue of that deployment is determined.
+
+    A snapshot is re-taken when it is more than *ttl* seconds old, so that a
+    long-running process notices changes made by others.  Changes made
+    through this instance are applied to the snapshot directly.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, ttl=CONTROL_TTL):
+        """
+        :param float ttl:   Seconds that a snapshot remains valid.
+        """
+        self.ttl    = ttl
+        self._lock  = threading.Lock()
+        self._keys  = {}  # type: Dict[str, Set[str]]
+        self._taken = {}  # type: Dict[str, float]
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def keys(self, deployment=None) -> Set[str]:
+        """
+        The control file object keys for the deployment.
+
+        :param str|None deployment: One of DEPLOYMENTS (def: DEF_DEPLOYMENT)
+
+        """
+        deployment = _deployment(deployment)
+        with self._lock:
+            taken = self._taken.get(deployment)
+            if taken is None or (time.monotonic() - taken) > self.ttl:
+                bucket = s3_bucket_name('emma', deployment)
+                found  = s3_list_objects(bucket, prefix=CONTROL_PREFIX)
+                self._keys[deployment]  = {entry['Key'] for entry in found}
+                self._taken[deployment] = time.monotonic()
+            return set(self._keys[deployment])
+
+    def is_paused(self, repo=None, deployment=None) -> bool:
+        """
+        Indicate whether the queue has a pause control file.
+
+        :param str|None repo:       Member repository (def: DEF_REPO).
+        :param str|None deployment: One of DEPLOYMENTS (def: DEF_DEPLOYMENT)
+
+        """
+        repo, deployment = _repo(repo), _deployment(deployment)
+        key = PAUSE_KEY_TEMPLATE.format(repo=repo, deployment=deployment)
+        return key in self.keys(deployment)
+
+    def invalidate(self, deployment=None):
+        """
+        Cause the next lookup to take a new snapshot.
+
+        :param str|None deployment: If None, all deployments.
+
+        """
+        with self._lock:
+            if deployment is None:
+                self._taken.clear()
+            else:
+                self._taken.pop(_deployment(deployment), None)
+
+    def run(self, action, queues):
+        """
+        Apply an action to several queues with as few requests as possible:
+        the control files which are no longer wanted are removed with a
+        single request per deployment.
+
+        Pausing creates a pause file for each queue which is not paused;
+        resuming replaces the pause file of each paused queue with a resume
+        file; clearing removes both files for all of the queues.
+
+        :param Action          action:
+        :param Iterable[tuple] queues:  Pairs of repo and deployment.
+
+        """
+        if not isinstance(action, Action):
+            raise ValueError(f"{action}: invalid action")
+        by_deployment = {}
+        for repo, deployment in queues:
+            deployment = _deployment(deployment)
+            by_deployment.setdefault(deployment, []).append(_repo(repo))
+        for deployment, repos in by_deployment.items():
+            bucket   = s3_bucket_name('emma', deployment)
+            existing = self.keys(deployment)
+            created  = []
+            removed  = []
+            for repo in repos:
+                names  = {'repo': repo, 'deployment': deployment}
+                pause  = PAUSE_KEY_TEMPLATE.format(**names)
+                resume = RESUME_KEY_TEMPLATE.format(**names)
+                if action == Action.Pause and pause not in existing:
+                    created.append(pause)
+                    removed.append(resume)
+                elif action == Action.Resume and pause in existing:
+                    created.append(resume)
+                    removed.append(pause)
+                elif action == Action.Clear:
+                    removed.extend([pause, resume])
+            for key in list(created):
+                DEBUG and show(f"CREATING {key}")
+                empty = '/dev/null'
+                if not upload_to_s3_bucket(empty, bucket, object_key=key):
+                    created.remove(key)
+            failed = {}
+            if removed:
+                failed = remove_from_s3_bucket(removed, bucket)
+            with self._lock:
+                keys = self._keys.setdefault(deployment, set())
+                keys.update(created)
+                keys.difference_update(k for k in removed if k not in failed)
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _repo(repo) -> str:
+    return str(repo).casefold() if repo else DEF_REPO
+
+
+def _deployment(deployment) -> str:
+    return str(deployment).casefold() if deployment else DEF_DEPLOYMENT
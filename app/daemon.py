@@ -0,0 +1,118 @@
+# app/daemon.py
+#
+# Long-running operation with adaptive polling.
+
+
+import signal
+import threading
+
+from app.common import *
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# Set when the process has been asked to terminate.
+_shutdown = threading.Event()
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def shutdown_requested() -> bool:
+    """
+    Indicate whether the process has been asked to terminate, in which case
+    no new work should be started.
+    """
+    return _shutdown.is_set()
+
+
+def request_shutdown(signum=None, _frame=None):
+    """
+    Ask for work to wind down; usable as a signal handler.
+
+    :param int|None signum:
+
+    """
+    if signum is not None:
+        name = signal.Signals(signum).name
+        show(f"*** {name} RECEIVED - FINISHING CURRENT WORK ***")
+    _shutdown.set()
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Daemon:
+    """
+    Runs a task repeatedly until the process is asked to terminate.
+
+    The delay between runs adapts to the work found:  after a run which found
+    work, the next run follows after *minimum* seconds; each run which found
+    nothing multiplies the delay by *factor*, up to *maximum* seconds.
+
+    On SIGTERM or SIGINT no new run is started and the task can check
+    shutdown_requested() to avoid starting new work, so that work in progress
+    (e.g. an upload to IA) is allowed to complete.  (For ECS, the task
+    definition's stopTimeout should allow for the longest expected upload.)
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(
+            self,
+            task,
+            minimum=POLL_MIN_INTERVAL,
+            maximum=POLL_MAX_INTERVAL,
+            factor=POLL_BACKOFF):
+        """
+        :param Callable task:       Called with no arguments; returns the
+                                        amount of work done.
+        :param float    minimum:    Shortest delay between runs (seconds).
+        :param float    maximum:    Longest delay between runs (seconds).
+        :param float    factor:     Delay multiplier when no work was found.
+        """
+        self.task     = task
+        self.minimum  = max(0, minimum)
+        self.maximum  = max(self.minimum, maximum)
+        self.factor   = max(1, factor)
+        self.interval = self.minimum
+
+    def run(self):
+        """
+        Run the task until shutdown is requested.
+        """
+        signal.signal(signal.SIGTERM, request_shutdown)
+        signal.signal(signal.SIGINT,  request_shutdown)
+        DEBUG and show("*** DAEMON STARTED ***")
+        while not shutdown_requested():
+            try:
+                work = self.task()
+            except Exception as error:
+                log_error(f"daemon task: {error}")
+                work = 0
+            self.interval = self.next_interval(work)
+            if not shutdown_requested():
+                DEBUG and show(f"*** NEXT POLL IN {self.interval} SECONDS ***")
+                _shutdown.wait(self.interval)
+        DEBUG and show("*** DAEMON STOPPED ***")
+
+    def next_interval(self, work) -> float:
+        """
+        The delay before the next run, given the result of the last run.
+
+        :param int work:    Amount of work done by the last run.
+
+        """
+        if work:
+            return self.minimum
+        return min((max(self.interval, 1) * self.factor), self.maximum)
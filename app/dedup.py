@@ -0,0 +1,142 @@
+# app/dedup.py
+#
+# Record of the content of data files uploaded to IA.
+
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Bytes per read when computing the digest of a local file.
+DIGEST_READ_SIZE = 1 << 20
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def file_digest(path) -> str:
+    """
+    The SHA-256 digest of the contents of a local file.
+
+    :param str path:
+
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(DIGEST_READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class DigestStore:
+    """
+    An on-disk (SQLite) record of the data files uploaded to each IA item,
+    identified by content rather than by name.
+
+    The object key of a data file is based on its submission ID, so the same
+    file submitted again (e.g. to correct its metadata) has a new name.  Its
+    content can be recognized from the S3 ETag, which AWS provides without
+    reading the object, or from its SHA-256 digest (computed here), which
+    does not depend on how the object was uploaded to AWS.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, path=DEDUP_PATH):
+        """
+        :param str path:    Location of the SQLite database file.
+        """
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS digests ('
+            '  ia_id    TEXT    NOT NULL,'
+            '  name     TEXT    NOT NULL,'
+            '  etag     TEXT,'
+            '  size     INTEGER NOT NULL,'
+            '  sha256   TEXT,'
+            '  uploaded REAL    NOT NULL,'
+            '  PRIMARY KEY (ia_id, name)'
+            ')'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS digests_content'
+            ' ON digests (ia_id, size)'
+        )
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def find(self, ia_id, size, etag=None, sha256=None) -> Optional[str]:
+        """
+        The name of a file already uploaded to the IA item with the same
+        content, matched by ETag or by SHA-256 digest.
+
+        :param str      ia_id:
+        :param int      size:   Content length.
+        :param str|None etag:   S3 ETag.
+        :param str|None sha256: Hex digest.
+
+        """
+        if not etag and not sha256:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT name FROM digests'
+                ' WHERE ia_id = ? AND size = ? AND (etag = ? OR sha256 = ?)'
+                ' ORDER BY uploaded DESC LIMIT 1',
+                (ia_id, size, etag, sha256)
+            ).fetchone()
+        return row and row[0]
+
+    def record(self, ia_id, name, size, etag=None, sha256=None):
+        """
+        Note that a data file has been uploaded to an IA item.
+
+        :param str      ia_id:
+        :param str      name:   The name of the file on IA.
+        :param int      size:   Content length.
+        :param str|None etag:   S3 ETag.
+        :param str|None sha256: Hex digest.
+
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO digests'
+                ' (ia_id, name, etag, size, sha256, uploaded)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (ia_id, name, etag, size, sha256, time.time())
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -6,9 +6,12 @@
 import re
 import io
 
-import xml.etree.ElementTree as Xml
+from functools import partial
 
 from app.common import *
+from app.ia     import *
+
+Xml = lazy_module('xml.etree.ElementTree')
 
 
 # =============================================================================
@@ -85,6 +88,33 @@ IDENTIFIER_MAP = {
     'lccn': 'lccn'
 }
 
+# Element text values which are taken as booleans.
+BOOLEAN_TEXT = {'true': True, 'false': False}
+
+# Bytes per read when parsing a package from a stream.
+SIP_READ_SIZE = 64 << 10
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class MetadataError(ValueError):
+    """
+    EMMA metadata which cannot be translated into IA metadata.
+    """
+    pass
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# Metadata field name for each distinct element tag.
+_fields: Dict[str, str] = {}
+
 
 # =============================================================================
 # Functions
@@ -97,28 +127,61 @@ def ia_metadata(emma_metadata):
 
     :param dict[str, str|bool|list[str]] emma_metadata: Metadata from the SIP.
 
+    :raises MetadataError:  If a value cannot be translated.
+
     :return: Metadata for use with IA API functions.
     :rtype:  dict[str, str|bool|list[str]]
 
     """
-    # noinspection PyTypeChecker
-    result = ia_identifier_metadata(emma_metadata.get('dc_identifier'))
-    for field, entry in EMMA_FIELD_MAP.items():
-        if field in emma_metadata:
-            ia_field = entry
-            ia_value = emma_metadata[field]
-            if isinstance(entry, dict):
-                ia_field = entry['field']
-                if 'map' in entry:
-                    ia_value = entry['map'][ia_value]
-                elif 'transform' in entry:
-                    ia_value = entry['transform'](ia_value)
-            if is_present(ia_value):
-                result[ia_field] = ia_value
+    result = {}
+    _translate(emma_metadata, result, result)
     EMMA_DEBUG and show(result, width=PP_WIDE)
     return result
 
 
+def ia_metadata_parts(emma_metadata):
+    """
+    Translate EMMA metadata into IA metadata already separated into
+    title-level and file-level metadata (as by ia_partition_metadata()).
+
+    :param dict[str, str|bool|list[str]] emma_metadata: Metadata from the SIP.
+
+    :raises MetadataError:  If a value cannot be translated.
+
+    :return: Title-level metadata then file-level metadata.
+    :rtype:  list[dict,dict]
+
+    """
+    title_metadata = {}
+    file_metadata  = {}
+    _translate(emma_metadata, title_metadata, file_metadata)
+    return [title_metadata, file_metadata]
+
+
+def ia_metadata_batch(records, partition=False):
+    """
+    Translate the EMMA metadata of several submissions, continuing past any
+    which cannot be translated.
+
+    :param Iterable[dict] records:      Metadata from each SIP.
+    :param bool           partition:    If True, each result is separated as
+                                            by ia_metadata_parts().
+
+    :return: For each record in order, its IA metadata or the MetadataError
+                which prevented its translation.
+    :rtype:  list[dict|list[dict,dict]|MetadataError]
+
+    """
+    translate = ia_metadata_parts if partition else ia_metadata
+    result    = []
+    for record in records:
+        try:
+            result.append(translate(record))
+        except MetadataError as error:
+            result.append(error)
+    return result
+
+
 def ia_identifier_metadata(dc_identifier):
     """
     Translate one or more EMMA standard identifier values into the equivalent
@@ -144,7 +207,7 @@ def ia_identifier_metadata(dc_identifier):
 
 
 # =============================================================================
-# Functions
+# SIP parsing
 # =============================================================================
 
 
@@ -152,25 +215,53 @@ def sip_parse(source):
     """
     Parse EMMA Submission Information Package XML into metadata values.
 
-    :param str|io.BytesIO|io.StringIO source: object
+    The XML is parsed incrementally as it is read and each element is
+    discarded as soon as its value has been taken, so the document is never
+    held as a whole tree (nor, for a BytesIO, copied).
+
+    :param str|bytes|memoryview|IO source: The XML, or a binary or text
+                                                stream (e.g. an S3 object
+                                                body) from which it is read.
 
     :rtype: dict
 
     """
     result = {}
-    text = source if isinstance(source, str) else source.getvalue()
-    root = Xml.fromstring(text)
-    for child in root:
-        name = child.tag
-        # attr = child.attrib
-        field = re.sub(r'{[^}\n]+}', '', name)  # Remove namespace prefix.
-        value = sip_node_value(child)
-        if EMMA_DEBUG:
-            v = f'"{value}"'   if isinstance(value, str) else value
-            v = f"{v} [blank]" if is_blank(value) else v
-            show(f'name = "{field}" | value = {v}')
-        if is_present(value):
-            result[field] = value
+    parser = Xml.XMLPullParser(events=('start', 'end'))
+    root   = None
+    stack  = []  # Child values for each open element (None if no children).
+    for chunk in _sip_chunks(source):
+        parser.feed(chunk)
+        for event, node in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = node
+                    continue
+                if stack and stack[-1] is None:
+                    stack[-1] = []
+                stack.append(None)
+                continue
+            if node is root:
+                continue
+            value = stack.pop()
+            if value is None:
+                value = node.text
+                if isinstance(value, str):
+                    value = BOOLEAN_TEXT.get(value.casefold(), value)
+            present = (value is False) or bool(value)  # I.e. is_present().
+            if stack:
+                present and stack[-1].append(value)
+            else:
+                field = _sip_field(node.tag)
+                if EMMA_DEBUG:
+                    v = f'"{value}"'   if isinstance(value, str) else value
+                    v = f"{v} [blank]" if not present else v
+                    show(f'name = "{field}" | value = {v}')
+                if present:
+                    result[field] = value
+                root.remove(node)
+            node.clear()
+    parser.close()
     return result
 
 
@@ -197,6 +288,131 @@ def sip_node_value(node):
         return True if value == 'true' else False if value == 'false' else text
 
 
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _sip_field(tag) -> str:
+    """
+    The metadata field name for an element tag (without any namespace).
+
+    :param str tag:
+
+    """
+    field = _fields.get(tag)
+    if field is None:
+        field = _fields[tag] = re.sub(r'{[^}\n]+}', '', tag)
+    return field
+
+
+def _sip_chunks(source):
+    """
+    Generate the contents of a package source in pieces for parsing.
+
+    :param str|bytes|memoryview|IO source:
+
+    :rtype: Iterator[str|bytes|memoryview]
+
+    """
+    if isinstance(source, (str, bytes, bytearray, memoryview)):
+        yield source
+    elif isinstance(source, io.BytesIO):
+        with source.getbuffer() as view:
+            yield view
+    elif isinstance(source, io.StringIO):
+        yield source.getvalue()
+    else:
+        chunk = source.read(SIP_READ_SIZE)
+        while chunk:
+            yield chunk
+            chunk = source.read(SIP_READ_SIZE)
+
+
+def _translate(emma_metadata, title_metadata, file_metadata):
+    """
+    Add the IA equivalents of EMMA metadata to title-level or file-level
+    metadata (which may be the same dict).
+
+    :param dict emma_metadata:
+    :param dict title_metadata:
+    :param dict file_metadata:
+
+    """
+    # noinspection PyTypeChecker
+    dc_identifier = emma_metadata.get('dc_identifier')
+    for ia_field, ia_value in ia_identifier_metadata(dc_identifier).items():
+        if ia_field in IA_TITLE_METADATA_FIELDS:
+            title_metadata[ia_field] = ia_value
+        else:
+            file_metadata[ia_field]  = ia_value
+    for field, ia_field, translate, title in EMMA_FIELD_TRANSLATORS:
+        ia_value = emma_metadata.get(field, _ABSENT)
+        if ia_value is _ABSENT:
+            continue
+        if translate:
+            ia_value = translate(ia_value)
+        if is_present(ia_value):
+            if title:
+                title_metadata[ia_field] = ia_value
+            else:
+                file_metadata[ia_field]  = ia_value
+
+
+def _map_value(field, table, value):
+    """
+    Translate a value through the value map of an EMMA field.
+
+    :param str  field:
+    :param dict table:
+    :param str  value:
+
+    :raises MetadataError:  If the value is not mapped.
+
+    """
+    try:
+        return table[value]
+    except (KeyError, TypeError):
+        expected = ', '.join(table)
+        raise MetadataError(f'{field} "{value}" not one of: {expected}')
+
+
+def _compile_field_map(field_map) -> Tuple[tuple, ...]:
+    """
+    Reduce a field map (see EMMA_FIELD_MAP) to a sequence of its entries as
+    EMMA field, IA field, translation function (None if the value is used
+    as-is) and whether the IA field is title-level.
+
+    :param dict field_map:
+
+    """
+    result = []
+    for field, entry in field_map.items():
+        ia_field  = entry
+        translate = None
+        if isinstance(entry, dict):
+            ia_field = entry['field']
+            if 'map' in entry:
+                translate = partial(_map_value, field, entry['map'])
+            elif 'transform' in entry:
+                translate = entry['transform']
+        title = ia_field in IA_TITLE_METADATA_FIELDS
+        result.append((field, ia_field, translate, title))
+    return tuple(result)
+
+
+# =============================================================================
+# Compiled field map
+# =============================================================================
+
+
+# Marks a field which is not present in the EMMA metadata.
+_ABSENT = object()
+
+# EMMA_FIELD_MAP in the form used for translation.
+EMMA_FIELD_TRANSLATORS = _compile_field_map(EMMA_FIELD_MAP)
+
+
 # =============================================================================
 # Command-line tests.
 # =============================================================================
@@ -0,0 +1,256 @@
+# app/handler.py
+#
+# AWS Lambda entry point.
+#
+# Configure the function handler as "app.handler.lambda_handler".  The
+# function may be triggered by S3 event notifications (directly or through
+# SQS) or by a scheduled EventBridge rule.
+#
+# Everything at module level (bucket instances, IA sessions, pause state,
+# the queues table below) is created on a cold start and re-used by every warm
+# invocation of the same container.
+#
+# To run locally with a fake event:
+#
+#   pipenv run python -m app.handler [scheduled|s3|sqs|EVENT_JSON_FILE]
+
+
+import json
+
+from app.process import *
+from app.process import _queue_name, _submission_count
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+LAMBDA_SCHEDULED_SOURCE = 'aws.events'
+LAMBDA_SQS_SOURCE       = 'aws:sqs'
+
+SAMPLE_BUCKET = s3_bucket_name(DEF_REPO, 'staging')
+SAMPLE_S3_RECORD = {
+    'eventSource': 'aws:s3',
+    'eventName':   'ObjectCreated:Put',
+    's3': {
+        'bucket': {'name': SAMPLE_BUCKET},
+        'object': {'key': 'sample.xml'},
+    },
+}
+
+# Fake events for running the handler locally.
+SAMPLE_EVENTS = {
+    'scheduled': {
+        'source':      LAMBDA_SCHEDULED_SOURCE,
+        'detail-type': 'Scheduled Event',
+        'detail':      {'deployments': ['staging']},
+    },
+    's3': {
+        'Records': [SAMPLE_S3_RECORD],
+    },
+    'sqs': {
+        'Records': [{
+            'eventSource': LAMBDA_SQS_SOURCE,
+            'messageId':   'sample-message',
+            'body':        json.dumps({'Records': [SAMPLE_S3_RECORD]}),
+        }],
+    },
+}
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# The repository and deployment for each AWS bucket name.
+_queues: Dict[str, Tuple[str, str]] = {
+    s3_bucket_name(repo, deployment): (repo, deployment)
+    for repo in TARGET_REPOS
+    for deployment in DEPLOYMENTS
+}
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def lambda_handler(event, context=None) -> dict:
+    """
+    Process the submissions referenced by an S3 event, or all queues for a
+    scheduled event.
+
+    For events delivered through SQS, the IDs of messages mentioning any
+    submission which was not completed are returned as "batchItemFailures"
+    so that (if the event source mapping reports batch item failures) only
+    those messages are delivered again.  S3 events delivered directly can
+    only be retried as a whole, so if any of their submissions was not
+    completed an exception is raised instead.
+
+    :param dict        event:
+    :param object|None context:     Lambda context (unused).
+
+    :raises RuntimeError:   If a submission of a direct S3 event was not
+                                removed from its AWS bucket.
+
+    :return: The number of submissions processed and any failed messages.
+    :rtype:  dict
+
+    """
+    if event.get('source') == LAMBDA_SCHEDULED_SOURCE:
+        detail = event.get('detail') or {}
+        repos  = to_list(detail.get('repos'))
+        deploy = to_list(detail.get('deployments'))
+        return {'processed': process_queues(repos, deploy)}
+
+    total    = 0
+    failures = set()
+    retry    = []
+    for bucket, sids in _event_submissions(event).items():
+        repo, deployment = _queues[bucket]
+        queue = _queue_name(repo, deployment)
+        if is_paused(repo, deployment):
+            show(f"*** PAUSED *** - {queue}")
+            for sid in sids:
+                _failed(sid, sids, failures, retry)
+            continue
+        table   = SipTable()
+        removed = []
+        with collecting(Repo=repo, Deployment=deployment):
+            try:
+                s3_bucket = get_repo_bucket(bucket=bucket)
+                table     = find_submissions(s3_bucket, sids)
+                removed   = process_found(table, s3_bucket)
+                pending   = [sid for sid in table if not table[sid].removed]
+            except Exception as error:
+                log_error(f"{queue}: {error}")
+                pending = [sid for sid in sids if not _removed(sid, table)]
+        for sid in pending:
+            _failed(sid, sids, failures, retry)
+        count       = _submission_count(removed)
+        submissions = pluralize('SUBMISSION', count)
+        show(f"{count} {submissions} PROCESSED - {queue}")
+        total      += count
+    if retry:
+        count = pluralize('SUBMISSION', len(retry))
+        raise RuntimeError(f"{len(retry)} {count} NOT PROCESSED: {retry}")
+    return {
+        'processed':         total,
+        'batchItemFailures': [{'itemIdentifier': i} for i in sorted(failures)],
+    }
+
+
+def find_submissions(s3_bucket, sids) -> SipTable:
+    """
+    The complete submissions among the given submission IDs.
+
+    A submission ID is omitted if only one of its objects has arrived; the
+    event for the other will cause it to be processed.
+
+    :param s3.Bucket     s3_bucket:
+    :param Iterable[str] sids:
+
+    """
+    table = SipTable()
+    for sid in sids:
+        submission = Sip(sid=sid)
+        for entry in s3_list_objects(s3_bucket, prefix=f"{sid}."):
+            key = entry['Key']
+            found, part = sip_part(key)
+            if found == sid and '/' not in key:
+                submission[part] = key
+        if len(submission) == 2:
+            table[sid] = submission
+        else:
+            DEBUG and show(f'"{sid}": INCOMPLETE SUBMISSION')
+    return table
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _removed(sid, table) -> bool:
+    """
+    Indicate whether a submission was removed from its AWS bucket.
+
+    :param str      sid:
+    :param SipTable table:
+
+    """
+    submission = table.get(sid)
+    return bool(submission and submission.removed)
+
+
+def _failed(sid, sids, failures, retry):
+    """
+    Note a submission which was not removed from its AWS bucket so that its
+    event is delivered again.
+
+    :param str                sid:
+    :param dict[str,set[str]] sids:         SQS message IDs per submission.
+    :param set[str]           failures:     SQS message IDs to be re-sent.
+    :param list[str]          retry:        Submissions of direct S3 events.
+
+    """
+    if sids[sid]:
+        failures.update(sids[sid])
+    else:
+        retry.append(sid)
+
+
+def _event_submissions(event) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    The submission IDs referenced by an S3 event (or by the S3 events in the
+    SQS messages of an event) for each bucket being processed, with the IDs
+    of the SQS messages that mention each.
+
+    :param dict event:
+
+    """
+    result = {}
+    for record in event.get('Records') or []:
+        message = None
+        body    = {'Records': [record]}
+        if record.get('eventSource') == LAMBDA_SQS_SOURCE:
+            message = record.get('messageId')
+            body    = record.get('body') or '{}'
+        try:
+            objects = s3_event_objects(body)
+        except ValueError as error:
+            log_error(f"message {message}: {error}")
+            continue
+        for bucket, key in objects:
+            if bucket not in _queues:
+                log_error(f"{bucket}: not a processed bucket")
+            elif '/' not in key:
+                sid, _ = sip_part(key)
+                ids    = result.setdefault(bucket, {}).setdefault(sid, set())
+                message and ids.add(message)
+    return result
+
+
+# =============================================================================
+# Local execution
+# =============================================================================
+
+
+def main():
+    """
+    Invoke the handler with the named sample event or the event in the given
+    JSON file.
+    """
+    name = sys.argv[1] if len(sys.argv) > 1 else 'scheduled'
+    if name in SAMPLE_EVENTS:
+        event = SAMPLE_EVENTS[name]
+    else:
+        with open(name) as file:
+            event = json.load(file)
+    show(lambda_handler(event))
+
+
+if __name__ == '__main__':
+    main()
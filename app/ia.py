@@ -3,14 +3,22 @@
 # Internet Archive interface definitions.
 
 
-import internetarchive
+from __future__ import annotations
+
 import tempfile
 
-from internetarchive import ArchiveSession
-from internetarchive import Item
-from requests        import Response, PreparedRequest
+from typing import TYPE_CHECKING
+
+from app.common    import *
+from app.ratelimit import *
+from app.retry     import *
 
-from app.common import *
+if TYPE_CHECKING:
+    from internetarchive import ArchiveSession
+    from internetarchive import Item
+    from requests        import Response, PreparedRequest
+
+internetarchive = lazy_module('internetarchive')
 
 
 # =============================================================================
@@ -157,6 +165,26 @@ IA_METADATA_FIELDS = [
 # metadata.
 IA_FILE_METADATA_FIELDS = to_tuple('contributor')
 
+# IA metadata fields that are treated as title-level metadata.
+IA_TITLE_METADATA_FIELDS = frozenset(IA_METADATA_FIELDS).difference(
+    IA_FILE_METADATA_FIELDS
+)
+
+# Most search results fetched by a single request.
+IA_SEARCH_PAGE_SIZE = 100
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# Shared by all threads so that repeated failures stop all IA requests.
+ia_breaker = CircuitBreaker('IA', IA_BREAKER_THRESHOLD, IA_BREAKER_RESET)
+
+# Shared by all threads so that together they stay within what IA allows.
+ia_limiter = RateLimiter('IA', IA_REQUEST_RATE, IA_BYTE_RATE)
+
 
 # =============================================================================
 # Functions
@@ -190,14 +218,18 @@ def ia_get_files(identifier, **kwargs):
     """
     if 'on_the_fly' not in kwargs:
         kwargs['on_the_fly'] = True
-    result = internetarchive.get_files(identifier, **kwargs)
-    return list(result)
+    return _ia_request(
+        lambda: list(internetarchive.get_files(identifier, **kwargs))
+    )
 
 
 def ia_search(terms, count=10, fields=None, session=None):
     """
     Search for items on Archive.org.
 
+    Results are fetched a page at a time, each page being a separate request
+    within the limits of ia_limiter.
+
     :param str            terms:    Search term(s).
     :param int            count:    Number of results to fetch.
     :param list           fields:   Fields to return (def: identifier, title)
@@ -208,15 +240,27 @@ def ia_search(terms, count=10, fields=None, session=None):
 
     """
     session = session or ia_get_session()
-    params  = {'rows': count, 'page': 1}
+    rows    = max(1, min(count, IA_SEARCH_PAGE_SIZE))
     fields  = to_list(fields, default=['identifier', 'title'])
+    result  = []
     try:
-        # noinspection PyTypeChecker
-        result = session.search_items(terms, params=params, fields=fields)
-        return list(result)
+        page = 1
+        while len(result) < count:
+            params = {'rows': rows, 'page': page}
+            # noinspection PyTypeChecker
+            found  = _ia_request(
+                lambda: list(
+                    session.search_items(terms, params=params, fields=fields)
+                )
+            )
+            result.extend(found)
+            if len(found) < rows:
+                break
+            page += 1
     except Exception as error:
         log_error(error)
         return []
+    return result[:count]
 
 
 def ia_upload_file(
@@ -268,34 +312,22 @@ def ia_upload_file(
     file_metadata.update(name=file)  # Needed for a dict argument to upload().
 
     try:
-        if isinstance(target, str):
-            session = session or ia_get_session()
-            item = session.get_item(target)
-        else:
-            item = target
-        result = item.upload(
+        item   = _ia_item(target, session)
+        result = _ia_request(
+            item.upload,
             file_metadata,          # NOTE: file_metadata['name'] is the file
             metadata=None,          # NOTE: must use modify_metadata() below
             queue_derive=False,
             verbose=True,
             delete=delete,
             checksum=checksum,
-            debug=dry_run
+            debug=dry_run,
+            size=os.path.getsize(file)
         )
-        success = is_present(result)
+        success = _upload_succeeded(result, show_results)
         cleanup = cleanup or not success
-        try:
-            for part in result:
-                show_results and _show_response(part)
-                if 'ok' in dir(part):
-                    success = success and part.ok
-        except TypeError:
-            success = False  # Ignore bug when Response.status_code == None
         if success and UPDATE_IA_TITLE_METADATA:
-            result = item.modify_metadata(title_metadata, debug=dry_run)
-            if show_results:
-                for part in result:
-                    _show_response(part)
+            _update_title_metadata(item, title_metadata, dry_run, show_results)
     except Exception as error:
         log_error(error)
         cleanup = cleanup or not success
@@ -306,6 +338,104 @@ def ia_upload_file(
     return success
 
 
+def ia_upload_stream(
+        target,
+        name,
+        stream,
+        metadata=None,
+        dry_run=False,
+        session=None):
+    """
+    Upload the contents of a stream as a file associated with the given
+    Internet Archive title entry, without staging it on local disk.
+
+    If the upload fails after the stream has been read from, it cannot be
+    retried from the same stream; the caller can determine this by checking
+    whether *stream* is still seekable.
+
+    :param str|Item        target:      IA title identifier or Item instance.
+    :param str             name:        The name of the file on IA.
+    :param ReadAheadStream stream:      Source of file contents.
+    :param dict            metadata:    A mix of title- and file-level metadata
+    :param bool            dry_run:     Don't actually send to IA.
+    :param ArchiveSession  session:     Used if *target* is an identifier.
+
+    :return: Success.
+    :rtype:  bool
+
+    """
+    success      = False
+    show_results = dry_run or (IA_DEBUG and not APPLICATION_DEPLOYED)
+
+    # Associate non-title-level metadata with the file.
+    [title_metadata, file_metadata] = ia_partition_metadata(metadata)
+
+    try:
+        item   = _ia_item(target, session)
+        result = _ia_request(
+            item.upload_file,
+            stream,
+            key=name,
+            metadata=None,          # NOTE: must use modify_metadata() below
+            file_metadata=file_metadata,
+            queue_derive=False,
+            verbose=True,
+            delete=False,
+            checksum=False,         # NOTE: see ia_upload_file() Note [1]
+            debug=dry_run,
+            size=stream.size,
+            retryable=lambda error: stream.seekable() and is_retryable(error)
+        )
+        success = _upload_succeeded([result], show_results)
+        if success and UPDATE_IA_TITLE_METADATA:
+            _update_title_metadata(item, title_metadata, dry_run, show_results)
+    except Exception as error:
+        log_error(error)
+        success = False
+    return success
+
+
+def ia_update_file_metadata(
+        target,
+        name,
+        metadata=None,
+        dry_run=False,
+        session=None):
+    """
+    Apply the file-level part of the metadata to a file which is already
+    associated with the given Internet Archive title entry.
+
+    :param str|Item       target:       IA title identifier or Item instance.
+    :param str            name:         The name of the file on IA.
+    :param dict           metadata:     A mix of title- and file-level metadata
+    :param bool           dry_run:      Don't actually send to IA.
+    :param ArchiveSession session:      Used if *target* is an identifier.
+
+    :return: Success.
+    :rtype:  bool
+
+    """
+    success      = False
+    show_results = dry_run or (IA_DEBUG and not APPLICATION_DEPLOYED)
+
+    # Only non-title-level metadata is associated with the file.
+    [_title_metadata, file_metadata] = ia_partition_metadata(metadata or {})
+
+    try:
+        item   = _ia_item(target, session)
+        result = _ia_request(
+            item.modify_metadata,
+            file_metadata,
+            target=f"files/{name}",
+            debug=dry_run
+        )
+        success = _upload_succeeded([result], show_results)
+    except Exception as error:
+        log_error(error)
+        success = False
+    return success
+
+
 def ia_partition_metadata(metadata):
     """
     Separate a mix of title-level and file-level metadata.
@@ -319,13 +449,90 @@ def ia_partition_metadata(metadata):
     title_metadata = {}
     file_metadata  = {}
     for k, v in metadata.items():
-        if k in IA_FILE_METADATA_FIELDS or k not in IA_METADATA_FIELDS:
-            file_metadata[k]  = v
-        else:
+        if k in IA_TITLE_METADATA_FIELDS:
             title_metadata[k] = v
+        else:
+            file_metadata[k]  = v
     return [title_metadata, file_metadata]
 
 
+def ia_available() -> bool:
+    """
+    Indicate whether requests to IA are being made, i.e. IA has not failed
+    repeatedly within the last IA_BREAKER_RESET seconds.
+    """
+    return not ia_breaker.is_open
+
+
+def _ia_item(target, session=None) -> Item:
+    """
+    :param str|Item       target:       IA title identifier or Item instance.
+    :param ArchiveSession session:      Used if *target* is an identifier.
+    """
+    if isinstance(target, str):
+        session = session or ia_get_session()
+        return _ia_request(session.get_item, target)
+    return target
+
+
+def _ia_request(func, *args, size=0, retryable=is_retryable, **kwargs):
+    """
+    Make a request to IA within the limits of ia_limiter, retrying temporary
+    failures unless ia_breaker is open.
+
+    Some internetarchive methods return a failed response rather than raising
+    an exception; those which are retryable are raised here.
+
+    :param Callable func:       Makes the request.
+    :param args:                Passed to *func*.
+    :param int      size:       Bytes sent by the request.
+    :param Callable retryable:  Classifies exceptions (see retry()).
+    :param kwargs:              Passed to *func*.
+
+    :return: The result of *func*.
+
+    """
+    def request():
+        result = ia_limiter.call(func, *args, size=size, **kwargs)
+        for response in (result if isinstance(result, list) else [result]):
+            if getattr(response, 'status_code', None) in RETRYABLE_STATUS:
+                response.raise_for_status()
+        return result
+    return retry(request, breaker=ia_breaker, retryable=retryable)
+
+
+def _upload_succeeded(result, show_results=False) -> bool:
+    """
+    Indicate whether all of the responses from an upload were successful.
+
+    :param list[Response|PreparedRequest] result:
+    :param bool                           show_results:
+
+    """
+    success = is_present(result)
+    try:
+        for part in result:
+            show_results and _show_response(part)
+            if 'ok' in dir(part):
+                success = success and part.ok
+    except TypeError:
+        success = False  # Ignore bug when Response.status_code == None
+    return success
+
+
+def _update_title_metadata(item, title_metadata, dry_run, show_results):
+    """
+    :param Item item:
+    :param dict title_metadata:
+    :param bool dry_run:
+    :param bool show_results:
+    """
+    result = item.modify_metadata(title_metadata, debug=dry_run)
+    if show_results:
+        for part in result:
+            _show_response(part)
+
+
 def _show_response(item, prefix=None):
     """
     :param Response|PreparedRequest item:
@@ -0,0 +1,234 @@
+# app/intake.py
+#
+# Discovery of new submissions from AWS S3 event notifications.
+
+
+import json
+
+from urllib.parse import unquote_plus
+
+from app.aws_sqs   import *
+from app.sip_table import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Prefix of the eventName of S3 notifications for new objects.
+S3_CREATED_EVENT = 'ObjectCreated:'
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def s3_event_objects(body) -> List[Tuple[str, str]]:
+    """
+    The bucket name and object key of each object created according to the
+    body of an S3 event notification message, whether delivered to SQS
+    directly or through SNS (or to Lambda as an event).
+
+    Other events (including the "s3:TestEvent" sent when notifications are
+    configured) yield nothing.
+
+    :param str|dict body:   Message body or decoded event.
+
+    :raises ValueError: If *body* is not JSON.
+
+    """
+    event = json.loads(body) if isinstance(body, (str, bytes)) else body
+    if 'Records' not in event and isinstance(event.get('Message'), str):
+        event = json.loads(event['Message'])
+    result = []
+    for record in event.get('Records') or []:
+        if not record.get('eventName', '').startswith(S3_CREATED_EVENT):
+            continue
+        s3_info = record.get('s3') or {}
+        bucket  = (s3_info.get('bucket') or {}).get('name')
+        key     = (s3_info.get('object') or {}).get('key')
+        if bucket and key:
+            result.append((bucket, unquote_plus(key)))
+    return result
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Intake:
+    """
+    Builds tables of new submissions from the S3 event notifications of the
+    AWS buckets as they arrive on an SQS queue, so that discovering work costs
+    a receive per few new objects rather than a listing of each bucket.
+
+    A submission is handed out by poll() only when events for both its package
+    and its data file have arrived; until then the half which has been seen is
+    held here.  Messages are only deleted from the queue when every submission
+    they mention has been acknowledged, so that work which is interrupted or
+    fails is delivered again when the message visibility timeout expires.  (A
+    redrive policy on the queue should limit how often that can happen.)
+
+    Usage:
+        intake = Intake(queue_url)
+        for bucket, table in intake.poll().items():
+            ...process table...
+            intake.acknowledge(bucket, done)
+            intake.release(bucket, not_done)
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(
+            self,
+            queue=INTAKE_QUEUE,
+            batch_size=INTAKE_BATCH_SIZE,
+            wait=INTAKE_WAIT,
+            sqs_obj=None):
+        """
+        :param str|sqs.Queue queue:         Queue instance, URL or name.
+        :param int           batch_size:    Maximum messages per poll.
+        :param int           wait:          Maximum seconds to wait for the
+                                                first message of a poll.
+        :param sqs.Client|sqs.ServiceResource sqs_obj:
+        """
+        self.sqs_cli    = sqs_client(sqs_obj)
+        self.queue_url  = sqs_queue_url(queue, self.sqs_cli)
+        self.batch_size = max(1, batch_size)
+        self.wait       = wait
+        self._pending   = {}  # type: Dict[str, SipTable]
+        self._messages  = {}  # type: Dict[str, dict]
+        self._refs      = {}  # type: Dict[Tuple[str, str], Set[str]]
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    @property
+    def pending(self) -> Dict[str, SipTable]:
+        """
+        Incomplete submissions (only one part seen) for each bucket.
+        """
+        return {bucket: table for bucket, table in self._pending.items()}
+
+    def poll(self, buckets=None) -> Dict[str, SipTable]:
+        """
+        Receive the next batch of event messages and return the submissions
+        which are now complete.
+
+        :param Iterable[str]|None buckets:  If given, events for objects in
+                                                other buckets are discarded.
+
+        :return: A table of new submissions for each bucket which has any.
+
+        """
+        buckets  = None if buckets is None else set(buckets)
+        messages = receive_sqs_messages(
+            self.queue_url,
+            count=self.batch_size,
+            wait=self.wait,
+            sqs_obj=self.sqs_cli
+        )
+        unused = []
+        for message in messages:
+            msg_id  = message['MessageId']
+            receipt = message['ReceiptHandle']
+            try:
+                objects = s3_event_objects(message['Body'])
+            except ValueError as error:
+                log_error(f"SQS message {msg_id}: {error}")
+                objects = []
+            refs = set()
+            for bucket, key in objects:
+                if buckets is not None and bucket not in buckets:
+                    continue
+                if '/' in key:
+                    continue  # E.g. "control/..." objects.
+                sid, part = sip_part(key)
+                table = self._pending.setdefault(bucket, SipTable())
+                if (bucket, sid) in self._refs and sid not in table:
+                    refs.add((bucket, sid))
+                    continue  # Redelivered while being processed.
+                table.add(sid)[part] = key
+                refs.add((bucket, sid))
+            if msg_id in self._messages:
+                self._messages[msg_id]['receipt'] = receipt  # Redelivered.
+                refs.update(self._messages[msg_id]['refs'])
+            if not refs:
+                unused.append(receipt)
+                continue
+            self._messages[msg_id] = {'receipt': receipt, 'refs': refs}
+            for ref in refs:
+                self._refs.setdefault(ref, set()).add(msg_id)
+        if unused:
+            delete_sqs_messages(self.queue_url, unused, self.sqs_cli)
+
+        result = {}
+        for bucket, table in self._pending.items():
+            for sid in [sid for sid, sip in table.items() if len(sip) == 2]:
+                result.setdefault(bucket, SipTable())[sid] = table[sid]
+                del table[sid]
+        for bucket in [bucket for bucket, t in self._pending.items() if not t]:
+            del self._pending[bucket]
+        if DEBUG and result:
+            show_header('SUBMISSIONS FROM S3 EVENTS:')
+            show(result)
+        return result
+
+    def acknowledge(self, bucket, sids):
+        """
+        Indicate that submissions have been dealt with; messages which refer
+        only to acknowledged submissions are deleted from the queue.
+
+        :param str           bucket:
+        :param Iterable[str] sids:
+
+        """
+        receipts = self._forget(bucket, sids)
+        if receipts:
+            delete_sqs_messages(self.queue_url, receipts, self.sqs_cli)
+
+    def release(self, bucket, sids):
+        """
+        Indicate that submissions were not dealt with; their messages are left
+        on the queue to be delivered again.
+
+        :param str           bucket:
+        :param Iterable[str] sids:
+
+        """
+        self._forget(bucket, sids, keep=True)
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _forget(self, bucket, sids, keep=False) -> List[str]:
+        """
+        Stop tracking submissions.
+
+        :param str           bucket:
+        :param Iterable[str] sids:
+        :param bool          keep:      If True, the messages referring to the
+                                            submissions must not be deleted.
+
+        :return: Receipt handles of messages which can be deleted because they
+                    no longer refer to any tracked submission.
+
+        """
+        receipts = []
+        for sid in sids:
+            for msg_id in self._refs.pop((bucket, sid), ()):
+                message = self._messages[msg_id]
+                message['refs'].discard((bucket, sid))
+                message['keep'] = keep or message.get('keep', False)
+                if not message['refs']:
+                    message['keep'] or receipts.append(message['receipt'])
+                    del self._messages[msg_id]
+        return receipts
@@ -0,0 +1,181 @@
+# app/journal.py
+#
+# Durable record of submission processing progress.
+
+
+import sqlite3
+import threading
+import time
+
+from enum import IntEnum, auto
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Seconds that removed submissions are remembered before being pruned.
+JOURNAL_RETENTION = 7 * 24 * 60 * 60
+
+# Seconds to wait for another queue's journal to finish writing.
+JOURNAL_LOCK_TIMEOUT = 30
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class State(IntEnum):
+    """
+    Processing milestones for a submission, in the order they are reached.
+    """
+    Listed     = auto()
+    Parsed     = auto()
+    Downloaded = auto()
+    Uploaded   = auto()
+    Deleted    = auto()
+
+
+class Journal:
+    """
+    An on-disk (SQLite) record of the processing state of each submission in
+    a queue, so that a run which was interrupted can be resumed without
+    repeating work; in particular, submissions which were uploaded to IA but
+    not yet removed from the AWS bucket are not uploaded again.
+
+    Most state transitions are buffered and written in a single transaction
+    when *batch_size* have accumulated or when one is recorded after
+    *interval* seconds have passed; if the process is killed those are lost
+    and the work they record is simply repeated.  The Uploaded state (which
+    prevents a second upload) is written as soon as it is recorded, and
+    callers recording Deleted for a batch of submissions flush() afterwards.
+    The state of a submission only ever advances.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(
+            self,
+            queue,
+            path=JOURNAL_PATH,
+            batch_size=JOURNAL_BATCH_SIZE,
+            interval=JOURNAL_FLUSH_INTERVAL):
+        """
+        :param str   queue:         Name of the queue (AWS bucket) tracked.
+        :param str   path:          Location of the SQLite database file.
+        :param int   batch_size:    Maximum number of buffered transitions.
+        :param float interval:      Maximum seconds between writes.
+        """
+        self.queue       = queue
+        self.path        = path
+        self.batch_size  = max(1, batch_size)
+        self.interval    = interval
+        self._lock       = threading.Lock()
+        self._pending    = []
+        self._last_flush = time.monotonic()
+        self._db         = sqlite3.connect(
+            path,
+            timeout=JOURNAL_LOCK_TIMEOUT,
+            check_same_thread=False
+        )
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS submissions ('
+            '  queue   TEXT    NOT NULL,'
+            '  sid     TEXT    NOT NULL,'
+            '  state   INTEGER NOT NULL,'
+            '  updated REAL    NOT NULL,'
+            '  PRIMARY KEY (queue, sid)'
+            ')'
+        )
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def states(self) -> Dict[str, State]:
+        """
+        The recorded state of every submission in the queue.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT sid, state FROM submissions WHERE queue = ?',
+                (self.queue,)
+            ).fetchall()
+        return {sid: State(state) for sid, state in rows}
+
+    def record(self, sid, state):
+        """
+        Note that a submission has reached the given state.
+
+        Reaching State.Uploaded is written immediately.
+
+        :param str   sid:
+        :param State state:
+
+        """
+        with self._lock:
+            self._pending.append((self.queue, sid, int(state), time.time()))
+            due = (state == State.Uploaded)
+            due = due or len(self._pending) >= self.batch_size
+            due = due or (time.monotonic() - self._last_flush) >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered state transitions.
+        """
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._last_flush    = time.monotonic()
+            if rows:
+                with self._db:
+                    self._db.executemany(
+                        'INSERT INTO submissions (queue, sid, state, updated)'
+                        ' VALUES (?, ?, ?, ?)'
+                        ' ON CONFLICT (queue, sid) DO UPDATE SET'
+                        '  state   = excluded.state,'
+                        '  updated = excluded.updated'
+                        ' WHERE excluded.state > submissions.state',
+                        rows
+                    )
+
+    def prune(self, age=JOURNAL_RETENTION):
+        """
+        Forget submissions which were removed from the queue long ago.
+
+        :param float age:   Seconds.
+
+        """
+        self.flush()
+        with self._lock, self._db:
+            self._db.execute(
+                'DELETE FROM submissions'
+                ' WHERE queue = ? AND state = ? AND updated < ?',
+                (self.queue, int(State.Deleted), (time.time() - age))
+            )
+
+    def close(self):
+        """
+        Write all buffered state transitions and close the database.
+        """
+        self.flush()
+        with self._lock:
+            self._db.close()
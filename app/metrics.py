@@ -0,0 +1,404 @@
+# app/metrics.py
+#
+# Timing and throughput metrics for the processing of a queue.
+#
+# Metrics are gathered within a collecting() block and, when it ends, written
+# to stdout in CloudWatch Embedded Metric Format (EMF) and (if METRICS_TEXTFILE
+# is given) to a Prometheus node-exporter textfile.
+
+
+import contextvars
+import json
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+SECONDS = 'Seconds'
+BYTES   = 'Bytes'
+COUNT   = 'Count'
+
+# Upper bounds of the Prometheus histogram buckets for durations in seconds.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# The most values that EMF allows for one metric in one log entry.
+EMF_VALUE_LIMIT = 100
+
+# Prefix for Prometheus metric names.
+PROMETHEUS_PREFIX = 'emma_ia_'
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# Metrics for the current task (e.g. the queue being processed).
+_current = contextvars.ContextVar('metrics', default=None)
+
+# Totals of all emitted metrics for the Prometheus textfile.
+_totals = None  # type: Optional[PrometheusTotals]
+_totals_lock = threading.Lock()
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Metrics:
+    """
+    Counters and distributions of values gathered during processing.
+
+    Counters (e.g. bytes transferred, errors) are sums; distributions (e.g.
+    stage durations, per-submission latencies) keep each observed value so
+    that CloudWatch can compute percentiles.  All methods are thread-safe.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, **dimensions):
+        """
+        :param dimensions:  Names and values identifying the source, e.g.
+                                Repo and Deployment.
+        """
+        self.dimensions = {k: str(v) for k, v in dimensions.items()}
+        self._lock      = threading.Lock()
+        self._units     = {}  # type: Dict[str, str]
+        self._counters  = {}  # type: Dict[str, float]
+        self._values    = {}  # type: Dict[str, List[float]]
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def count(self, name, value=1, unit=COUNT):
+        """
+        Add to a counter.
+
+        :param str   name:
+        :param float value:
+        :param str   unit:
+
+        """
+        with self._lock:
+            self._units[name]    = unit
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value, unit=SECONDS):
+        """
+        Add a value to a distribution.
+
+        :param str   name:
+        :param float value:
+        :param str   unit:
+
+        """
+        with self._lock:
+            self._units[name] = unit
+            self._values.setdefault(name, []).append(value)
+
+    def snapshot(self) -> Tuple[dict, dict, dict]:
+        """
+        Copies of the units, counters and distributions.
+        """
+        with self._lock:
+            values = {name: list(v) for name, v in self._values.items()}
+            return dict(self._units), dict(self._counters), values
+
+    def emf(self, namespace=METRICS_NAMESPACE) -> List[dict]:
+        """
+        The metrics as CloudWatch Embedded Metric Format log entries.
+
+        All counters are in the first entry; a distribution with more values
+        than EMF allows in one entry is continued in further entries.  Each
+        entry has a "message" starting with LOG_PREFIX so that it is selected
+        with the rest of the output of this service.
+
+        :param str namespace:   CloudWatch metric namespace.
+
+        """
+        units, counters, values = self.snapshot()
+        entries   = []
+        remaining = {k: v for k, v in values.items() if v}
+        first     = True
+        while first or remaining:
+            entry = {**self.dimensions}
+            if first:
+                entry.update(counters)
+            for name in list(remaining):
+                entry[name]     = remaining[name][:EMF_VALUE_LIMIT]
+                remaining[name] = remaining[name][EMF_VALUE_LIMIT:]
+                if not remaining[name]:
+                    del remaining[name]
+            names = [k for k in entry if k not in self.dimensions]
+            if not names:
+                break
+            tag  = ' '.join(f"{k}={v}" for k, v in self.dimensions.items())
+            entry['message'] = f"{LOG_PREFIX} metrics {tag}".rstrip()
+            entry['_aws'] = {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace':  namespace,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': [
+                        {'Name': name, 'Unit': units[name]} for name in names
+                    ],
+                }],
+            }
+            entries.append(entry)
+            first = False
+        return entries
+
+
+class PrometheusTotals:
+    """
+    Running totals of emitted metrics for a Prometheus textfile:  counters
+    are accumulated and distributions are reduced to histograms (with
+    LATENCY_BUCKETS if measured in seconds) so that the totals of a
+    long-running process stay small.
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self):
+        self._lock       = threading.Lock()
+        self._units      = {}  # type: Dict[str, str]
+        self._counters   = {}  # type: Dict[tuple, float]
+        self._histograms = {}  # type: Dict[tuple, List[float]]
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def add(self, metrics):
+        """
+        Add the values of a set of metrics to the totals.
+
+        :param Metrics metrics:
+
+        """
+        units, counters, values = metrics.snapshot()
+        labels = tuple(metrics.dimensions.items())
+        with self._lock:
+            self._units.update(units)
+            for name, value in counters.items():
+                key = (name, labels)
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, items in values.items():
+                bounds = LATENCY_BUCKETS if units[name] == SECONDS else ()
+                key    = (name, labels)
+                empty  = [0] * (len(bounds) + 2)  # Buckets, sum, count.
+                totals = self._histograms.setdefault(key, empty)
+                for index, bound in enumerate(bounds):
+                    totals[index] += sum(1 for v in items if v <= bound)
+                totals[-2] += sum(items)
+                totals[-1] += len(items)
+
+    def lines(self) -> List[str]:
+        """
+        The totals as Prometheus text exposition lines.
+        """
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = _prometheus_name(name, self._units[name]) + '_total'
+                label  = _prometheus_labels(labels)
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{{{label}}} {value}")
+            for (name, labels), totals in sorted(self._histograms.items()):
+                unit   = self._units[name]
+                metric = _prometheus_name(name, unit)
+                bounds = LATENCY_BUCKETS if unit == SECONDS else ()
+                label  = _prometheus_labels(labels)
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                for bound, number in zip(bounds, totals):
+                    bucket = _prometheus_labels(labels, le=bound)
+                    lines.append(f"{metric}_bucket{{{bucket}}} {number}")
+                bucket = _prometheus_labels(labels, le='+Inf')
+                lines.append(f"{metric}_bucket{{{bucket}}} {totals[-1]}")
+                lines.append(f"{metric}_sum{{{label}}} {totals[-2]}")
+                lines.append(f"{metric}_count{{{label}}} {totals[-1]}")
+        return lines
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+@contextmanager
+def collecting(**dimensions):
+    """
+    Gather the metrics reported within the block (including by threads
+    started with in_context()) and emit them when the block ends.
+
+    :param dimensions:  Passed to Metrics().
+
+    :rtype: Iterator[Metrics]
+
+    """
+    metrics = Metrics(**dimensions)
+    token   = _current.set(metrics if METRICS else None)
+    start   = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        metrics.observe('RunSeconds', (time.perf_counter() - start))
+        METRICS and emit_metrics(metrics)
+
+
+def tally(name, value=1, unit=COUNT):
+    """
+    Add to a counter of the current metrics (if any).
+
+    :param str   name:
+    :param float value:
+    :param str   unit:
+
+    """
+    metrics = _current.get()
+    metrics and metrics.count(name, value, unit)
+
+
+def observe(name, value, unit=SECONDS):
+    """
+    Add a value to a distribution of the current metrics (if any).
+
+    :param str   name:
+    :param float value:
+    :param str   unit:
+
+    """
+    metrics = _current.get()
+    metrics and metrics.observe(name, value, unit)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the duration of the block to a distribution of the current metrics.
+
+    :param str name:
+
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start))
+
+
+def timed_iter(name, iterable):
+    """
+    Pass through the items of an iterable, adding the total time spent
+    producing them (but not the time spent by the consumer) to a
+    distribution of the current metrics.
+
+    :param str      name:
+    :param Iterable iterable:
+
+    :rtype: Iterator
+
+    """
+    elapsed  = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe(name, elapsed)
+
+
+def emit_metrics(metrics):
+    """
+    Write metrics to stdout as EMF and add them to the Prometheus textfile.
+
+    :param Metrics metrics:
+
+    """
+    global _totals
+    lines = [json.dumps(entry) for entry in metrics.emf()]
+    lines and sys.stdout.write(''.join(f"{line}\n" for line in lines))
+    if METRICS_TEXTFILE:
+        with _totals_lock:
+            _totals = _totals or PrometheusTotals()
+            _totals.add(metrics)
+            write_textfile(METRICS_TEXTFILE, _totals.lines())
+
+
+def write_textfile(path, lines):
+    """
+    Replace a Prometheus textfile.  The new content is written to a temporary
+    file which is then renamed so that a scrape never sees a partial file.
+
+    :param str           path:
+    :param Iterable[str] lines:
+
+    """
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp, 'w') as file:
+            file.write(''.join(f"{line}\n" for line in lines))
+        os.replace(temp, path)
+    except OSError as error:
+        log_error(f"{path}: {error}")
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _prometheus_name(name, unit) -> str:
+    """
+    Convert a CamelCase metric name to a Prometheus metric name, e.g.
+    "UploadLatency" in seconds to "emma_ia_upload_latency_seconds".
+
+    :param str name:
+    :param str unit:
+
+    """
+    words = re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+    if unit in (SECONDS, BYTES) and not words.endswith(unit.lower()):
+        words = f"{words}_{unit.lower()}"
+    return f"{PROMETHEUS_PREFIX}{words}"
+
+
+def _prometheus_labels(labels, **extra) -> str:
+    """
+    Prometheus label pairs from dimension names and values.
+
+    :param Iterable[tuple] labels:
+    :param extra:                   Additional labels (e.g. "le").
+
+    """
+    pairs = [*labels, *extra.items()]
+    return ','.join(f'{k.lower()}="{v}"' for k, v in pairs)
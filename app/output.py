@@ -3,11 +3,13 @@
 # Console output and logging support.
 
 
+import contextvars
 import logging
 import math
 import sys
 
-from pprint import PrettyPrinter
+from contextlib import contextmanager
+from pprint     import PrettyPrinter
 
 from app.var  import APPLICATION_DEPLOYED
 from app.util import to_list
@@ -40,6 +42,31 @@ LOG_PREFIX = 'EMMA:'
 pp      = PrettyPrinter(**PP_KWARGS)
 pp_wide = PrettyPrinter(**{**PP_KWARGS, 'width': PP_WIDE})
 
+# Label for output from the current task (e.g. the queue being processed).
+_output_tag = contextvars.ContextVar('output_tag', default=None)
+
+
+# =============================================================================
+# Output tagging
+# =============================================================================
+
+
+@contextmanager
+def output_tag(tag):
+    """
+    Label all output lines produced within the block (including by threads
+    started with in_context()) so that the output of concurrent tasks can be
+    told apart.
+
+    :param str|None tag:
+
+    """
+    token = _output_tag.set(tag)
+    try:
+        yield
+    finally:
+        _output_tag.reset(token)
+
 
 # =============================================================================
 # Log output
@@ -150,7 +177,9 @@ def _line_prefix(prefix=None):
 
     """
     prefix = prefix or LOG_PREFIX if APPLICATION_DEPLOYED else ''
-    return prefix if not prefix or prefix.endswith(' ') else f"{prefix} "
+    prefix = prefix if not prefix or prefix.endswith(' ') else f"{prefix} "
+    tag    = _output_tag.get()
+    return f"{prefix}[{tag}] " if tag else prefix
 
 
 def _show_lines(*lines, prefix=None):
@@ -162,5 +191,4 @@ def _show_lines(*lines, prefix=None):
 
     """
     prefix = _line_prefix(prefix)
-    for line in lines:
-        sys.stdout.write(f"{prefix}{line}\n")
+    sys.stdout.write(''.join(f"{prefix}{line}\n" for line in lines))
@@ -0,0 +1,189 @@
+# app/pipeline.py
+#
+# Streaming pipeline of processing stages connected by bounded queues.
+
+
+import queue
+import threading
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Seconds a batch stage waits for another item before handling a partial
+# group.
+PIPELINE_IDLE_WAIT = 1.0
+
+# Marker passed down the pipeline after the last item.
+_END = object()
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Pipeline:
+    """
+    A chain of processing stages each running in its own thread(s), so that
+    an item can move on to the next stage as soon as it has finished the
+    current one.
+
+    Stages are connected by bounded queues so that a fast stage can only get
+    *depth* items ahead of the stage that follows it.
+
+    Usage:
+        Pipeline(source).then(step1).then(step2, workers=4).batch(step3).run()
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, source, depth=PIPELINE_DEPTH, name='PIPELINE'):
+        """
+        :param Iterable source:     Items to be fed into the first stage.
+        :param int      depth:      Bound on each inter-stage queue.
+        :param str      name:       Label for thread names and error messages.
+        """
+        self.source  = source
+        self.depth   = max(1, depth)
+        self.name    = name
+        self._stages = []
+
+    def then(self, func, workers=1):
+        """
+        Add a stage which handles items one at a time.
+
+        :param Callable func:       Called with each item; the return value is
+                                        passed to the next stage unless it is
+                                        None.
+        :param int      workers:    Number of threads running *func*.
+
+        :return: self
+        :rtype:  Pipeline
+
+        """
+        self._stages.append(('item', func, max(1, workers), None, None))
+        return self
+
+    def batch(self, func, size=REMOVE_BATCH_SIZE, wait=PIPELINE_IDLE_WAIT):
+        """
+        Add a stage which handles items in groups.
+
+        A group is handed to *func* when it reaches *size* items, when no new
+        item has arrived for *wait* seconds, or at the end of the input.
+
+        :param Callable func:   Called with a list of items; the return value
+                                    (if not None) is a list of items passed to
+                                    the next stage.
+        :param int      size:   Maximum number of items in a group.
+        :param float    wait:   Idle time before handing off a partial group.
+
+        :return: self
+        :rtype:  Pipeline
+
+        """
+        self._stages.append(('batch', func, 1, max(1, size), wait))
+        return self
+
+    def run(self):
+        """
+        Feed the source through all stages and wait for them to finish.
+        """
+        queues  = [queue.Queue(maxsize=self.depth) for _ in self._stages]
+        queues.append(None)
+        threads = [self._thread('source', self._feed, queues[0])]
+        for index, stage in enumerate(self._stages):
+            kind, func, workers, size, wait = stage
+            inbound, outbound = queues[index], queues[index + 1]
+            if kind == 'batch':
+                args = (func, inbound, outbound, size, wait)
+                threads.append(self._thread(index, self._run_batch, *args))
+            else:
+                remaining = [workers]
+                lock      = threading.Lock()
+                for _ in range(workers):
+                    args = (func, inbound, outbound, remaining, lock)
+                    threads.append(self._thread(index, self._run_item, *args))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _thread(self, label, target, *args) -> threading.Thread:
+        name = f"{self.name}-{label}"
+        target = in_context(target)
+        return threading.Thread(target=target, args=args, name=name)
+
+    def _feed(self, outbound):
+        """
+        Move source items into the first stage.
+        """
+        try:
+            for item in self.source:
+                outbound.put(item)
+        except Exception as error:
+            log_error(f"{self.name} source: {error}")
+        finally:
+            outbound.put(_END)
+
+    def _run_item(self, func, inbound, outbound, remaining, lock):
+        """
+        Worker loop for a stage which handles items one at a time.  The last
+        worker to see the end marker passes it on to the next stage.
+        """
+        while True:
+            item = inbound.get()
+            if item is _END:
+                inbound.put(_END)  # Let the other workers see it.
+                break
+            try:
+                result = func(item)
+            except Exception as error:
+                log_error(f"{self.name} {func.__name__}: {error}")
+                result = None
+            if result is not None and outbound is not None:
+                outbound.put(result)
+        with lock:
+            remaining[0] -= 1
+            last = not remaining[0]
+        if last and outbound is not None:
+            outbound.put(_END)
+
+    def _run_batch(self, func, inbound, outbound, size, wait):
+        """
+        Worker loop for a stage which handles groups of items.
+        """
+        group = []
+        done  = False
+        while not done:
+            try:
+                item = inbound.get(timeout=wait) if group else inbound.get()
+            except queue.Empty:
+                item = None
+            if item is _END:
+                done = True
+            elif item is not None:
+                group.append(item)
+            if group and (done or (item is None) or (len(group) >= size)):
+                try:
+                    results = func(group)
+                except Exception as error:
+                    log_error(f"{self.name} {func.__name__}: {error}")
+                    results = None
+                if results and outbound is not None:
+                    for result in results:
+                        outbound.put(result)
+                group = []
+        if outbound is not None:
+            outbound.put(_END)
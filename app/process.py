@@ -3,68 +3,105 @@
 # Core functionality.
 
 
-from enum import Enum, auto
+from __future__ import annotations
+
+import hashlib
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib         import closing, contextmanager
+from functools          import partial
+from typing             import TYPE_CHECKING
 
 from app.aws_s3    import *
+from app.control   import *
+from app.daemon    import *
+from app.dedup     import *
 from app.emma      import *
 from app.ia        import *
+from app.intake    import *
+from app.journal   import *
+from app.metrics   import *
+from app.pipeline  import *
+from app.profiling import *
+from app.readiness import *
+from app.remover   import *
 from app.sip_table import *
+from app.stream    import *
+
+if TYPE_CHECKING:
+    import boto3_type_annotations.s3 as s3
+    from internetarchive import ArchiveSession
 
 
 # =============================================================================
-# Classes
+# Variables
 # =============================================================================
 
 
-class Action(Enum):
-    Clear  = auto()
-    Pause  = auto()
-    Resume = auto()
+# Pause/resume state of the queues.
+_control = ControlState()
 
+# Idle IA sessions.  Each upload has a session to itself and then returns it
+# for re-use, so sessions (and their connections) outlive the worker threads
+# of a pool, e.g. across warm invocations of the Lambda function.
+_ia_sessions: List[ArchiveSession] = []
+_ia_session_lock = threading.Lock()
 
-# =============================================================================
-# Constants
-# =============================================================================
+# Bucket instances by name.
+_buckets:    Dict[str, s3.Bucket] = {}
+_bucket_lock = threading.Lock()
 
+# Readiness index of each bucket by name.
+_indexes:   Dict[str, ReadinessIndex] = {}
+_index_lock = threading.Lock()
 
-PAUSE_KEY_TEMPLATE  = 'control/paused-{repo}-{deployment}'
-RESUME_KEY_TEMPLATE = 'control/active-{repo}-{deployment}'
+# Record of uploaded data file content (if DEDUP_PATH is given).
+_digests: Optional[DigestStore] = None
+_digests_lock = threading.Lock()
 
 
 # =============================================================================
-# Variables
+# Functions
 # =============================================================================
 
 
-_s3_bucket: Optional[s3.Bucket] = None
+@contextmanager
+def _ia_session(session=None):
+    """
+    An idle IA session (or a new one) for the duration of an upload.
 
+    :param ArchiveSession|None session:     If given, it is used as-is.
 
-# =============================================================================
-# Functions
-# =============================================================================
+    :rtype: Iterator[ArchiveSession]
 
-
-def _run(action, repo=None, deployment=None):
     """
-    :param Action   action:
-    :param str|None repo:           Member repository (def: DEF_REPO).
-    :param str|None deployment:     One of DEPLOYMENTS (def: DEF_DEPLOYMENT).
+    if session:
+        yield session
+        return
+    with _ia_session_lock:
+        session = _ia_sessions.pop() if _ia_sessions else None
+    session = session or ia_get_session()
+    try:
+        yield session
+    finally:
+        with _ia_session_lock:
+            _ia_sessions.append(session)
+
+
+def _digest_store() -> Optional[DigestStore]:
     """
-    repo       = str(repo).casefold()       if repo       else DEF_REPO
-    deployment = str(deployment).casefold() if deployment else DEF_DEPLOYMENT
-    bucket     = s3_bucket_name('emma', deployment)
-    pause_key  = PAUSE_KEY_TEMPLATE.format(repo=repo, deployment=deployment)
-    resume_key = RESUME_KEY_TEMPLATE.format(repo=repo, deployment=deployment)
-    if action == Action.Pause:
-        if not s3_object_rename(resume_key, pause_key, bucket):
-            DEBUG and show(f"CREATING {pause_key}")
-            upload_to_s3_bucket('/dev/null', bucket, object_key=pause_key)
-    elif action == Action.Resume:
-        s3_object_rename(pause_key, resume_key, bucket)
-    elif action == Action.Clear:
-        delete_from_s3_bucket([pause_key, resume_key], bucket)
-    else:
-        raise ValueError(f"{action}: invalid action")
+    The record of uploaded data file content, or None if DEDUP_PATH is not
+    configured.
+    """
+    global _digests
+    if DEDUP_PATH and _digests is None:
+        with _digests_lock:
+            if _digests is None:
+                _digests = DigestStore(DEDUP_PATH)
+    return _digests
 
 
 def is_paused(repo=None, deployment=None) -> bool:
@@ -72,77 +109,257 @@ def is_paused(repo=None, deployment=None) -> bool:
     If the control file exists in the appropriate bucket then processing of IA
     staging submissions will not proceed.
 
+    The control files of all queues are listed together and the result is
+    re-used for CONTROL_TTL seconds.
+
     :param str|None repo:           Member repository (def: DEF_REPO).
     :param str|None deployment:     One of DEPLOYMENTS (def: DEF_DEPLOYMENT).
 
     """
-    repo       = str(repo).casefold()       if repo       else DEF_REPO
-    deployment = str(deployment).casefold() if deployment else DEF_DEPLOYMENT
-    bucket     = s3_bucket_name('emma', deployment)
-    key        = PAUSE_KEY_TEMPLATE.format(repo=repo, deployment=deployment)
-    return s3_object_exists(key, bucket)
+    return _control.is_paused(repo, deployment)
 
 
 def get_repo_bucket(repo=None, deployment=None, bucket=None) -> s3.Bucket:
     """
+    Bucket instances are retained so that a long-running process can re-use
+    their connections.
+
     :param str|None           repo:         Member repository.
     :param str|None           deployment:   One of DEPLOYMENTS.
-    :param str|s3.Bucket|None bucket:       S3 bucket name or instance.
+    :param str|s3.Bucket|None bucket:       S3 bucket name or instance; if
+                                                neither this nor *repo* or
+                                                *deployment* are given, the
+                                                DEF_REPO bucket for
+                                                DEF_DEPLOYMENT.
     """
-    bucket = s3_bucket_name(repo, deployment) if repo or deployment else bucket
+    if repo or deployment or not bucket:
+        bucket = s3_bucket_name(repo, deployment)
+    if isinstance(bucket, str):
+        with _bucket_lock:
+            if bucket not in _buckets:
+                _buckets[bucket] = get_s3_bucket(bucket)
+            bucket = _buckets[bucket]
     return get_s3_bucket(bucket)
 
 
-def get_submissions(prefix='', bucket=None):
+def readiness_index(bucket) -> ReadinessIndex:
+    """
+    The readiness index of a bucket, which is retained so that orphans are
+    aged across the listings of a long-running process.
+
+    :param str|s3.Bucket bucket:    S3 bucket name or instance.
+
+    """
+    name = bucket if isinstance(bucket, str) else bucket.name
+    with _index_lock:
+        if name not in _indexes:
+            _indexes[name] = ReadinessIndex(name)
+        return _indexes[name]
+
+
+def iter_submissions(prefix='', bucket=None, journal=None, shards=None):
+    """
+    Generate submissions present in an out-bound EMMA queue on AWS S3.
+
+    Each submission is yielded as soon as both its package and its data file
+    have been seen.  Incomplete submissions are not yielded; they are left in
+    the readiness index of the bucket (see readiness_index()) and reported
+    once they are older than ORPHAN_AGE.
+
+    :param str|None           prefix:   If '' then keys that have any prefix
+                                            are skipped; if None then any/all
+                                            prefixes are allowed.
+    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: DEF_REPO)
+    :param Journal|None       journal:  If given, submissions which it shows
+                                            were already uploaded are marked
+                                            as completed.
+    :param int|None           shards:   Parallel listing ranges; if greater
+                                            than 1, submissions are not
+                                            generated in key order.
+
+    :returns: Pairs of submission ID and Sip.
+    :rtype:   Iterator[tuple[str, Sip]]
+
+    """
+    s3_bucket = get_repo_bucket(bucket=bucket)
+    entries   = _list_submissions(prefix, s3_bucket, shards)
+    entries   = timed_iter('ListSeconds', entries)
+    return _resume_submissions(entries, journal)
+
+
+def _list_submissions(prefix, s3_bucket, shards=None):
+    """
+    Generate complete submissions from the contents of the AWS bucket.
+
+    Filtering by prefix is done by AWS:  unless *prefix* is None, only keys
+    directly "within" the prefix are listed (and, for the default prefix of
+    '', objects like "control/..." are never seen).
+
+    :param str|None  prefix:
+    :param s3.Bucket s3_bucket:
+    :param int|None  shards:    Parallel listing ranges (def: LIST_SHARDS).
+
+    :rtype: Iterator[tuple[str, Sip]]
+
+    """
+    index     = readiness_index(s3_bucket)
+    pending   = {}
+    paired    = set()
+    prefix    = f"{prefix}/" if prefix and not prefix.endswith('/') else prefix
+    delimiter = None if prefix is None else '/'
+    shards    = shards or LIST_SHARDS
+    index.begin()
+    for entry in s3_list_objects_sharded(s3_bucket, prefix, delimiter, shards):
+        file = entry['Key']
+        sid, item = sip_part(file)
+        if sid in paired:
+            log_error(f'{item} already found for "{sid}"')
+            continue
+        submission = pending.get(sid)
+        if submission is None:
+            submission = pending[sid] = Sip(sid=sid)
+        if item in submission:
+            log_error(f'{item} already found for "{sid}"')
+            continue
+        submission[item] = file
+        readiness = index.add(sid, item, file, entry.get('LastModified'))
+        if readiness is Readiness.Complete:
+            paired.add(sid)
+            yield sid, pending.pop(sid)
+    _report_readiness(index, index.finish())
+
+
+def _resume_submissions(entries, journal=None):
+    """
+    Pass through submissions, marking those which the journal shows were
+    uploaded in a previous run as completed and recording the others as
+    listed.
+
+    :param Iterable[tuple[str,Sip]] entries:
+    :param Journal|None             journal:
+
+    :rtype: Iterator[tuple[str, Sip]]
+
+    """
+    states = journal.states() if journal else {}
+    for sid, submission in entries:
+        if shutdown_requested():
+            break
+        tally('ListedSubmissions')
+        state = states.get(sid)
+        if state is None:
+            journal and journal.record(sid, State.Listed)
+        elif state >= State.Uploaded:
+            DEBUG and show(f"{sid}: ALREADY UPLOADED")
+            submission.completed = True
+        yield sid, submission
+
+
+def get_submissions(prefix='', bucket=None, journal=None):
     """
     Retrieve all submissions present in an out-bound EMMA queue on AWS S3.
 
     :param str|None           prefix:   If '' then keys that have any prefix
                                             are skipped; if None then any/all
                                             prefixes are allowed.
-    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: _s3_bucket)
+    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: DEF_REPO)
+    :param Journal|None       journal:  Record of previous progress.
 
-    :returns: All un-retrieved submissions IDs with their related files.
+    :returns: All complete un-retrieved submissions IDs with their related
+                files.
     :rtype:   SipTable
 
     """
     result    = SipTable()
-    prefix    = f"{prefix}/" if prefix and not prefix.endswith('/') else prefix
-    s3_bucket = _s3_bucket or get_repo_bucket(bucket=bucket)
-    for entry in s3_bucket.objects.all():  # type: s3.Object
-        file = entry.key
-        if prefix is None or prefix_of(file) == prefix:
-            sid = re.sub(r'\.[^.]+$', '', file)
-            item = 'package' if re.search(r'\.xml$', file) else 'data_file'
-            if item in result[sid]:
-                log_error(f'{item} already found for "{sid}"')
-            else:
-                result[sid][item] = file
+    s3_bucket = get_repo_bucket(bucket=bucket)
+    for sid, submission in iter_submissions(prefix, s3_bucket, journal):
+        result[sid] = submission
     if DEBUG and (result or not APPLICATION_DEPLOYED):
         show_header(f"AWS S3 BUCKET {s3_bucket.name} CONTENTS:")
         show(result)
     return result
 
 
-def parse_submissions(submissions, bucket=None):
+@profile_submissions
+def parse_submission(sid, submission, s3_bucket, s3_cli=None, journal=None):
+    """
+    Download the submission information package for a single submission and
+    extract its metadata values.
+
+    :param str       sid:           Submission ID.
+    :param Sip       submission:
+    :param s3.Bucket s3_bucket:
+    :param s3.Client s3_cli:        If given, the package is fetched with a
+                                        single GET through this client and
+                                        parsed as it arrives.
+    :param Journal   journal:       If given, progress is recorded.
+
+    :return: Metadata for the submission (also set in submission).
+    :rtype:  dict
+
+    """
+    if submission.completed:
+        return submission.metadata  # Already uploaded in a previous run.
+    DEBUG and show_header(f"ENTRY {sid}:")
+    start = time.perf_counter()
+    sip   = submission.package
+    if not sip:
+        tally('ParseErrors')
+        log_error(f"no package for {sid}")
+        return None
+    try:
+        if s3_cli:
+            body, size = open_from_s3_bucket(sip, s3_bucket, s3_cli)
+            tally('DownloadedBytes', size, BYTES)
+            with closing(body):
+                submission.metadata = sip_parse(body)
+        else:
+            bio = io.BytesIO()
+            s3_bucket.Object(sip).download_fileobj(bio)
+            tally('DownloadedBytes', bio.getbuffer().nbytes, BYTES)
+            submission.metadata = sip_parse(bio)
+    except Exception:
+        tally('ParseErrors')
+        raise
+    observe('ParseLatency', (time.perf_counter() - start))
+    journal and journal.record(sid, State.Parsed)
+    return submission.metadata
+
+
+def parse_submissions(submissions, bucket=None, workers=None, journal=None):
     """
     For each submission, download its submission information package and
     extract metadata values.
 
+    If *workers* is greater than 1, packages are fetched concurrently by a
+    pool of that many threads sharing a single pooled S3 client.
+
     :param SipTable submissions:
-    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: _s3_bucket)
+    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: DEF_REPO)
+    :param int|None           workers:  Default: PARSE_WORKERS.
+    :param Journal|None       journal:  If given, progress is recorded.
 
     :returns: Metadata for each submission ID.
     :rtype:   dict
 
     """
-    s3_bucket = _s3_bucket or get_repo_bucket(bucket=bucket)
-    for sid, submission in submissions.items():
-        DEBUG and show_header(f"ENTRY {sid}:")
-        sip = submission.package
-        bio = io.BytesIO()
-        s3_bucket.Object(sip).download_fileobj(bio)
-        submission.metadata = sip_parse(bio)
+    workers   = max(1, workers or PARSE_WORKERS)
+    s3_bucket = get_repo_bucket(bucket=bucket)
+
+    def parse(sid, submission, s3_cli=None):
+        try:
+            parse_submission(sid, submission, s3_bucket, s3_cli, journal)
+        except Exception as error:
+            log_error(f"{sid}: {error}")
+
+    if workers == 1:
+        for sid, submission in submissions.items():
+            parse(sid, submission)
+    else:
+        s3_cli = s3_client(None, workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for sid, submission in submissions.items():
+                pool.submit(in_context(parse), sid, submission, s3_cli)
 
     result = {}
     for sid, submission in submissions.items():
@@ -150,44 +367,155 @@ def parse_submissions(submissions, bucket=None):
     return result
 
 
-def upload_submissions(submissions, bucket=None):
+@profile_submissions
+def upload_submission(
+        sid,
+        submission,
+        s3_bucket,
+        session=None,
+        stream=None,
+        journal=None) -> bool:
     """
-    For each submission, upload file and metadata to IA.
+    Upload the data file and metadata of a single submission to IA.
 
-    :param SipTable submissions:
-    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: _s3_bucket)
+    :param str            sid:          Submission ID.
+    :param Sip            submission:
+    :param s3.Bucket      s3_bucket:
+    :param ArchiveSession session:      Default: an idle shared IA session.
+    :param bool|None      stream:       Transfer without a temporary file
+                                            (default: STREAM_UPLOAD).
+    :param Journal|None   journal:      If given, progress is recorded.
 
-    :return: The list of completed submission IDs.
-    :rtype:  list[str]
+    :return: Whether the submission was transmitted (also set in submission).
+    :rtype:  bool
 
     """
-    session   = None
-    s3_bucket = _s3_bucket or get_repo_bucket(bucket=bucket)
-    for sid, submission in submissions.items():
-        DEBUG and show_header(f"ENTRY {sid} METADATA:")
+    if submission.completed:
+        return True  # Already uploaded in a previous run.
+    if shutdown_requested() or not ia_available():
+        return False  # Not starting new transfers.
+    start = time.perf_counter()
+    try:
+        with _ia_session(session) as session:
+            args = (sid, submission, s3_bucket, session, stream, journal)
+            completed = _transfer_submission(*args)
+    except Exception:
+        tally('UploadErrors')
+        raise
+    if completed:
+        observe('UploadLatency', (time.perf_counter() - start))
+        tally('UploadedSubmissions')
+    else:
+        tally('UploadErrors')
+    return completed
 
-        # Transform SIP metadata into IA metadata.
-        emma_metadata = submission.metadata
-        metadata = ia_metadata(emma_metadata)
 
-        # Determine the target IA item.
-        ia_id = metadata.get('identifier')
-        if not ia_id:
-            log_error(f"empty emma_repositoryRecordId for {sid}")
-            continue
+def _transfer_submission(
+        sid,
+        submission,
+        s3_bucket,
+        session,
+        stream=None,
+        journal=None) -> bool:
+    """
+    Transfer a submission to IA (see upload_submission()).
+
+    :param str            sid:          Submission ID.
+    :param Sip            submission:
+    :param s3.Bucket      s3_bucket:
+    :param ArchiveSession session:
+    :param bool|None      stream:       Default: STREAM_UPLOAD.
+    :param Journal|None   journal:      If given, progress is recorded.
+
+    :return: Whether the submission was transmitted (also set in submission).
+    :rtype:  bool
 
-        # Download a copy of the submitted data file.
-        file = submission.data_file
-        obj  = s3_bucket.Object(file)  # type: s3.Object
-        size = obj.content_length
-        tmp  = f"{ia_id}_emma_{file}"
-        obj.download_file(tmp)
-
-        # Upload the submitted data file to IA.
-        if DEBUG:
-            _to = '[DRY RUN]' if DRY_RUN else 'TO IA'
-            show_header(f'SUBMIT "{ia_id}" (file {file} - {size} bytes) {_to}')
-        session = session or ia_get_session()
+    """
+    DEBUG and show_header(f"ENTRY {sid} METADATA:")
+
+    # Transform SIP metadata into IA metadata.
+    emma_metadata = submission.metadata
+    if not emma_metadata:
+        log_error(f"no package metadata for {sid}")
+        return False
+    try:
+        metadata = ia_metadata(emma_metadata)
+    except MetadataError as error:
+        tally('MetadataErrors')
+        log_error(f"{sid}: {error}")
+        return False
+
+    # Determine the target IA item.
+    ia_id = metadata.get('identifier')
+    if not ia_id:
+        log_error(f"empty emma_repositoryRecordId for {sid}")
+        return False
+
+    # Get information about the submitted data file.
+    file = submission.data_file
+    if not file:
+        log_error(f"no data file for {sid}")
+        return False
+    obj  = s3_bucket.Object(file)  # type: s3.Object
+    size = obj.content_length
+    etag = obj.e_tag
+    name = f"{ia_id}_emma_{file}"
+    tmp  = os.path.join(tempfile.gettempdir(), name)
+    if DEBUG:
+        _to = '[DRY RUN]' if DRY_RUN else 'TO IA'
+        show_header(f'SUBMIT "{ia_id}" (file {file} - {size} bytes) {_to}')
+    staging = not (STREAM_UPLOAD if stream is None else stream)
+    digests = _digest_store()
+    sha256  = None
+
+    # If the same content was already uploaded to the IA item (e.g. when a
+    # submission is re-submitted to correct its metadata) only the metadata
+    # needs to be sent.
+    original = digests and digests.find(ia_id, size, etag=etag)
+    if original:
+        args = (sid, submission, ia_id, original, metadata, session)
+        return _complete_duplicate(*args, journal)
+
+    # Stream the submitted data file from AWS directly to IA.  If that fails
+    # after the transfer has started, the stream cannot be rewound so the
+    # upload is re-tried via a temporary file.
+    if not staging:
+        digest = hashlib.sha256() if digests else None
+        source = obj.get()['Body']
+        with ReadAheadStream(source, size, name=name, digest=digest) as body:
+            submission.completed = ia_upload_stream(
+                target=ia_id,
+                name=name,
+                stream=body,
+                metadata=metadata,
+                dry_run=DRY_RUN,
+                session=session
+            )
+            staging = not submission.completed and not body.seekable()
+            if digest and (body.consumed == size):
+                sha256 = digest.hexdigest()
+            tally('DownloadedBytes', body.consumed, BYTES)
+        if staging:
+            log_error(f"{sid}: streaming failed; retrying with {tmp}")
+
+    # Download a copy of the submitted data file and upload it to IA.
+    if staging:
+        ranged = (RANGED_DOWNLOAD_PARTS > 1)
+        ranged = ranged and (size >= RANGED_DOWNLOAD_THRESHOLD)
+        if not ranged:
+            obj.download_file(tmp)
+        elif not download_ranges_from_s3_bucket(file, s3_bucket, tmp, size):
+            log_error(f"{sid}: failed to download {file}")
+            return False
+        tally('DownloadedBytes', size, BYTES)
+        journal and journal.record(sid, State.Downloaded)
+        if digests:
+            sha256   = file_digest(tmp)
+            original = digests.find(ia_id, size, sha256=sha256)
+            if original:
+                os.remove(tmp)
+                args = (sid, submission, ia_id, original, metadata, session)
+                return _complete_duplicate(*args, journal)
         submission.completed = ia_upload_file(
             target=ia_id,
             file=tmp,
@@ -196,65 +524,409 @@ def upload_submissions(submissions, bucket=None):
             dry_run=DRY_RUN,
             session=session
         )
+    if submission.completed:
+        tally('UploadedBytes', size, BYTES)
+        if digests and not DRY_RUN:
+            digests.record(ia_id, name, size, etag=etag, sha256=sha256)
+        journal and journal.record(sid, State.Uploaded)
+    return submission.completed
+
+
+def _complete_duplicate(
+        sid,
+        submission,
+        ia_id,
+        name,
+        metadata,
+        session,
+        journal=None) -> bool:
+    """
+    Complete a submission whose data file has the same content as a file
+    already uploaded to the IA item by applying its metadata to that file.
+
+    :param str            sid:          Submission ID.
+    :param Sip            submission:
+    :param str            ia_id:        IA item identifier.
+    :param str            name:         The existing file on IA.
+    :param dict           metadata:     IA metadata for the submission.
+    :param ArchiveSession session:
+    :param Journal|None   journal:      If given, progress is recorded.
+
+    :return: Whether the metadata was sent (also set in submission).
+    :rtype:  bool
+
+    """
+    DEBUG and show(f'{sid}: SAME CONTENT AS "{name}" - NOT UPLOADING')
+    tally('DuplicateSubmissions')
+    submission.completed = ia_update_file_metadata(
+        target=ia_id,
+        name=name,
+        metadata=metadata,
+        dry_run=DRY_RUN,
+        session=session
+    )
+    if submission.completed:
+        journal and journal.record(sid, State.Uploaded)
+    return submission.completed
+
+
+def upload_submissions(
+        submissions,
+        bucket=None,
+        workers=None,
+        stream=None,
+        remover=None,
+        journal=None):
+    """
+    For each submission, upload file and metadata to IA.
+
+    If *workers* is greater than 1, submissions are transferred concurrently
+    by a pool of that many threads, each upload with its own IA session.
+
+    If IA fails repeatedly (see ia_breaker) no more data files are fetched;
+    the remaining submissions are left for a later run.
+
+    :param SipTable submissions:
+    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: DEF_REPO)
+    :param int|None           workers:  Default: UPLOAD_WORKERS.
+    :param bool|None          stream:   Default: STREAM_UPLOAD.
+    :param SubmissionRemover  remover:  If given, each submission is passed
+                                            to it for removal as soon as it is
+                                            completed.
+    :param Journal|None       journal:  If given, progress is recorded.
+
+    :return: The list of completed submission IDs.
+    :rtype:  list[str]
+
+    """
+    workers   = max(1, workers or UPLOAD_WORKERS)
+    s3_bucket = get_repo_bucket(bucket=bucket)
+
+    def upload(sid, submission):
+        try:
+            args = (sid, submission, s3_bucket, None, stream, journal)
+            if upload_submission(*args) and remover:
+                remover.add(sid, submission)
+        except Exception as error:
+            log_error(f"{sid}: {error}")
+
+    if workers == 1:
+        for sid, submission in submissions.items():
+            if not ia_available():
+                break
+            upload(sid, submission)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for sid, submission in submissions.items():
+                pool.submit(in_context(upload), sid, submission)
 
     completed = []
     for sid, submission in submissions.items():
         if submission.completed:
             completed.append(sid)
+    if not ia_available():
+        deferred = len(submissions) - len(completed)
+        log_error(f"IA unavailable - {deferred} submissions deferred")
     return completed
 
 
-def remove_submissions(submissions, bucket=None):
+def remove_submissions(submissions, bucket=None, remover=None):
     """
     Remove completed submissions from the AWS S3 bucket.
 
-    :param SipTable submissions:
-    :param str|s3.Bucket|None bucket:   S3 bucket or name (default: _s3_bucket)
+    :param SipTable                 submissions:
+    :param str|s3.Bucket|None       bucket:     S3 bucket or name (default:
+                                                    DEF_REPO)
+    :param SubmissionRemover|None   remover:    A remover which may already
+                                                    have been given completed
+                                                    submissions as they
+                                                    finished; closed here.
 
     :return: The list of removed files (AWS object keys).
     :rtype:  list[str]
 
     """
-    object_keys = []
-    for submission in submissions.values():
-        if submission.completed:
-            object_keys.append(submission.package)
-            object_keys.append(submission.data_file)
-    bucket = _s3_bucket or bucket
-    if DEBUG and (object_keys or not APPLICATION_DEPLOYED):
-        bucket_name = bucket.name if is_s3_bucket(bucket) else bucket
-        deleting    = 'ELIGIBLE FOR DELETION' if DRY_RUN else 'DELETING'
-        show_header(f"{deleting} {bucket_name} OBJECTS:")
-        show(object_keys or 'NONE')
-    if object_keys and not DRY_RUN:
-        delete_from_s3_bucket(object_keys, bucket)
+    bucket  = get_repo_bucket(bucket=bucket)
+    remover = remover or SubmissionRemover(bucket)
+    with remover:
+        for sid, submission in submissions.items():
+            if submission.completed:
+                remover.add(sid, submission)
+    object_keys = remover.removed
+    if DEBUG and not object_keys and not APPLICATION_DEPLOYED:
+        deleting = 'ELIGIBLE FOR DELETION' if DRY_RUN else 'DELETING'
+        show_header(f"{deleting} {bucket.name} OBJECTS:")
+        show('NONE')
     return object_keys
 
 
-def process(repo=None, deployment=None):
+def process(
+        repo=None,
+        deployment=None,
+        workers=None,
+        parse_workers=None,
+        pipeline=None,
+        stream=None):
     """
     Retrieve submission(s) from the designated AWS bucket, upload them to IA,
     and removed completed submissions.
 
-    :param str|None repo:           Member repository (def: DEF_REPO).
-    :param str|None deployment:     One of DEPLOYMENTS (def: DEF_DEPLOYMENT).
+    :param str|None  repo:          Member repository (def: DEF_REPO).
+    :param str|None  deployment:    One of DEPLOYMENTS (def: DEF_DEPLOYMENT).
+    :param int|None  workers:       Concurrent IA uploads (def: UPLOAD_WORKERS)
+    :param int|None  parse_workers: Concurrent package fetches.
+    :param bool|None pipeline:      Stream submissions through the stages of
+                                        processing (def: PIPELINE).
+    :param bool|None stream:        Stream data files from AWS to IA
+                                        (def: STREAM_UPLOAD).
+
+    :return: The number of submissions removed from the AWS bucket.
+    :rtype:  int
+
+    """
+    if PIPELINE if pipeline is None else pipeline:
+        args = (repo, deployment, workers, parse_workers, stream)
+        return process_streaming(*args)
+    s3_bucket = get_repo_bucket(repo, deployment)
+    journal   = open_journal(s3_bucket)
+    try:
+        with profiled('list', s3_bucket.name):
+            table = get_submissions(bucket=s3_bucket, journal=journal)
+        args    = (table, s3_bucket, journal, workers, parse_workers, stream)
+        removed = process_table(*args)
+    finally:
+        journal and journal.close()
+    return _submission_count(removed)
+
+
+def process_table(
+        table,
+        s3_bucket,
+        journal=None,
+        workers=None,
+        parse_workers=None,
+        stream=None) -> List[str]:
+    """
+    Upload the given submissions to IA and remove completed submissions from
+    the AWS bucket.
+
+    :param SipTable     table:
+    :param s3.Bucket    s3_bucket:
+    :param Journal|None journal:        If given, progress is recorded.
+    :param int|None     workers:        Concurrent IA uploads.
+    :param int|None     parse_workers:  Concurrent package fetches.
+    :param bool|None    stream:         Stream data files from AWS to IA.
+
+    :return: The list of removed files (AWS object keys).
+    :rtype:  list[str]
+
+    """
+    tag = s3_bucket.name
+    with timed('ParseSeconds'), profiled('parse', tag):
+        parse_submissions(table, s3_bucket, parse_workers, journal)
+    with SubmissionRemover(s3_bucket, journal=journal) as remover:
+        with timed('UploadSeconds'), profiled('upload', tag):
+            args = (table, s3_bucket, workers, stream, remover, journal)
+            upload_submissions(*args)
+        with timed('RemoveSeconds'), profiled('remove', tag):
+            return remove_submissions(table, s3_bucket, remover)
+
+
+def process_intake(intake, repos=None, deployments=None, **options) -> int:
+    """
+    Process the new submissions announced by S3 event notifications.
+
+    Submissions for paused queues are left for a later poll.  The events for
+    a submission are only acknowledged once it has been removed from the AWS
+    bucket, so that a submission which fails (or which was received during a
+    dry run) is delivered again.
+
+    :param Intake         intake:
+    :param list[str]|None repos:        Default: TARGET_REPOS.
+    :param list[str]|None deployments:  Default: DEPLOYMENTS.
+    :param options:                     Passed to process_table().
+
+    :return: The total number of submissions processed.
+    :rtype:  int
+
+    """
+    total  = 0
+    queues = {}
+    for repo in repos or TARGET_REPOS:
+        for deployment in deployments or DEPLOYMENTS:
+            queues[s3_bucket_name(repo, deployment)] = (repo, deployment)
+    options.pop('pipeline', None)
+    options.pop('queue_workers', None)
+    for bucket, table in intake.poll(queues).items():
+        repo, deployment = queues[bucket]
+        if shutdown_requested() or is_paused(repo, deployment):
+            intake.release(bucket, table.keys())
+            continue
+        queue   = _queue_name(repo, deployment)
+        removed = []
+        with collecting(Repo=repo, Deployment=deployment):
+            try:
+                s3_bucket = get_repo_bucket(bucket=bucket)
+                removed   = process_found(table, s3_bucket, **options)
+            except Exception as error:
+                log_error(f"{queue}: {error}")
+            finally:
+                done = [sid for sid, sip in table.items() if sip.removed]
+                intake.acknowledge(bucket, done)
+                keep = [sid for sid in table if sid not in done]
+                intake.release(bucket, keep)
+        count       = _submission_count(removed)
+        submissions = pluralize('SUBMISSION', count)
+        show(f"{count} {submissions} PROCESSED - {queue}")
+        total      += count
+    return total
+
+
+def process_found(table, s3_bucket, **options) -> List[str]:
+    """
+    Process submissions which were found by some means other than a listing
+    of the AWS bucket (e.g. from S3 events), skipping those which the journal
+    shows were already uploaded.
+
+    :param SipTable  table:
+    :param s3.Bucket s3_bucket:
+    :param options:             Passed to process_table().
+
+    :return: The list of removed files (AWS object keys).
+    :rtype:  list[str]
+
+    """
+    journal = open_journal(s3_bucket)
+    try:
+        entries = SipTable()
+        for sid, submission in _resume_submissions(table.items(), journal):
+            entries[sid] = submission
+        return process_table(entries, s3_bucket, journal, **options)
+    finally:
+        journal and journal.close()
+
+
+def process_streaming(
+        repo=None,
+        deployment=None,
+        workers=None,
+        parse_workers=None,
+        stream=None):
+    """
+    Process submissions as a stream:  each submission moves on to the next
+    stage as soon as it has finished the current one, so that uploads begin
+    while the bucket is still being listed and completed submissions are
+    removed as soon as their uploads finish.
+
+    :param str|None  repo:          Member repository (def: DEF_REPO).
+    :param str|None  deployment:    One of DEPLOYMENTS (def: DEF_DEPLOYMENT).
+    :param int|None  workers:       Concurrent IA uploads (def: UPLOAD_WORKERS)
+    :param int|None  parse_workers: Concurrent package fetches.
+    :param bool|None stream:        Stream data files from AWS to IA.
 
     :return: The number of submissions removed from the AWS bucket.
     :rtype:  int
 
     """
-    global _s3_bucket
-    _s3_bucket  = get_repo_bucket(repo, deployment)
-    table       = get_submissions()
-    _metadata   = parse_submissions(table)
-    _completed  = upload_submissions(table)
-    removed     = remove_submissions(table)
-    submissions = []
-    for object_key in removed:
-        if object_key.endswith('.xml'):
-            submissions.append(object_key)
-    _s3_bucket = None
-    return len(submissions)
+    parse_workers = max(1, parse_workers or PARSE_WORKERS)
+    s3_bucket     = get_repo_bucket(repo, deployment)
+    s3_cli        = s3_client(None, parse_workers)
+    journal       = open_journal(s3_bucket)
+    remover       = SubmissionRemover(s3_bucket, journal=journal)
+    source        = iter_submissions(bucket=s3_bucket, journal=journal)
+
+    def parse(entry):
+        sid, submission = entry
+        parse_submission(sid, submission, s3_bucket, s3_cli, journal)
+        return entry
+
+    def upload(entry):
+        sid, submission = entry
+        args = (sid, submission, s3_bucket, None, stream, journal)
+        return entry if upload_submission(*args) else None
+
+    def remove(entries):
+        for sid, submission in entries:
+            remover.add(sid, submission)
+        remover.flush()
+
+    try:
+        with remover, profiled('pipeline', s3_bucket.name):
+            Pipeline(source, name=s3_bucket.name) \
+                .then(parse, workers=parse_workers) \
+                .then(upload, workers=(workers or UPLOAD_WORKERS)) \
+                .batch(remove) \
+                .run()
+    finally:
+        journal and journal.close()
+    return _submission_count(remover.removed)
+
+
+def open_journal(s3_bucket) -> Optional[Journal]:
+    """
+    The processing journal for the queue, if JOURNAL_PATH is configured.
+
+    There is no journal for a dry run:  nothing is actually uploaded, so
+    recording submissions as uploaded would cause a later run to remove them
+    from the AWS bucket without uploading them.
+
+    Removed submissions which are older than JOURNAL_RETENTION are pruned.
+
+    :param s3.Bucket s3_bucket:
+
+    """
+    if DRY_RUN or not JOURNAL_PATH:
+        return None
+    journal = Journal(s3_bucket.name, JOURNAL_PATH)
+    journal.prune()
+    return journal
+
+
+def _report_readiness(index, orphans):
+    """
+    Record the readiness of the submissions of a listing and report the
+    orphans which are older than ORPHAN_AGE so that they can be dealt with.
+
+    :param ReadinessIndex index:
+    :param list[Orphan]   orphans:  Oldest first.
+
+    """
+    counts = index.counts()
+    tally('PackageOnlySubmissions', counts[Readiness.PackageOnly])
+    tally('DataOnlySubmissions', counts[Readiness.DataOnly])
+    stale = [orphan for orphan in orphans if orphan.age() >= ORPHAN_AGE]
+    tally('OrphanedSubmissions', len(stale))
+    if DEBUG and orphans:
+        incomplete = pluralize('SUBMISSION', len(orphans))
+        show(f"{len(orphans)} INCOMPLETE {incomplete} IN {index.name}")
+    if stale:
+        hours = ORPHAN_AGE / 3600
+        log_error(f"{index.name}: {len(stale)} orphaned over {hours:g}h")
+        for orphan in stale[:ORPHAN_REPORT_LIMIT]:
+            log_error(f"{index.name}: orphaned {orphan}")
+
+
+def _queue_name(repo, deployment) -> str:
+    """
+    Queue description for logging.
+
+    :param str repo:
+    :param str deployment:
+
+    """
+    queue = f"{repo} QUEUE {deployment}"
+    queue = f"{queue} [DRY RUN]" if DRY_RUN else queue
+    return queue.upper()
+
+
+def _submission_count(object_keys) -> int:
+    """
+    The number of submissions represented by a list of removed object keys.
+
+    :param list[str] object_keys:
+
+    """
+    return sum(1 for key in object_keys if key.endswith('.xml'))
 
 
 # =============================================================================
@@ -262,9 +934,140 @@ def process(repo=None, deployment=None):
 # =============================================================================
 
 
+def process_queues(
+        repos=None,
+        deployments=None,
+        checking=None,
+        clearing=None,
+        pausing=None,
+        resuming=None,
+        queue_workers=None,
+        **options) -> int:
+    """
+    Process (or check, clear, pause or resume) all indicated repository and
+    deployment combinations.
+
+    Combinations are processed concurrently by up to *queue_workers* threads;
+    output lines are then tagged with the queue they relate to.  A failure in
+    one combination does not affect the others.
+
+    :param list[str]|None repos:            Default: TARGET_REPOS.
+    :param list[str]|None deployments:      Default: DEPLOYMENTS.
+    :param bool|None      checking:         Only report pause state.
+    :param bool|None      clearing:         Remove pause/resume control files.
+    :param bool|None      pausing:          Pause processing.
+    :param bool|None      resuming:         Resume processing.
+    :param int|None       queue_workers:    Default: QUEUE_WORKERS.
+    :param options:                         Passed to process().
+
+    :return: The total number of submissions processed.
+    :rtype:  int
+
+    """
+    combinations = [
+        (repo, deployment)
+        for repo in (repos or TARGET_REPOS)
+        for deployment in (deployments or DEPLOYMENTS)
+    ]
+    if checking or clearing or pausing or resuming:
+        args = (checking, clearing, pausing, resuming)
+        control_queues(combinations, *args)
+        return 0
+    workers = max(1, min((queue_workers or QUEUE_WORKERS), len(combinations)))
+    if workers == 1:
+        total = 0
+        for repo, deployment in combinations:
+            total += process_queue(repo, deployment, **options)
+        return total
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = []
+        for repo, deployment in combinations:
+            tag = f"{repo}-{deployment}".upper()
+            job = pool.submit(process_queue, repo, deployment, tag, **options)
+            jobs.append(job)
+        return sum(job.result() for job in jobs)
+
+
+def process_queue(repo, deployment, tag=None, **options) -> int:
+    """
+    Process a single repository and deployment combination unless it is
+    paused.
+
+    :param str      repo:
+    :param str      deployment:
+    :param str|None tag:            Label for output lines.
+    :param options:                 Passed to process().
+
+    :return: The number of submissions processed.
+    :rtype:  int
+
+    """
+    count = 0
+    if shutdown_requested():
+        return count
+    leader = "\n" if DEBUG and not APPLICATION_DEPLOYED else ''
+    queue  = _queue_name(repo, deployment)
+    with output_tag(tag):
+        try:
+            if is_paused(repo, deployment):
+                show(f"{leader}*** PAUSED *** - {queue}")
+            else:
+                with collecting(Repo=repo, Deployment=deployment):
+                    count = process(repo, deployment, **options)
+                submissions = pluralize('SUBMISSION', count)
+                show(f"{leader}{count} {submissions} PROCESSED - {queue}")
+        except Exception as error:
+            log_error(f"{queue}: {error}")
+    return count
+
+
+def control_queues(
+        queues,
+        checking=None,
+        clearing=None,
+        pausing=None,
+        resuming=None):
+    """
+    Report (and optionally change) the pause state of queues.
+
+    The state of all queues comes from one listing of the control files per
+    deployment, and the change is made for all queues together.
+
+    :param list[tuple[str,str]] queues:     Pairs of repo and deployment.
+    :param bool|None            checking:   Only report pause state.
+    :param bool|None            clearing:   Remove pause/resume control files.
+    :param bool|None            pausing:    Pause processing.
+    :param bool|None            resuming:   Resume processing.
+
+    """
+    leader = "\n" if DEBUG and not APPLICATION_DEPLOYED else ''
+    _control.invalidate()
+    for repo, deployment in queues:
+        paused = is_paused(repo, deployment)
+        if clearing:
+            memo = 'CLEARING'
+        elif checking:
+            memo = 'PAUSED'         if paused else 'NOT PAUSED'
+        elif pausing:
+            memo = 'ALREADY PAUSED' if paused else 'PAUSING'
+        elif resuming:
+            memo = 'RESUMING'       if paused else 'ALREADY NOT PAUSED'
+        else:
+            memo = 'PAUSED'         if paused else 'NOT PAUSED'
+        show(f"{leader}*** {memo} *** - {_queue_name(repo, deployment)}")
+    if clearing:
+        _control.run(Action.Clear, queues)
+    elif pausing:
+        _control.run(Action.Pause, queues)
+    elif resuming:
+        _control.run(Action.Resume, queues)
+
+
 def main():
     repos = []
     deployments = []
+    options = {}
+    daemon = DAEMON
     checking = clearing = pausing = resuming = all_repos = None
 
     # Process command-line arguments.
@@ -283,43 +1086,47 @@ def main():
             repos.append(arg)
         elif arg in DEPLOYMENTS:
             deployments.append(arg)
+        elif arg == 'daemon':
+            daemon = True
+        elif arg == 'pipeline':
+            options['pipeline'] = True
+        elif arg == 'stream':
+            options['stream'] = True
+        elif arg.startswith('workers='):
+            options['workers'] = to_int(arg.split('=', 1)[1], UPLOAD_WORKERS)
+        elif arg.startswith('queue_workers='):
+            value = to_int(arg.split('=', 1)[1], QUEUE_WORKERS)
+            options['queue_workers'] = value
+        elif arg.startswith('parse_workers='):
+            value = to_int(arg.split('=', 1)[1], PARSE_WORKERS)
+            options['parse_workers'] = value
         else:
             raise RuntimeError(f"{arg}: invalid command-line option")
     if all_repos:
         repos = ALL_REPOS
 
-    # Prepare queue description for logging.
-    _queue = '{repo} QUEUE {deployment}'
-    _queue = f"{_queue} [DRY RUN]" if DRY_RUN else _queue
+    # Control operations are performed once.
+    if checking or clearing or pausing or resuming:
+        process_queues(
+            repos, deployments, checking, clearing, pausing, resuming
+        )
+        return
+
+    # Discover submissions from S3 events or by listing the AWS buckets.
+    if INTAKE_QUEUE:
+        intake  = Intake()
+        args    = (intake, repos, deployments)
+        task    = partial(process_intake, *args, **options)
+        maximum = POLL_MIN_INTERVAL  # Receives already wait for messages.
+    else:
+        task    = partial(process_queues, repos, deployments, **options)
+        maximum = POLL_MAX_INTERVAL
 
-    # Process all indicated repository/deployment combinations.
-    for repo in repos or TARGET_REPOS:
-        for deployment in deployments or DEPLOYMENTS:
-            leader = "\n" if DEBUG and not APPLICATION_DEPLOYED else ''
-            queue  = _queue.format(repo=repo, deployment=deployment).upper()
-            paused = is_paused(repo, deployment)
-            if clearing:
-                memo = 'CLEARING'
-            elif checking:
-                memo = 'PAUSED'         if paused else 'NOT PAUSED'
-            elif pausing:
-                memo = 'ALREADY PAUSED' if paused else 'PAUSING'
-            elif resuming:
-                memo = 'RESUMING'       if paused else 'ALREADY NOT PAUSED'
-            else:
-                memo = 'PAUSED'         if paused else None
-            if memo:
-                show(f"{leader}*** {memo} *** - {queue}")
-                if clearing:
-                    _run(Action.Clear, repo, deployment)
-                elif paused and resuming:
-                    _run(Action.Resume, repo, deployment)
-                elif not paused and pausing:
-                    _run(Action.Pause, repo, deployment)
-            else:
-                count       = process(repo, deployment)
-                submissions = pluralize('SUBMISSION', count)
-                show(f"{leader}{count} {submissions} PROCESSED - {queue}")
+    # Run once or continuously.
+    if daemon:
+        Daemon(task, maximum=maximum).run()
+    else:
+        task()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,275 @@
+# app/profiling.py
+#
+# Optional CPU (cProfile) and memory (tracemalloc) profiling of processing.
+#
+# Nothing here has any effect unless PROFILE is "cpu", "mem" or "both":  if
+# PROFILE is not set, profiled() returns a no-op context manager and
+# profile_submissions() returns the decorated function unchanged.
+
+
+import contextvars
+import cProfile
+import functools
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from contextlib import nullcontext
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+PROFILING = PROFILE_CPU or PROFILE_MEM
+
+# Number of stack frames recorded for each memory allocation.
+TRACEMALLOC_FRAMES = 10
+
+# Characters not used in report file names.
+UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]+')
+
+
+# =============================================================================
+# Variables
+# =============================================================================
+
+
+# The stage profile (if any) that submission profiles are added to.
+_stage = contextvars.ContextVar('profile_stage', default=None)
+
+# The CPU profiler currently enabled in each thread.
+_thread_data = threading.local()
+
+# Number of active memory profiles; tracing stops when the last one ends.
+_tracing = 0
+_tracing_lock = threading.Lock()
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Profile:
+    """
+    A profile of the work done within a block.
+
+    A CPU profile only covers the thread in which it is started, so the
+    profiles of submissions handled by worker threads within a stage are
+    added to the profile of that stage (see profile_submissions()).  Within a
+    thread, an inner profile suspends the outer one and is then added to it.
+
+    Memory profiles cover all threads:  the report lists the allocation sites
+    with the largest net growth during the block and with the most memory
+    still allocated at its end.  (Memory is not profiled for a block whose
+    results are not written.)
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, name, tag=None, write=True):
+        """
+        :param str      name:   Stage or submission name.
+        :param str|None tag:    Queue identification, e.g. the bucket name.
+        :param bool     write:  If False, results only go to the enclosing
+                                    stage profile.
+        """
+        self.name      = name
+        self.tag       = tag
+        self.write     = write
+        self._lock     = threading.Lock()
+        self._profiler = None   # type: Optional[cProfile.Profile]
+        self._outer    = None   # type: Optional[cProfile.Profile]
+        self._added    = []     # type: List[cProfile.Profile]
+        self._snapshot = None   # type: Optional[tracemalloc.Snapshot]
+        self._parent   = None   # type: Optional[Profile]
+        self._token    = None
+        self._tracing  = PROFILE_MEM and write
+
+    def __enter__(self):
+        self._parent = _stage.get()
+        self._token  = _stage.set(self)
+        if self._tracing:
+            _start_tracing()
+            self._snapshot = _take_snapshot()
+        if PROFILE_CPU:
+            self._outer    = getattr(_thread_data, 'profiler', None)
+            self._profiler = cProfile.Profile()
+            self._outer and self._outer.disable()
+            _thread_data.profiler = self._profiler
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *_):
+        if PROFILE_CPU:
+            self._profiler.disable()
+            _thread_data.profiler = self._outer
+            if self._outer:
+                self._outer.enable()
+            if self._parent:
+                self._parent.add(self._profiler)
+        _stage.reset(self._token)
+        try:
+            if self.write:
+                PROFILE_CPU and self._write_cpu()
+                PROFILE_MEM and self._write_mem()
+        except Exception as error:
+            log_error(f"profile {self.name}: {error}")
+        finally:
+            self._tracing and _stop_tracing()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def add(self, profiler):
+        """
+        Include the results of a profiler run in another thread.
+
+        :param cProfile.Profile profiler:
+
+        """
+        with self._lock:
+            self._added.append(profiler)
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _path(self, extension) -> str:
+        """
+        The report file for this profile, e.g.
+        "emma-ia-queue-staging.upload.20201201T120000.123.pstats".
+
+        :param str extension:
+
+        """
+        now   = time.time()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(now))
+        stamp = f"{stamp}.{int(now * 1000) % 1000:03d}"
+        parts = filter(None, [self.tag, self.name, stamp, extension])
+        name  = '.'.join(UNSAFE_NAME_CHARS.sub('_', str(p)) for p in parts)
+        return os.path.join(_profile_dir(), name)
+
+    def _write_cpu(self):
+        stats = pstats.Stats(self._profiler)
+        with self._lock:
+            for profiler in self._added:
+                stats.add(profiler)
+        path = self._path('pstats')
+        stats.dump_stats(path)
+        DEBUG and show(f"CPU PROFILE {path}")
+
+    def _write_mem(self):
+        snapshot = _take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        growth  = snapshot.compare_to(self._snapshot, 'lineno')
+        largest = snapshot.statistics('lineno')
+        lines   = [
+            f"{self.tag or ''} {self.name}".strip(),
+            f"traced memory: {current} bytes current, {peak} bytes peak",
+            '',
+            f"Top {PROFILE_TOP} allocation sites by growth:",
+            *[str(stat) for stat in growth[:PROFILE_TOP]],
+            '',
+            f"Top {PROFILE_TOP} allocation sites by size:",
+            *[str(stat) for stat in largest[:PROFILE_TOP]],
+        ]
+        path = self._path('alloc.txt')
+        with open(path, 'w') as file:
+            file.write(''.join(f"{line}\n" for line in lines))
+        DEBUG and show(f"MEMORY PROFILE {path}")
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def profiled(stage, tag=None):
+    """
+    A context manager which profiles a stage of processing if PROFILE is
+    set; otherwise a no-op.
+
+    :param str      stage:  Stage name, e.g. "upload".
+    :param str|None tag:    Queue identification, e.g. the bucket name.
+
+    """
+    return Profile(stage, tag) if PROFILING else nullcontext()
+
+
+def profile_submissions(func):
+    """
+    Decorator for functions taking a submission ID as their first argument:
+    if PROFILE is set, each call is profiled and added to the enclosing
+    stage profile (and, if PROFILE_SUBMISSIONS is set, also reported on its
+    own).  Otherwise the function is returned unchanged.
+
+    :param Callable func:
+
+    :rtype: Callable
+
+    """
+    if not PROFILING:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(sid, *args, **kwargs):
+        stage = _stage.get()
+        tag   = stage and stage.tag
+        name  = f"{func.__name__}.{sid}"
+        with Profile(name, tag, write=PROFILE_SUBMISSIONS):
+            return func(sid, *args, **kwargs)
+
+    return wrapper
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _profile_dir() -> str:
+    """
+    The directory for profile reports (created if necessary).
+    """
+    path = PROFILE_DIR or os.path.join(tempfile.gettempdir(), 'emma-profile')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    """
+    A snapshot of memory allocations, excluding those made by the profilers.
+    """
+    ignored = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+    ]
+    return tracemalloc.take_snapshot().filter_traces(ignored)
+
+
+def _start_tracing():
+    global _tracing
+    with _tracing_lock:
+        if not _tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing += 1
+
+
+def _stop_tracing():
+    global _tracing
+    with _tracing_lock:
+        _tracing = max(0, (_tracing - 1))
+        if not _tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,241 @@
+# app/ratelimit.py
+#
+# Adaptive limits on the rate of requests to remote services.
+
+
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# HTTP status codes which indicate that requests are being throttled.
+THROTTLE_STATUS = (429, 503)
+
+# Smallest fraction of the configured rates that throttling can reduce to,
+# and the fraction restored by each successful request.
+RATE_FLOOR    = 0.05
+RATE_INCREASE = 0.05
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """
+    The number of seconds indicated by a Retry-After header value, which can
+    be either a number of seconds or an HTTP date.
+
+    :param str|None value:
+
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value).timestamp()
+        return max(0.0, (moment - time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class TokenBucket:
+    """
+    Limits the average rate at which something (requests, bytes) is used.
+
+    A caller waits only while the bucket is "in debt", then takes what it
+    needs even if that puts the bucket into debt, so a large request (e.g. a
+    big file) is not delayed itself but delays the requests which follow it.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, rate, burst=None):
+        """
+        :param float      rate:     Units per second; 0 means unlimited.
+        :param float|None burst:    Maximum units saved up while idle
+                                        (default: one second's worth).
+        """
+        self._lock    = threading.Lock()
+        self._rate    = rate
+        self.burst    = burst
+        self._tokens  = self.capacity
+        self._updated = time.monotonic()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float):
+        with self._lock:
+            self._refill()
+            self._rate = value
+
+    @property
+    def capacity(self) -> float:
+        return self.burst or max(1.0, self._rate)
+
+    def acquire(self, amount=1):
+        """
+        Wait until the bucket is not in debt, then take *amount* from it.
+
+        :param float amount:
+
+        """
+        while True:
+            with self._lock:
+                if not self._rate:
+                    return
+                self._refill()
+                if self._tokens >= 0:
+                    self._tokens -= amount
+                    return
+                delay = -self._tokens / self._rate
+            time.sleep(delay)
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate:
+            earned = (now - self._updated) * self._rate
+            self._tokens = min(self.capacity, (self._tokens + earned))
+        self._updated = now
+
+
+class RateLimiter:
+    """
+    Request and byte rate limits for a service which adapt to the service's
+    responses:  each throttling response (429/503 or any Retry-After header)
+    halves the rates (down to RATE_FLOOR of the configured rates) and holds
+    all requests for the time given by Retry-After; each successful request
+    restores RATE_INCREASE of the configured rates.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, name, requests=0, size=0):
+        """
+        :param str   name:          Service name for messages.
+        :param float requests:      Requests per second; 0 means unlimited.
+        :param float size:          Bytes per second; 0 means unlimited.
+        """
+        self.name      = name
+        self.requests  = requests
+        self.size      = size
+        self.scale     = 1.0
+        self._lock     = threading.Lock()
+        self._held     = 0.0
+        self._requests = TokenBucket(requests)
+        self._bytes    = TokenBucket(size)
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def acquire(self, size=0):
+        """
+        Wait until a request sending *size* bytes can be made.
+
+        :param int size:
+
+        """
+        delay = self._held - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._requests.acquire(1)
+        self._bytes.acquire(size)
+
+    def succeeded(self):
+        with self._lock:
+            if self.scale < 1.0:
+                self._set_scale(self.scale + RATE_INCREASE)
+
+    def throttled(self, retry_after=None):
+        """
+        :param float|None retry_after:  Seconds to hold all requests.
+        """
+        with self._lock:
+            self._set_scale(self.scale / 2)
+            if retry_after:
+                self._held = max(self._held, time.monotonic() + retry_after)
+        wait = f"; waiting {retry_after:.0f} seconds" if retry_after else ''
+        log_error(f"{self.name} THROTTLED - rate {self.scale:.0%}{wait}")
+
+    def call(self, func, *args, size=0, **kwargs):
+        """
+        Make a request within the limits and adjust the limits according to
+        the response (or the exception raised for it).
+
+        :param Callable func:   Makes the request.
+        :param args:            Passed to *func*.
+        :param int      size:   Bytes sent by the request.
+        :param kwargs:          Passed to *func*.
+
+        :return: The result of *func*.
+
+        """
+        self.acquire(size)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            self._check(getattr(error, 'response', None))
+            raise
+        responses = result if isinstance(result, list) else [result]
+        if not any([self._check(response) for response in responses]):
+            self.succeeded()
+        return result
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _set_scale(self, scale):
+        self.scale = min(1.0, max(RATE_FLOOR, scale))
+        self._requests.rate = self.requests * self.scale
+        self._bytes.rate    = self.size * self.scale
+
+    def _check(self, response) -> bool:
+        """
+        Note whether a response indicates throttling.
+
+        :param requests.Response|None response:
+
+        """
+        status  = getattr(response, 'status_code', None)
+        headers = getattr(response, 'headers', None) or {}
+        delay   = parse_retry_after(headers.get('Retry-After'))
+        if (status in THROTTLE_STATUS) or (delay is not None):
+            self.throttled(delay)
+            return True
+        return False
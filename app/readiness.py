@@ -0,0 +1,213 @@
+# app/readiness.py
+#
+# Readiness of the submissions found by listing an AWS bucket.
+
+
+import threading
+import time
+
+from enum import Enum, auto
+
+from app.sip_table import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Most orphans listed individually when reporting.
+ORPHAN_REPORT_LIMIT = 20
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class Readiness(Enum):
+    Complete    = auto()
+    PackageOnly = auto()
+    DataOnly    = auto()
+
+
+class Orphan:
+    """
+    One half of a submission whose other object has not (yet) arrived.
+    """
+
+    __slots__ = ('sid', 'key', 'readiness', 'first_seen', 'last_modified')
+
+    def __init__(self, sid, key, readiness, first_seen, last_modified=None):
+        """
+        :param str        sid:
+        :param str        key:              AWS object key.
+        :param Readiness  readiness:        PackageOnly or DataOnly.
+        :param float      first_seen:       When first listed (epoch seconds).
+        :param float|None last_modified:    When the object was put in the
+                                                bucket (epoch seconds).
+        """
+        self.sid           = sid
+        self.key           = key
+        self.readiness     = readiness
+        self.first_seen    = first_seen
+        self.last_modified = last_modified
+
+    def age(self, now=None) -> float:
+        """
+        Seconds since the object arrived (or, if that is not known, since it
+        was first listed).
+
+        :param float|None now:  Default: the current time.
+
+        """
+        since = self.first_seen
+        if self.last_modified is not None:
+            since = min(since, self.last_modified)
+        return (time.time() if now is None else now) - since
+
+    def __repr__(self) -> str:
+        hours = self.age() / 3600
+        return f"{self.key} ({self.readiness.name}, {hours:.1f}h)"
+
+
+class ReadinessIndex:
+    """
+    The readiness of each submission in a bucket as of its latest listing.
+
+    The objects of a listing are given to add() as they arrive.  A submission
+    is complete as soon as both its package and its data file have been seen
+    (and only complete submissions should go on to be parsed and uploaded);
+    the index just counts these.  The halves which are still unpaired when
+    the listing ends become the orphans of the bucket.
+
+    The same index is used for successive listings of a bucket (e.g. by a
+    long-running process) so that an orphan keeps the time it was first
+    seen.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, name):
+        """
+        :param str name:    Bucket name.
+        """
+        self.name      = name
+        self._lock     = threading.Lock()
+        self._counts   = dict.fromkeys(Readiness, 0)
+        self._orphans  = {}  # type: Dict[str, Orphan]
+        self._halves   = {}  # type: Dict[str, tuple]
+        self._complete = 0
+        self._started  = None
+
+    # =========================================================================
+    # :section: Listing
+    # =========================================================================
+
+    def begin(self):
+        """
+        Start a new listing of the bucket.
+        """
+        self._halves   = {}
+        self._complete = 0
+        self._started  = time.time()
+
+    def add(self, sid, part, key, last_modified=None) -> Readiness:
+        """
+        Note an object of the listing.
+
+        :param str                 sid:
+        :param str                 part:            From sip_part(key).
+        :param str                 key:
+        :param datetime|float|None last_modified:
+
+        :return: The readiness of the submission so far.
+        :rtype:  Readiness
+
+        """
+        if sid in self._halves and self._halves[sid][1] != part:
+            del self._halves[sid]
+            self._complete += 1
+            return Readiness.Complete
+        if hasattr(last_modified, 'timestamp'):
+            last_modified = last_modified.timestamp()
+        self._halves[sid] = (key, part, last_modified)
+        return _readiness(part)
+
+    def finish(self) -> List[Orphan]:
+        """
+        End the listing:  the halves which were not paired replace the
+        previous orphans.
+
+        :return: The current orphans, oldest first.
+        :rtype:  list[Orphan]
+
+        """
+        counts  = dict.fromkeys(Readiness, 0)
+        orphans = {}
+        with self._lock:
+            for sid, (key, part, modified) in self._halves.items():
+                previous  = self._orphans.get(sid)
+                seen      = previous.first_seen if previous else self._started
+                readiness = _readiness(part)
+                counts[readiness] += 1
+                orphans[sid] = Orphan(sid, key, readiness, seen, modified)
+            counts[Readiness.Complete] = self._complete
+            self._counts  = counts
+            self._orphans = orphans
+            self._halves  = {}
+        return self.orphans()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def counts(self) -> Dict[Readiness, int]:
+        """
+        The number of submissions of each kind in the latest listing.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def orphans(self, min_age=0) -> List[Orphan]:
+        """
+        Orphans of at least the given age, oldest first.
+
+        :param float min_age:   Seconds.
+
+        """
+        now = time.time()
+        with self._lock:
+            found = list(self._orphans.values())
+        found = [orphan for orphan in found if orphan.age(now) >= min_age]
+        return sorted(found, key=lambda orphan: -orphan.age(now))
+
+    def readiness(self, sid) -> Optional[Readiness]:
+        """
+        The readiness of a submission which was unpaired in the latest
+        listing (None if it was complete or not listed).
+
+        :param str sid:
+
+        """
+        with self._lock:
+            orphan = self._orphans.get(sid)
+        return orphan and orphan.readiness
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _readiness(part) -> Readiness:
+    """
+    The readiness of a submission of which only the given part is present.
+
+    :param str part:    'package' or 'data_file'
+
+    """
+    return Readiness.PackageOnly if part == 'package' else Readiness.DataOnly
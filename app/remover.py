@@ -0,0 +1,174 @@
+# app/remover.py
+#
+# Incremental removal of completed submissions from an AWS S3 bucket.
+
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.aws_s3  import *
+from app.journal import *
+from app.metrics import *
+from app.sip     import *
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class SubmissionRemover:
+    """
+    Removes completed submissions from an AWS S3 bucket in batches while
+    processing of other submissions continues.
+
+    Submissions are accumulated as they are added; each full batch is handed
+    to a pool of threads so that several DeleteObjects requests can be in
+    flight at once.  The outcome for each submission is recorded in its Sip
+    (*removed* and, on failure, *error*).
+
+    Usage:
+        with SubmissionRemover(bucket) as remover:
+            for sid, submission in ...:
+                remover.add(sid, submission)
+        removed_keys = remover.removed
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(
+            self,
+            bucket,
+            batch_size=REMOVE_BATCH_SIZE,
+            workers=REMOVE_WORKERS,
+            dry_run=DRY_RUN,
+            journal=None):
+        """
+        :param str|s3.Bucket bucket:        Target bucket name or instance.
+        :param int           batch_size:    Submissions per request (limited to
+                                                half of S3_DELETE_LIMIT since
+                                                each has two object keys).
+        :param int           workers:       Concurrent requests.
+        :param bool          dry_run:       Only report eligible objects.
+        :param Journal|None  journal:       If given, removals are recorded.
+        """
+        self.bucket     = get_s3_bucket(bucket)
+        self.batch_size = max(1, min(batch_size, (S3_DELETE_LIMIT // 2)))
+        self.dry_run    = dry_run
+        self.journal    = journal
+        self._pool      = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._lock      = threading.Lock()
+        self._pending   = []
+        self._added     = set()
+        self._removed   = []
+        self._jobs      = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    @property
+    def removed(self) -> List[str]:
+        """
+        The object keys removed so far (or eligible for removal if dry_run).
+        """
+        with self._lock:
+            return list(self._removed)
+
+    def add(self, sid, submission):
+        """
+        Schedule removal of a completed submission; submissions which have
+        already been added are ignored.
+
+        :param str sid:
+        :param Sip submission:
+
+        """
+        with self._lock:
+            if sid in self._added:
+                return
+            self._added.add(sid)
+            self._pending.append((sid, submission))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Start removal of the submissions added since the last batch.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if batch:
+                job = self._pool.submit(in_context(self._remove), batch)
+                self._jobs.append(job)
+
+    def close(self) -> List[str]:
+        """
+        Remove any remaining submissions and wait for all batches to finish.
+        (Closing again has no further effect.)
+
+        :return: The object keys that were removed.
+
+        """
+        self.flush()
+        self._pool.shutdown(wait=True)
+        jobs, self._jobs = self._jobs, []
+        for job in jobs:
+            error = job.exception()
+            error and log_error(f"{self.bucket.name}: {error}")
+        return self.removed
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _remove(self, batch):
+        """
+        Remove the objects for a batch of submissions and record the outcome
+        of each.
+
+        :param list[tuple[str,Sip]] batch:
+
+        """
+        object_keys = []
+        for _, submission in batch:
+            object_keys.extend(filter(None, [
+                submission.package,
+                submission.data_file
+            ]))
+        if DEBUG:
+            deleting = 'ELIGIBLE FOR DELETION' if self.dry_run else 'DELETING'
+            show_header(f"{deleting} {self.bucket.name} OBJECTS:")
+            show(object_keys)
+        failures = {}
+        if not self.dry_run:
+            with timed('RemoveLatency'):
+                failures = remove_from_s3_bucket(object_keys, self.bucket)
+        removed = []
+        for sid, submission in batch:
+            keys   = filter(None, [submission.package, submission.data_file])
+            errors = [f"{k}: {failures[k]}" for k in keys if k in failures]
+            if errors:
+                submission.error = '; '.join(errors)
+                log_error(f'removing "{sid}": {submission.error}')
+                tally('RemoveErrors')
+            else:
+                submission.removed = not self.dry_run
+                tally('RemovedSubmissions')
+                removed.extend([submission.package, submission.data_file])
+                if submission.removed and self.journal:
+                    self.journal.record(sid, State.Deleted)
+        self.journal and self.journal.flush()
+        with self._lock:
+            self._removed.extend(filter(None, removed))
@@ -0,0 +1,223 @@
+# app/retry.py
+#
+# Retrying of failed requests to remote services.
+
+
+import random
+import threading
+import time
+
+from http.client import HTTPException
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# HTTP status codes which indicate a temporary condition.
+RETRYABLE_STATUS = (408, 425, 429, 500, 502, 503, 504)
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request to a service which is failing.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of requests to a service so that, once the
+    service appears to be down, further requests can be avoided instead of
+    each waiting for its own timeout.
+
+    After *threshold* consecutive failures the breaker "opens"; requests are
+    refused until *reset* seconds have passed, after which a single trial
+    request is allowed.  A success closes the breaker; a failure re-opens it.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(self, name, threshold=5, reset=300):
+        """
+        :param str   name:          Service name for messages.
+        :param int   threshold:     Consecutive failures which open it.
+        :param float reset:         Seconds before a trial request.
+        """
+        self.name      = name
+        self.threshold = max(1, threshold)
+        self.reset     = reset
+        self._lock     = threading.Lock()
+        self._failures = 0
+        self._opened   = None  # type: Optional[float]
+        self._trial    = False
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Whether requests are currently being refused.
+        """
+        with self._lock:
+            return self._refusing()
+
+    def allow(self) -> bool:
+        """
+        Indicate whether a request may be made now.  When the reset time has
+        passed, only the first caller is allowed through until the outcome of
+        its request is known.
+        """
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._refusing():
+                return False
+            self._trial = True
+            return True
+
+    def succeeded(self):
+        with self._lock:
+            if self._opened is not None:
+                show(f"*** {self.name} AVAILABLE AGAIN ***")
+            self._failures = 0
+            self._opened   = None
+            self._trial    = False
+
+    def failed(self):
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial or (self._opened is None)
+            if reopen and (self._failures >= self.threshold):
+                if not self._trial:
+                    log_error(f"{self.name} UNAVAILABLE - circuit open")
+                self._opened = time.monotonic()
+            self._trial = False
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _refusing(self) -> bool:
+        if self._opened is None:
+            return False
+        return self._trial or (time.monotonic() - self._opened) < self.reset
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def error_status(error) -> Optional[int]:
+    """
+    The HTTP status associated with an exception (if any).
+
+    :param Exception error:
+
+    """
+    response = getattr(error, 'response', None)
+    status   = getattr(response, 'status_code', None)
+    if status is None and isinstance(response, dict):  # botocore ClientError
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return status
+
+
+def is_retryable(error) -> bool:
+    """
+    Indicate whether a failed request might succeed if it is repeated.
+
+    Failures to connect or to get a complete response, and responses with a
+    server error or throttling status, are retryable.  Other responses (e.g.
+    a 4xx for a bad request) are not.
+
+    :param Exception error:
+
+    """
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (ConnectionError, TimeoutError, HTTPException)):
+        return True
+    name = type(error).__name__
+    return any(k in name for k in ('Connection', 'Timeout', 'ChunkedEncoding'))
+
+
+def backoff_delay(
+        attempt,
+        base=RETRY_BASE_DELAY,
+        cap=RETRY_MAX_DELAY) -> float:
+    """
+    Seconds to wait before the given retry:  a random time up to a limit
+    which doubles with each attempt ("full jitter"), so that clients which
+    failed together do not retry together.
+
+    :param int   attempt:   1 for the first retry.
+    :param float base:      Limit for the first retry.
+    :param float cap:       Maximum limit.
+
+    """
+    return random.uniform(0, min(cap, (base * (2 ** (attempt - 1)))))
+
+
+def retry(
+        func,
+        *args,
+        attempts=RETRY_ATTEMPTS,
+        breaker=None,
+        retryable=is_retryable,
+        **kwargs):
+    """
+    Call a function, repeating the call with jittered exponential backoff
+    while it raises a retryable exception.
+
+    :param Callable            func:
+    :param args:                            Passed to *func*.
+    :param int                 attempts:    Maximum number of calls.
+    :param CircuitBreaker|None breaker:     If given, the call is not made
+                                                while it is open, and the
+                                                outcome is reported to it.
+    :param Callable            retryable:   Classifies exceptions.
+    :param kwargs:                          Passed to *func*.
+
+    :raises CircuitOpenError:   If *breaker* is refusing requests.
+    :raises Exception:          The last exception raised by *func*.
+
+    :return: The result of *func*.
+
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} unavailable")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            temporary = retryable(error)
+            if breaker:
+                breaker.failed() if temporary else breaker.succeeded()
+            if not temporary or (attempt >= attempts):
+                raise
+            if breaker and breaker.is_open:
+                message = f"{breaker.name} unavailable: {error}"
+                raise CircuitOpenError(message) from error
+            delay = backoff_delay(attempt)
+            log_error(f"{error} - retrying in {delay:.1f} seconds")
+            time.sleep(delay)
+        else:
+            breaker and breaker.succeeded()
+            return result
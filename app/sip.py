@@ -3,20 +3,62 @@
 # A SipTable entry.
 
 
+import re
+import sys
+
 from app.common import *
 
 
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Object key extension patterns.
+EXTENSION         = re.compile(r'\.[^.]+$')
+PACKAGE_EXTENSION = re.compile(r'\.xml$')
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
 class Sip:
     """
     A submission information package instance, which includes the AWS object
     keys associated with the submission, as well as dynamic information used to
     manage processing.
+
+    A backlog may have hundreds of thousands of these, so each one is kept
+    small:  there is no instance dict, and the object keys are not stored but
+    are made from the SID (shared with the table key) and the extension of
+    each part (one copy of each distinct extension for all instances).
     """
 
+    __slots__ = (
+        '_sid',
+        '_package_ext',
+        '_data_ext',
+        '_completed',
+        '_removed',
+        '_error',
+        '_metadata',
+    )
+
+    _keys = ('package', 'data_file')
+
     # =========================================================================
     # :section: Properties
     # =========================================================================
 
+    @property
+    def sid(self) -> Optional[str]:
+        """
+        The submission ID (None until an object key has been given).
+        """
+        return self._sid
+
     @property
     def completed(self) -> bool:
         """
@@ -31,6 +73,34 @@ class Sip:
         """
         self._completed = value
 
+    @property
+    def removed(self) -> bool:
+        """
+        Whether the associated objects have been removed from the AWS bucket.
+        """
+        return self._removed
+
+    @removed.setter
+    def removed(self, value: bool):
+        """
+        Indicate if the associated objects have been removed from AWS.
+        """
+        self._removed = value
+
+    @property
+    def error(self) -> Optional[str]:
+        """
+        The reason the associated objects could not be removed from AWS.
+        """
+        return self._error
+
+    @error.setter
+    def error(self, value: Optional[str]):
+        """
+        Record a failure to remove the associated objects from AWS.
+        """
+        self._error = value
+
     @property
     def metadata(self) -> Optional[dict]:
         """
@@ -50,63 +120,107 @@ class Sip:
         """
         The elements of the submission information - package plus data file.
         """
-        return self._entry
-
-    _keys = ['package', 'data_file']
+        return {part: self[part] for part in self._keys}
 
     @property
     def package(self) -> Optional[str]:
         """
         The name (AWS object key) of the package object.
         """
-        return self._entry.get('package')
+        ext = self._package_ext
+        return None if ext is None else f"{self._sid}{ext}"
 
     @property
     def data_file(self) -> Optional[str]:
         """
         The name (AWS object key) of the data file.
         """
-        return self._entry.get('data_file')
+        ext = self._data_ext
+        return None if ext is None else f"{self._sid}{ext}"
 
     # =========================================================================
     # :section:
     # =========================================================================
 
-    def __init__(self, values=None, **kwargs):
-        self._completed = False
-        self._metadata  = None
-        self._entry     = {}
+    def __init__(self, values=None, sid=None, **kwargs):
+        """
+        :param dict|Sip|None values:    Object key for each part.
+        :param str|None      sid:       Submission ID; if not given, taken
+                                            from the first object key.
+        :param kwargs:                  Object key for each part if *values*
+                                            is not given.
+        """
+        self._sid         = sid
+        self._package_ext = None
+        self._data_ext    = None
+        self._completed   = False
+        self._removed     = False
+        self._error       = None
+        self._metadata    = None
         if isinstance(values, Sip):
-            values = values.entry
+            self._sid         = values.sid
+            self._package_ext = values._package_ext
+            self._data_ext    = values._data_ext
+            return
         elif not isinstance(values, dict):
             values = kwargs
         for part in self._keys:
-            self._entry[part] = values[part] if part in values else None
+            if values.get(part):
+                self[part] = values[part]
 
     def __len__(self) -> int:
-        p = self.package
-        d = self.data_file
-        return 2 if (p and d) else 1 if (p or d) else 0
+        p = self._package_ext is not None
+        d = self._data_ext is not None
+        return p + d
 
     def __getitem__(self, part) -> Optional[str]:
         if not isinstance(part, str):
             raise TypeError(f'part must be "str" not "{part.__class__}"')
-        if part not in self._keys:
-            raise KeyError(f'part must be in {self._keys}')
-        return self._entry[part]
+        elif part == 'package':
+            return self.package
+        elif part == 'data_file':
+            return self.data_file
+        raise KeyError(f'part must be in {list(self._keys)}')
 
     def __setitem__(self, part, value) -> Optional[str]:
-        self._entry[part] = value
-        return self._entry[part]
+        if part not in self._keys:
+            raise KeyError(f'part must be in {list(self._keys)}')
+        ext = self._extension(value) if value else None
+        if part == 'package':
+            self._package_ext = ext
+        else:
+            self._data_ext = ext
+        return self[part]
 
     def __delitem__(self, part):
         raise RuntimeError(f'cannot delete "{part}"')
 
     def __iter__(self):
-        return iter(self._entry)
+        return iter(self._keys)
 
     def __contains__(self, part) -> bool:
         return not not self[part]
 
     def __repr__(self) -> str:
-        return pp.pformat(self._entry)
+        return pp.pformat(self.entry)
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _extension(self, object_key) -> str:
+        """
+        The extension of an object key of this submission, setting the
+        submission ID if it is not yet known.
+
+        :param str object_key:
+
+        """
+        if self._sid is None:
+            self._sid = EXTENSION.sub('', object_key)
+        sid   = self._sid
+        ext   = object_key[len(sid):]
+        valid = object_key.startswith(sid)
+        if not valid or (ext and not EXTENSION.match(ext)):
+            raise ValueError(f'"{object_key}" is not an object of "{sid}"')
+        return sys.intern(ext)
@@ -6,12 +6,40 @@
 from app.sip import *
 
 
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def sip_part(object_key) -> Tuple[str, str]:
+    """
+    The submission ID and the Sip part ('package' or 'data_file') indicated
+    by the name of a submission object.
+
+    :param str object_key:
+
+    """
+    sid  = EXTENSION.sub('', object_key)
+    part = 'package' if PACKAGE_EXTENSION.search(object_key) else 'data_file'
+    return sid, part
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
 class SipTable:
     """
     A table of entries keyed by SID (submission ID) which are associated with
     the submissions found in the designated AWS bucket.
+
+    Looking up a SID which is not in the table is an error (as for a dict);
+    use add() to create an entry.
     """
 
+    __slots__ = ('_table',)
+
     # =========================================================================
     # :section:
     # =========================================================================
@@ -23,13 +51,13 @@ class SipTable:
         return len(self._table)
 
     def __getitem__(self, sid) -> Sip:
-        if sid not in self._table:
-            self._table[sid] = Sip()
         return self._table[sid]
 
     def __setitem__(self, sid, value) -> Sip:
-        self._table[sid] = value if isinstance(value, Sip) else Sip(value)
-        return self._table[sid]
+        if not isinstance(value, Sip):
+            value = Sip(value, sid=sid)
+        self._table[sid] = value
+        return value
 
     def __delitem__(self, sid):
         del self._table[sid]
@@ -50,6 +78,21 @@ class SipTable:
     # :section:
     # =========================================================================
 
+    def get(self, sid, default=None) -> Optional[Sip]:
+        return self._table.get(sid, default)
+
+    def add(self, sid) -> Sip:
+        """
+        The entry for the SID, created if necessary.
+
+        :param str sid:
+
+        """
+        submission = self._table.get(sid)
+        if submission is None:
+            submission = self._table[sid] = Sip(sid=sid)
+        return submission
+
     def items(self) -> ItemsView[str, Sip]:
         return self._table.items()
 
@@ -63,8 +106,11 @@ class SipTable:
     # :section:
     # =========================================================================
 
-    def submission_ids(self) -> List[str]:
-        return list(self.keys())
+    # These are views of the table rather than copies; use list() to get a
+    # copy if the table will be changed while iterating.
 
-    def sips(self) -> List[Sip]:
-        return list(self.values())
+    def submission_ids(self) -> KeysView[str]:
+        return self._table.keys()
+
+    def sips(self) -> ValuesView[Sip]:
+        return self._table.values()
@@ -0,0 +1,162 @@
+# app/stream.py
+#
+# Read-ahead wrapper for streaming data from one service to another.
+
+
+import io
+import queue
+import threading
+
+from app.common import *
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class ReadAheadStream(io.RawIOBase):
+    """
+    A read-only file-like object wrapping a non-seekable source stream (e.g.
+    the StreamingBody of an S3 GET response).
+
+    A background thread reads from the source into a bounded buffer of at most
+    *depth* chunks, so that reading from the source overlaps with whatever the
+    consumer is doing with the data it has already received (e.g. sending it
+    on to IA) without holding more than a few chunks in memory.
+
+    Because the data is not retained, the stream cannot be rewound once it has
+    been read from.  To satisfy consumers which determine the size of a file
+    by seeking to the end, seeking is supported until the first read.
+
+    """
+
+    # =========================================================================
+    # :section:
+    # =========================================================================
+
+    def __init__(
+            self,
+            source,
+            size,
+            name=None,
+            chunk_size=STREAM_CHUNK_SIZE,
+            depth=STREAM_BUFFER_CHUNKS,
+            digest=None):
+        """
+        :param io.RawIOBase source:     Any object with a read() method.
+        :param int          size:       Total number of bytes in *source*.
+        :param str|None     name:       Reported as the "file name".
+        :param int          chunk_size: Bytes per read from *source*.
+        :param int          depth:      Maximum number of buffered chunks.
+        :param hashlib.Hash digest:     If given, updated with the data as it
+                                            is read from *source*.
+        """
+        super().__init__()
+        self.name       = name
+        self.size       = size
+        self.chunk_size = max(1, chunk_size)
+        self.consumed   = 0
+        self.digest     = digest
+        self._source    = source
+        self._buffer    = queue.Queue(maxsize=max(1, depth))
+        self._pending   = memoryview(b'')
+        self._position  = 0
+        self._at_eof    = False
+        self._stop      = threading.Event()
+        self._reader    = None
+
+    # =========================================================================
+    # :section: io.RawIOBase overrides
+    # =========================================================================
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return not self.consumed
+
+    def tell(self) -> int:
+        return self._position + self.consumed
+
+    def seek(self, offset, whence=io.SEEK_SET) -> int:
+        if self.consumed:
+            raise io.UnsupportedOperation('stream cannot be rewound')
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"{whence}: invalid whence")
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position:
+            if self._position >= self.size:
+                return 0  # Positioned at the end to determine the size.
+            raise io.UnsupportedOperation('stream can only be read from 0')
+        if not self._pending and not self._at_eof:
+            self._pending = memoryview(self._next_chunk())
+            self._at_eof  = not self._pending
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending  = self._pending[count:]
+        self.consumed += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            if self._reader:
+                self._reader.join()
+            close = getattr(self._source, 'close', None)
+            close and close()
+        super().close()
+
+    # =========================================================================
+    # :section: Internal methods
+    # =========================================================================
+
+    def _next_chunk(self) -> bytes:
+        """
+        Get the next chunk of data from the read-ahead buffer, starting the
+        background reader on first use.
+        """
+        if not self._reader:
+            name = f"read-ahead-{self.name or id(self)}"
+            self._reader = threading.Thread(target=self._read_ahead, name=name)
+            self._reader.daemon = True
+            self._reader.start()
+        chunk = self._buffer.get()
+        if isinstance(chunk, Exception):
+            self._at_eof = True
+            raise chunk
+        return chunk
+
+    def _read_ahead(self):
+        """
+        Fill the buffer from the source until end-of-data or close().
+        """
+        chunk = None
+        while chunk != b'' and not self._stop.is_set():
+            try:
+                chunk = self._source.read(self.chunk_size) or b''
+            except Exception as error:
+                chunk = b''
+                self._put(error)
+            else:
+                self.digest and self.digest.update(chunk)
+                self._put(chunk)
+
+    def _put(self, item):
+        """
+        Add to the buffer, giving up if the stream is closed while waiting.
+        """
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
@@ -3,6 +3,11 @@
 # Utility functions.
 
 
+import contextvars
+import functools
+import importlib
+import sys
+import types
 import typing
 
 
@@ -83,8 +88,60 @@ def to_tuple(value, default=None) -> tuple:
     return to_tuple(default)
 
 
+def to_int(value, default=0) -> int:
+    """
+    Transform value to an int, or the default if value is blank or invalid.
+    """
+    try:
+        return int(value) if is_present(value) else default
+    except (TypeError, ValueError):
+        return default
+
+
+def in_context(func) -> typing.Callable:
+    """
+    Bind func to a copy of the current context so that context variables set
+    by the caller are seen when it is run in another thread.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def lazy_module(name) -> types.ModuleType:
+    """
+    A stand-in for a module which imports the module when one of its
+    attributes is first used, so that the cost of loading a large dependency
+    is only paid by code paths which need it.
+
+    The import is done by importlib (which serializes concurrent imports of
+    the same module) so the stand-in can safely be used from any thread.
+
+    :param str name:    Fully-qualified module name.
+
+    """
+    return sys.modules.get(name) or _LazyModule(name)
+
+
 def pluralize(value: str, count: int = 0) -> str:
     value  = value.strip() if value else ''
     single = (count == 1) or not value or value.casefold().endswith('s')
     suffix = '' if single else 'S' if value[-1].isupper() else 's'
     return f"{value}{suffix}"
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class _LazyModule(types.ModuleType):
+    """
+    See lazy_module().
+    """
+
+    def __getattr__(self, attr):
+        module = sys.modules.get(self.__name__)
+        module = module or importlib.import_module(self.__name__)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name__!r}>"
@@ -4,8 +4,9 @@
 
 
 import os
+import tempfile
 
-from app.util import is_true
+from app.util import is_true, to_int
 
 
 # =============================================================================
@@ -26,3 +27,131 @@ else:
     DEBUG      = DRY_RUN or AWS_DEBUG or EMMA_DEBUG or IA_DEBUG
 
 APPLICATION_DEPLOYED = not not os.getenv('AWS_REGION')
+
+# Running as an AWS Lambda function, where only the temporary directory is
+# writable (relative journal and digest store locations are placed there).
+AWS_LAMBDA = not not os.getenv('AWS_LAMBDA_FUNCTION_NAME')
+
+# Number of submissions transferred to IA concurrently.
+UPLOAD_WORKERS = max(1, to_int(os.getenv('UPLOAD_WORKERS'), 1))
+
+# Number of submission information packages fetched from AWS concurrently.
+PARSE_WORKERS = max(1, to_int(os.getenv('PARSE_WORKERS'), 1))
+
+# Number of ranges of the AWS bucket key space which are listed in parallel.
+LIST_SHARDS = max(1, to_int(os.getenv('LIST_SHARDS'), 1))
+
+# Key prefix under which those ranges are split over 0-9a-z (e.g. "u" if each
+# submission ID starts with "u"); if not given, the bucket is probed to find
+# the leading characters shared by keys and the characters which follow them.
+LIST_SHARD_PREFIX = os.getenv('LIST_SHARD_PREFIX')
+
+# Run each submission through the stages of processing as a stream rather than
+# completing each stage for all submissions before starting the next.
+PIPELINE = is_true(os.getenv('PIPELINE'))
+
+# Number of submissions that may wait between streaming pipeline stages.
+PIPELINE_DEPTH = max(1, to_int(os.getenv('PIPELINE_DEPTH'), 8))
+
+# Maximum number of submissions removed from the AWS bucket in one request, and
+# the number of such requests which may be in progress at once.
+REMOVE_BATCH_SIZE = max(1, to_int(os.getenv('REMOVE_BATCH_SIZE'), 100))
+REMOVE_WORKERS    = max(1, to_int(os.getenv('REMOVE_WORKERS'), 4))
+
+# Stream data files from AWS to IA without staging them on local disk.
+STREAM_UPLOAD = is_true(os.getenv('STREAM_UPLOAD'))
+
+# Bytes per read when streaming, and the number of reads buffered in memory.
+STREAM_CHUNK_SIZE    = max(1, to_int(os.getenv('STREAM_CHUNK_SIZE'), 8 << 20))
+STREAM_BUFFER_CHUNKS = max(1, to_int(os.getenv('STREAM_BUFFER_CHUNKS'), 4))
+
+# Data files of at least RANGED_DOWNLOAD_THRESHOLD bytes are downloaded as
+# RANGED_DOWNLOAD_PARTS concurrent byte ranges.
+RANGED_DOWNLOAD_THRESHOLD = os.getenv('RANGED_DOWNLOAD_THRESHOLD')
+RANGED_DOWNLOAD_THRESHOLD = to_int(RANGED_DOWNLOAD_THRESHOLD, 64 << 20)
+RANGED_DOWNLOAD_PARTS     = to_int(os.getenv('RANGED_DOWNLOAD_PARTS'), 8)
+
+# Minimum connection pool size of the shared AWS clients and resources (the
+# botocore default is 10); a pool is enlarged as needed for concurrent workers.
+AWS_MAX_POOL_CONNECTIONS = to_int(os.getenv('AWS_MAX_POOL_CONNECTIONS'), 10)
+AWS_MAX_POOL_CONNECTIONS = max(1, AWS_MAX_POOL_CONNECTIONS)
+
+# Location of the processing journal; if not given, progress is not recorded.
+JOURNAL_PATH = os.getenv('JOURNAL_PATH')
+if JOURNAL_PATH and AWS_LAMBDA:
+    JOURNAL_PATH = os.path.join(tempfile.gettempdir(), JOURNAL_PATH)
+
+# Maximum number of journal entries buffered and seconds between writes.
+JOURNAL_BATCH_SIZE     = max(1, to_int(os.getenv('JOURNAL_BATCH_SIZE'), 100))
+JOURNAL_FLUSH_INTERVAL = to_int(os.getenv('JOURNAL_FLUSH_INTERVAL'), 2)
+
+# Run continuously, polling the queues at intervals which lengthen from
+# POLL_MIN_INTERVAL by a factor of POLL_BACKOFF up to POLL_MAX_INTERVAL seconds
+# while no submissions are found.
+DAEMON            = is_true(os.getenv('DAEMON'))
+POLL_MIN_INTERVAL = max(0, to_int(os.getenv('POLL_MIN_INTERVAL'), 15))
+POLL_MAX_INTERVAL = max(0, to_int(os.getenv('POLL_MAX_INTERVAL'), 300))
+POLL_BACKOFF      = max(1, to_int(os.getenv('POLL_BACKOFF'), 2))
+
+# SQS queue receiving S3 event notifications for the AWS buckets; if given,
+# new submissions are discovered from these events instead of bucket listings.
+INTAKE_QUEUE = os.getenv('INTAKE_QUEUE')
+
+# Maximum number of event messages received per poll, and the longest time in
+# seconds that a poll waits for the first message.
+INTAKE_BATCH_SIZE = max(1, to_int(os.getenv('INTAKE_BATCH_SIZE'), 100))
+INTAKE_WAIT       = max(0, to_int(os.getenv('INTAKE_WAIT'), 20))
+
+# Number of repository/deployment queues processed concurrently.  (Each may
+# have UPLOAD_WORKERS transfers to IA in progress.)
+QUEUE_WORKERS = max(1, to_int(os.getenv('QUEUE_WORKERS'), 2))
+
+# Seconds after which a package or data file whose other half has not arrived
+# is reported as orphaned.
+ORPHAN_AGE = max(0, to_int(os.getenv('ORPHAN_AGE'), 24 * 60 * 60))
+
+# Seconds that a snapshot of the pause/resume control files is re-used.
+CONTROL_TTL = max(0, to_int(os.getenv('CONTROL_TTL'), 30))
+
+# Location of the record of data files uploaded to IA; if given, a data file
+# with the same content as one already uploaded to the same IA item is not
+# transferred again.
+DEDUP_PATH = os.getenv('DEDUP_PATH')
+if DEDUP_PATH and AWS_LAMBDA:
+    DEDUP_PATH = os.path.join(tempfile.gettempdir(), DEDUP_PATH)
+
+# Maximum attempts for a request which fails temporarily, and the limits in
+# seconds on the (randomized, doubling) delays between attempts.
+RETRY_ATTEMPTS   = max(1, to_int(os.getenv('RETRY_ATTEMPTS'), 3))
+RETRY_BASE_DELAY = max(0, to_int(os.getenv('RETRY_BASE_DELAY'), 2))
+RETRY_MAX_DELAY  = max(0, to_int(os.getenv('RETRY_MAX_DELAY'), 30))
+
+# After IA_BREAKER_THRESHOLD consecutive temporary failures IA is considered
+# to be unavailable and is not tried again for IA_BREAKER_RESET seconds.
+IA_BREAKER_THRESHOLD = max(1, to_int(os.getenv('IA_BREAKER_THRESHOLD'), 5))
+IA_BREAKER_RESET     = max(0, to_int(os.getenv('IA_BREAKER_RESET'), 300))
+
+# Limits on IA requests per second and bytes per second sent to IA (0 means
+# no limit).  These are reduced automatically while IA is throttling.
+IA_REQUEST_RATE = max(0, to_int(os.getenv('IA_REQUEST_RATE'), 5))
+IA_BYTE_RATE    = max(0, to_int(os.getenv('IA_BYTE_RATE'), 0))
+
+# Emit timing and throughput metrics for each queue in CloudWatch Embedded
+# Metric Format (as JSON lines on stdout) under METRICS_NAMESPACE; if
+# METRICS_TEXTFILE is given, totals are also written there for the Prometheus
+# node-exporter textfile collector.
+METRICS           = is_true(os.getenv('METRICS', str(APPLICATION_DEPLOYED)))
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'EMMA/IA')
+METRICS_TEXTFILE  = os.getenv('METRICS_TEXTFILE')
+
+# Profile each stage of processing with cProfile ("cpu"), tracemalloc ("mem")
+# or both ("both"), writing the reports to PROFILE_DIR (default: a directory
+# under the system temporary directory).  With PROFILE_SUBMISSIONS, each
+# submission is also reported separately.  Memory reports list PROFILE_TOP
+# allocation sites.
+PROFILE             = (os.getenv('PROFILE') or '').casefold()
+PROFILE_CPU         = PROFILE in ('cpu', 'both')
+PROFILE_MEM         = PROFILE in ('mem', 'both')
+PROFILE_DIR         = os.getenv('PROFILE_DIR')
+PROFILE_SUBMISSIONS = is_true(os.getenv('PROFILE_SUBMISSIONS'))
+PROFILE_TOP         = max(1, to_int(os.getenv('PROFILE_TOP'), 25))
@@ -1,7 +1,9 @@
+#!/bin/sh
 # run application
 
-pipenv run python main.py
-exit $?
+# Replace the shell so that signals (e.g. SIGTERM from ECS) reach the
+# application directly.
+exec pipenv run python main.py "$@"
 
 #
 # end of file
@@ -1,6 +1,11 @@
 # tests/__init__.py
 
-from tests.sys  import trials as sys_trials
-from tests.aws  import trials as aws_trials
-from tests.emma import trials as emma_trials
-from tests.ia   import trials as ia_trials
+from tests.sys         import trials as sys_trials
+from tests.aws         import trials as aws_trials
+from tests.emma        import trials as emma_trials
+from tests.ia          import trials as ia_trials
+from tests.intake      import trials as intake_trials
+from tests.import_time import trials as import_time_trials
+from tests.journal     import trials as journal_trials
+from tests.handler     import trials as handler_trials
+from tests.metrics     import trials as metrics_trials
@@ -16,3 +16,8 @@ sys_trials()
 aws_trials()
 ia_trials()
 emma_trials()
+intake_trials()
+import_time_trials()
+journal_trials()
+handler_trials()
+metrics_trials()
@@ -0,0 +1,368 @@
+# tests/bench.py
+#
+# End-to-end throughput benchmarks.
+#
+# These run process() against local stand-ins:  AWS S3 is provided by moto (a
+# development package) and IA by a requests transport adapter which accepts
+# every request without contacting archive.org.  Nothing outside the current
+# process is touched.
+#
+# Run with `pipenv run python -m tests.bench [name=value ...]` where each name
+# is a parameter of benchmark(), e.g.:
+#
+#   python -m tests.bench count=500 sizes=64K-8M workers=8 stream=true
+#
+# Without arguments a small matrix of concurrency settings is run.  Export
+# DEBUG=false to keep the per-submission output from affecting the results.
+
+
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+from contextlib          import contextmanager
+from requests            import Response
+from requests.adapters   import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+import app.ia
+import app.process
+
+from app.process import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+BENCH_REPO       = 'ia'
+BENCH_DEPLOYMENT = 'staging'
+BENCH_REGION     = 'us-east-1'
+BENCH_SEED       = 1
+
+# Multipliers for size suffixes.
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+SIP_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<emma>
+  <emma_repositoryRecordId>bench-{sid}</emma_repositoryRecordId>
+  <emma_repository>internetArchive</emma_repository>
+  <dc_title>Benchmark submission {sid}</dc_title>
+  <dc_type>text</dc_type>
+  <rem_source>bookshare</rem_source>
+  <rem_complete>true</rem_complete>
+</emma>
+"""
+
+# Concurrency settings run by trials().
+BENCH_MATRIX = [
+    {},
+    {'workers': 4, 'parse_workers': 4},
+    {'workers': 4, 'parse_workers': 4, 'stream': True},
+    {'workers': 4, 'parse_workers': 4, 'stream': True, 'pipeline': True},
+]
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class FakeIAAdapter(BaseAdapter):
+    """
+    Stands in for archive.org:  every request succeeds after an optional
+    delay, and the bytes of each request body are read (as IA would) and
+    counted.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        :param float latency:   Seconds added to each request.
+        """
+        super().__init__()
+        self.latency  = latency
+        self.requests = 0
+        self.received = 0
+        self._lock    = threading.Lock()
+
+    def send(self, request, **kwargs) -> Response:
+        size = _consume(request.body)
+        self.latency and time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            self.received += size
+        if request.method == 'GET' and '/metadata/' in request.url:
+            content = {}  # A new item.
+        else:
+            content = {'success': True}
+        response = Response()
+        response.status_code = 200
+        response.reason      = 'OK'
+        response.url         = request.url
+        response.request     = request
+        response.encoding    = 'utf-8'
+        response.headers     = CaseInsensitiveDict({
+            'Content-Type': 'application/json'
+        })
+        response._content    = json.dumps(content).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def parse_size(value) -> int:
+    """
+    A number of bytes from e.g. "512", "64K" or "8M".
+
+    :param str|int value:
+
+    """
+    value = str(value).strip().upper().rstrip('B')
+    unit  = value[-1:] if value[-1:] in SIZE_UNITS else ''
+    return int(float(value[:len(value) - len(unit)]) * SIZE_UNITS[unit])
+
+
+def data_file_sizes(count, sizes, seed=BENCH_SEED) -> List[int]:
+    """
+    Data file sizes drawn uniformly from a range ("MIN-MAX") or all the same
+    (a single size).
+
+    :param int count:
+    :param str sizes:
+    :param int seed:    For repeatable runs.
+
+    """
+    low, _, high = str(sizes).partition('-')
+    low, high    = parse_size(low), parse_size(high or low)
+    rand         = random.Random(seed)
+    return [rand.randint(low, high) for _ in range(count)]
+
+
+def create_submissions(bucket, sizes) -> int:
+    """
+    Put a package and a data file for each size into the bucket.
+
+    :param str       bucket:
+    :param list[int] sizes:
+
+    :return: Total bytes of data files.
+    :rtype:  int
+
+    """
+    s3_cli = s3_client(None)
+    for number, size in enumerate(sizes):
+        sid  = f"bench{number:06d}"
+        sip  = SIP_TEMPLATE.format(sid=sid).encode()
+        s3_cli.put_object(Bucket=bucket, Key=f"{sid}.xml", Body=sip)
+        s3_cli.put_object(Bucket=bucket, Key=f"{sid}.pdf", Body=bytes(size))
+    return sum(sizes)
+
+
+def peak_rss() -> int:
+    """
+    The peak resident set size of this process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else (peak * 1024)
+
+
+@contextmanager
+def fake_ia(adapter):
+    """
+    Within the block, IA sessions created for processing send all requests
+    to *adapter*, and requests are not rate-limited (since the stand-in does
+    not throttle).
+
+    :param FakeIAAdapter adapter:
+
+    """
+    original = app.process.ia_get_session
+    limiter  = app.ia.ia_limiter
+
+    def get_session():
+        session = original()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    app.process.ia_get_session = get_session
+    app.process._ia_sessions.clear()
+    app.ia.ia_limiter = RateLimiter('IA')
+    try:
+        yield adapter
+    finally:
+        app.process.ia_get_session = original
+        app.process._ia_sessions.clear()
+        app.ia.ia_limiter = limiter
+
+
+def benchmark(
+        count=100,
+        sizes='64K-1M',
+        workers=None,
+        parse_workers=None,
+        stream=None,
+        pipeline=None,
+        latency=0.0) -> dict:
+    """
+    Process a bucket of generated submissions and report throughput.
+
+    Must be run with moto's S3 mock active.  Peak RSS includes the content of
+    the mock bucket (held in memory by moto) and is the peak for the whole
+    process so far, so that it only grows across successive benchmarks.
+
+    :param int        count:            Number of submissions.
+    :param str        sizes:            Data file size or range of sizes.
+    :param int|None   workers:          Concurrent IA uploads.
+    :param int|None   parse_workers:    Concurrent package fetches.
+    :param bool|None  stream:           Stream data files from AWS to IA.
+    :param bool|None  pipeline:         Stream submissions through stages.
+    :param float      latency:          Seconds added to each IA request.
+
+    :return: Measurements.
+    :rtype:  dict
+
+    """
+    bucket = s3_bucket_name(BENCH_REPO, BENCH_DEPLOYMENT)
+    total  = create_submissions(bucket, data_file_sizes(count, sizes))
+    rss    = peak_rss()
+    with tempfile.TemporaryDirectory() as work_dir, \
+            fake_ia(FakeIAAdapter(latency)) as adapter:
+        cwd = os.getcwd()
+        os.chdir(work_dir)  # Data files are staged in the current directory.
+        try:
+            start = time.perf_counter()
+            processed = process(
+                BENCH_REPO,
+                BENCH_DEPLOYMENT,
+                workers=workers,
+                parse_workers=parse_workers,
+                pipeline=pipeline,
+                stream=stream
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return {
+        'submissions':     processed,
+        'seconds':         round(elapsed, 3),
+        'submissions/sec': round(processed / elapsed, 1),
+        'MB/sec':          round(total / elapsed / SIZE_UNITS['M'], 1),
+        'ia_requests':     adapter.requests,
+        'ia_MB':           round(adapter.received / SIZE_UNITS['M'], 1),
+        'setup_rss_MB':    round(rss / SIZE_UNITS['M'], 1),
+        'peak_rss_MB':     round(peak_rss() / SIZE_UNITS['M'], 1),
+    }
+
+
+def show_benchmark(**params) -> bool:
+    """
+    Run a benchmark and display its settings and measurements.
+
+    :param params:  Passed to benchmark().
+
+    :return: Whether all submissions were processed.
+    :rtype:  bool
+
+    """
+    settings = ' '.join(f"{k}={v}" for k, v in params.items()) or 'defaults'
+    show_header(f"Benchmark: {settings}")
+    result = benchmark(**params)
+    show(result)
+    expected = params.get('count', 100)
+    success  = result['submissions'] == expected
+    show('OK' if success else 'FAILED')
+    return success
+
+
+# =============================================================================
+# Internal functions
+# =============================================================================
+
+
+def _consume(body) -> int:
+    """
+    Read a request body to the end.
+
+    :param bytes|str|IO|Iterable|None body:
+
+    :return: The number of bytes read.
+    :rtype:  int
+
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    size = 0
+    if hasattr(body, 'read'):
+        for chunk in iter(lambda: body.read(1 << 20), b''):
+            size += len(chunk)
+    else:
+        for chunk in body:
+            size += len(chunk)
+    return size
+
+
+def _arguments(args) -> dict:
+    """
+    benchmark() parameters from "name=value" command-line arguments.
+
+    :param list[str] args:
+
+    """
+    params = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name in ('count', 'workers', 'parse_workers'):
+            params[name] = to_int(value)
+        elif name == 'latency':
+            params[name] = float(value)
+        elif name in ('stream', 'pipeline'):
+            params[name] = is_true(value)
+        elif name == 'sizes':
+            params[name] = value
+        else:
+            raise RuntimeError(f"{arg}: invalid benchmark parameter")
+    return params
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials(*matrix):
+    """
+    :param dict matrix:     Benchmark parameters (default: BENCH_MATRIX).
+    """
+    from moto import mock_s3  # Development package.
+    with mock_s3():
+        _trials(*matrix)
+
+
+def _trials(*matrix):
+    show_section('THROUGHPUT BENCHMARKS')
+    os.environ.setdefault('AWS_DEFAULT_REGION', BENCH_REGION)
+    reset_aws_session()  # Clients created outside the mock.
+    bucket = s3_bucket_name(BENCH_REPO, BENCH_DEPLOYMENT)
+    s3_client(None).create_bucket(Bucket=bucket)
+    for params in (matrix or BENCH_MATRIX):
+        show_benchmark(**params)
+    show_section()
+
+
+if __name__ == '__main__':
+    trials(*([_arguments(sys.argv[1:])] if sys.argv[1:] else []))
@@ -3,7 +3,268 @@
 # EMMA metadata definition trials.
 
 
-from app.common import *
+import io
+import re
+
+from app.emma import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Submission information packages covering the forms of element content.
+SIP_SAMPLES = {
+    'namespaced': (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<emma:record xmlns:emma="https://emma.example/schema">'
+        '<emma:emma_repositoryRecordId>rec-1</emma:emma_repositoryRecordId>'
+        '<emma:dc_title>A Title</emma:dc_title>'
+        '<dc_type>text</dc_type>'
+        '</emma:record>'
+    ),
+    'nested lists': (
+        '<record>'
+        '<dc_identifier><v>isbn:9780000000001</v><v>oclc:123</v>'
+        '</dc_identifier>'
+        '<rem_remediation>'
+        '<v>a</v><v><w>b</w><w>c</w></v><v/>'
+        '</rem_remediation>'
+        '<dc_subject><v></v><v> </v></dc_subject>'
+        '</record>'
+    ),
+    'blank elements': (
+        '<record>'
+        '<dc_title/>'
+        '<dc_description></dc_description>'
+        '<dc_publisher>  </dc_publisher>'
+        '<dc_creator>Someone</dc_creator>'
+        '</record>'
+    ),
+    'true/false': (
+        '<record>'
+        '<rem_complete>true</rem_complete>'
+        '<emma_accessibilityFeature>FALSE</emma_accessibilityFeature>'
+        '<rem_status>False </rem_status>'
+        '<bib_volume>True</bib_volume>'
+        '<list><v>true</v><v>false</v></list>'
+        '</record>'
+    ),
+    'mixed': (
+        '<record>\n'
+        '  <dc_title>First</dc_title>\n'
+        '  <dc_title>Second</dc_title>\n'
+        '  <dc_description>Some <b>bold</b> text</dc_description>\n'
+        '  <dc_language>eng</dc_language>\n'
+        '</record>\n'
+    ),
+}
+
+# EMMA metadata of a representative submission.
+EMMA_RECORD = {
+    'emma_repositoryRecordId':  'emma-trial-0001',
+    'emma_collection':          'emma_uploads',
+    'rem_source':               'bookshare',
+    'dc_title':                 'A Trial Title',
+    'dc_creator':               ['First Author', 'Second Author'],
+    'dc_identifier':            ['isbn:9780000000001', 'oclc:123', 'doi:x:y'],
+    'dc_language':              ['eng'],
+    'dc_type':                  'text',
+    'dc_description':           '',
+    'dcterms_dateCopyright':    '2020',
+    'rem_complete':             False,
+    'rem_coverage':             'Chapters 1-3',
+    'rem_remediation':          ['tagged', 'ocr'],
+    'rem_status':               'complete',
+    'bib_volume':               '2',
+    'emma_formatFeature':       ['tagged'],
+}
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class StreamedBody:
+    """
+    A stand-in for an S3 object body, which delivers its content in pieces
+    smaller than requested.
+    """
+
+    def __init__(self, content, piece=7):
+        """
+        :param bytes content:
+        :param int   piece:     Most bytes returned by each read.
+        """
+        self._source = io.BytesIO(content)
+        self._piece  = piece
+
+    def read(self, size=-1) -> bytes:
+        size = self._piece if size < 0 else min(size, self._piece)
+        return self._source.read(size)
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def sip_parse_tree(text):
+    """
+    The former implementation of sip_parse(), which parsed the whole document
+    with Xml.fromstring().
+
+    :param str text:
+
+    :rtype: dict
+
+    """
+    result = {}
+    for child in Xml.fromstring(text):
+        field = re.sub(r'{[^}\n]+}', '', child.tag)
+        value = sip_node_value(child)
+        if is_present(value):
+            result[field] = value
+    return result
+
+
+def sip_sources(text) -> dict:
+    """
+    Makers of each kind of source accepted by sip_parse().
+
+    :param str text:
+
+    """
+    data = text.encode('utf-8')
+    return {
+        'str':        lambda: text,
+        'bytes':      lambda: data,
+        'memoryview': lambda: memoryview(data),
+        'BytesIO':    lambda: io.BytesIO(data),
+        'StringIO':   lambda: io.StringIO(text),
+        'streamed':   lambda: StreamedBody(data),
+    }
+
+
+def show_sip_parse(name, text) -> bool:
+    """
+    Compare sip_parse() with the former implementation for each kind of
+    source.
+
+    :param str name:
+    :param str text:
+
+    :return: Whether all results matched.
+    :rtype:  bool
+
+    """
+    show_header(f"sip_parse {name}")
+    expected = sip_parse_tree(text)
+    show(expected)
+    failed = []
+    for kind, make in sip_sources(text).items():
+        result = sip_parse(make())
+        if result != expected:
+            failed.append(kind)
+            show(f"{kind}: {result}")
+    show('OK' if not failed else f"FAILED: {', '.join(failed)}")
+    return not failed
+
+
+def ia_metadata_field_map(emma_metadata):
+    """
+    The former implementation of ia_metadata(), which interpreted
+    EMMA_FIELD_MAP for each record.
+
+    :param dict emma_metadata:
+
+    :rtype: dict
+
+    """
+    result = ia_identifier_metadata(emma_metadata.get('dc_identifier'))
+    for field, entry in EMMA_FIELD_MAP.items():
+        if field in emma_metadata:
+            ia_field = entry
+            ia_value = emma_metadata[field]
+            if isinstance(entry, dict):
+                ia_field = entry['field']
+                if 'map' in entry:
+                    ia_value = entry['map'][ia_value]
+                elif 'transform' in entry:
+                    ia_value = entry['transform'](ia_value)
+            if is_present(ia_value):
+                result[ia_field] = ia_value
+    return result
+
+
+def show_ia_metadata(record=None) -> bool:
+    """
+    Compare ia_metadata() with the former field map interpretation.
+
+    :param dict|None record:    Default: EMMA_RECORD.
+
+    :return: Whether the results matched.
+    :rtype:  bool
+
+    """
+    show_header('ia_metadata')
+    record   = record or EMMA_RECORD
+    expected = ia_metadata_field_map(record)
+    result   = ia_metadata(record)
+    show(result)
+    success = (result == expected)
+    success or show(f"expected: {expected}")
+    show('OK' if success else 'FAILED')
+    return success
+
+
+def show_ia_metadata_parts(record=None) -> bool:
+    """
+    Compare ia_metadata_parts() with partitioning the result of ia_metadata().
+
+    :param dict|None record:    Default: EMMA_RECORD.
+
+    :return: Whether the results matched.
+    :rtype:  bool
+
+    """
+    show_header('ia_metadata_parts')
+    record   = record or EMMA_RECORD
+    expected = ia_partition_metadata(ia_metadata(record))
+    result   = ia_metadata_parts(record)
+    show(result)
+    success = (result == expected)
+    success or show(f"expected: {expected}")
+    show('OK' if success else 'FAILED')
+    return success
+
+
+def show_ia_metadata_batch() -> bool:
+    """
+    A record with an unmapped dc_type fails on its own while the rest of the
+    batch is translated.
+
+    :return: Whether only the bad record failed.
+    :rtype:  bool
+
+    """
+    show_header('ia_metadata_batch')
+    second  = {**EMMA_RECORD, 'emma_repositoryRecordId': 'emma-trial-0002'}
+    bad     = {**EMMA_RECORD, 'dc_type': 'hologram'}
+    records = [EMMA_RECORD, bad, second]
+    result  = ia_metadata_batch(records)
+    for entry in result:
+        show(repr(entry) if isinstance(entry, Exception) else entry)
+    success = isinstance(result[1], MetadataError) and all(
+        result[i] == ia_metadata_field_map(records[i]) for i in (0, 2)
+    )
+    parts   = ia_metadata_batch(records, partition=True)
+    success = success and isinstance(parts[1], MetadataError)
+    success = success and parts[2] == ia_metadata_parts(second)
+    show('OK' if success else 'FAILED')
+    return success
 
 
 # =============================================================================
@@ -13,7 +274,11 @@ from app.common import *
 
 def trials():
     show_section('EMMA TRIALS')
-    show('(None yet)')
+    for name, text in SIP_SAMPLES.items():
+        show_sip_parse(name, text)
+    show_ia_metadata()
+    show_ia_metadata_parts()
+    show_ia_metadata_batch()
     show_section()
 
 
@@ -0,0 +1,74 @@
+# tests/handler.py
+#
+# AWS Lambda handler trials.
+#
+# These replace the pause check, bucket lookup and submission search of the
+# handler with stand-ins so that no AWS resources are touched.
+
+
+import app.handler
+
+from app.handler import *
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def failed_lookup(*_args, **_kwargs):
+    """
+    A stand-in for a bucket lookup or submission search which fails.
+    """
+    raise ConnectionError('simulated AWS failure')
+
+
+def show_lookup_failure(name, event) -> bool:
+    """
+    A submission whose search fails must be reported as failed:  as a batch
+    item failure for an SQS event, or as an exception for a direct S3 event.
+
+    :param str  name:       Patched function of app.handler.
+    :param dict event:
+
+    :return: Whether the failure was reported.
+    :rtype:  bool
+
+    """
+    direct = event is SAMPLE_EVENTS['s3']
+    names  = ('is_paused', 'get_repo_bucket', 'find_submissions')
+    saved  = {n: getattr(app.handler, n) for n in names}
+    app.handler.is_paused        = lambda *_: False
+    app.handler.get_repo_bucket  = lambda bucket=None: bucket
+    app.handler.find_submissions = lambda *_: SipTable()
+    setattr(app.handler, name, failed_lookup)
+    try:
+        result  = lambda_handler(event)
+        success = not direct and bool(result['batchItemFailures'])
+    except RuntimeError as error:
+        result  = error
+        success = direct
+    finally:
+        for saved_name, func in saved.items():
+            setattr(app.handler, saved_name, func)
+    show(result)
+    show('OK' if success else 'FAILED')
+    return success
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials():
+    show_section('LAMBDA HANDLER TRIALS')
+    for name in ('get_repo_bucket', 'find_submissions'):
+        for kind in ('sqs', 's3'):
+            show_header(f"{kind} event when {name} fails")
+            show_lookup_failure(name, SAMPLE_EVENTS[kind])
+    show_section()
+
+
+if __name__ == '__main__':
+    trials()
@@ -0,0 +1,116 @@
+# tests/import_time.py
+#
+# Start-up cost trials.
+#
+# Each entry point is imported in a fresh interpreter run with "-X importtime"
+# and the report is checked for large dependencies which should only be
+# loaded when they are first used.
+
+
+import os
+import re
+import subprocess
+import sys
+
+from app.common import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Modules imported by each trial.
+IMPORT_TARGETS = ('app.process', 'app.handler')
+
+# Modules which should not be loaded just by importing the application.
+DEFERRED_MODULES = (
+    'boto3',
+    'boto3_type_annotations',
+    'botocore',
+    'internetarchive',
+    'requests',
+    'xml.etree.ElementTree',
+)
+
+# Number of most expensive imports shown.
+IMPORT_TIME_TOP = 15
+
+# A line of "-X importtime" output: self and cumulative microseconds, and the
+# module name indented by its depth in the import tree.
+IMPORT_TIME_LINE = re.compile(
+    r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)'
+)
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def import_times(module) -> List[Tuple[str, int, int]]:
+    """
+    Import a module in a new interpreter and report the time taken by each
+    module it loaded.
+
+    :param str module:
+
+    :return: Module name, self and cumulative microseconds for each module
+                in the order that their imports completed.
+    :rtype:  list[tuple[str,int,int]]
+
+    """
+    env  = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    args = [sys.executable, '-X', 'importtime', '-c', f"import {module}"]
+    proc = subprocess.run(args, env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    result = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            own, total, _, name = match.groups()
+            result.append((name, int(own), int(total)))
+    return result
+
+
+def show_import_times(module, top=IMPORT_TIME_TOP) -> bool:
+    """
+    Display the total import time of a module and its most expensive
+    dependencies, and check that none of DEFERRED_MODULES were loaded.
+
+    :param str module:
+    :param int top:     Number of dependencies shown.
+
+    :return: Whether no deferred modules were loaded.
+    :rtype:  bool
+
+    """
+    show_header(f"import {module}")
+    times  = import_times(module)
+    total  = next((t for name, _, t in times if name == module), 0)
+    loaded = {name for name, _, _ in times}
+    early  = [name for name in DEFERRED_MODULES if name in loaded]
+    show(f"{total / 1000:.1f} ms total; {len(times)} modules")
+    for name, own, _ in sorted(times, key=lambda t: -t[1])[:top]:
+        show(f"{own / 1000:8.1f} ms  {name}")
+    if early:
+        show(f"loaded early: {', '.join(early)}")
+    show('FAILED' if early else 'OK')
+    return not early
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials():
+    show_section('IMPORT TIME TRIALS')
+    for module in IMPORT_TARGETS:
+        show_import_times(module)
+    show_section()
+
+
+if __name__ == '__main__':
+    trials()
@@ -0,0 +1,147 @@
+# tests/intake.py
+#
+# S3 event intake trials.
+#
+# These run against local stand-ins for AWS S3 and SQS provided by moto (a
+# development package) so that no AWS resources are touched.
+
+
+import json
+import os
+
+from app.aws_s3 import *
+from app.intake import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+INTAKE_TEST_QUEUE  = 'emma-intake-test'
+INTAKE_TEST_BUCKET = s3_bucket_name('ia', 'staging')
+INTAKE_TEST_REGION = 'us-east-1'
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def s3_event(bucket, key, via_sns=False) -> str:
+    """
+    The body of the message that S3 sends when an object is created.
+
+    :param str  bucket:
+    :param str  key:
+    :param bool via_sns:    Wrap the event in an SNS notification.
+
+    """
+    record = {
+        'eventSource': 'aws:s3',
+        'eventName':   'ObjectCreated:Put',
+        's3': {
+            'bucket': {'name': bucket},
+            'object': {'key': key.replace(' ', '+'), 'size': 0},
+        },
+    }
+    body = json.dumps({'Records': [record]})
+    if via_sns:
+        body = json.dumps({'Type': 'Notification', 'Message': body})
+    return body
+
+
+def put_submission_object(key, bucket, sqs_cli, queue_url, via_sns=False):
+    """
+    Create an object and send the notification that S3 would send.
+
+    :param str        key:
+    :param str        bucket:
+    :param sqs.Client sqs_cli:
+    :param str        queue_url:
+    :param bool       via_sns:
+
+    """
+    s3_client(None).put_object(Bucket=bucket, Key=key, Body=b'')
+    body = s3_event(bucket, key, via_sns)
+    sqs_cli.send_message(QueueUrl=queue_url, MessageBody=body)
+
+
+def queued_message_count(sqs_cli, queue_url) -> int:
+    """
+    The number of messages on the queue, including those which have been
+    received but not deleted.
+
+    :param sqs.Client sqs_cli:
+    :param str        queue_url:
+
+    """
+    names = [
+        'ApproximateNumberOfMessages',
+        'ApproximateNumberOfMessagesNotVisible',
+    ]
+    attr  = sqs_cli.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=names
+    )
+    return sum(int(attr['Attributes'][name]) for name in names)
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials():
+    from moto import mock_s3, mock_sqs  # Development package.
+    with mock_s3(), mock_sqs():
+        _trials()
+
+
+def _trials():
+    show_section('S3 EVENT INTAKE TRIALS')
+    os.environ.setdefault('AWS_DEFAULT_REGION', INTAKE_TEST_REGION)
+    reset_aws_session()  # Clients created outside the mock.
+    bucket  = INTAKE_TEST_BUCKET
+    sqs_cli = boto3.client('sqs', region_name=INTAKE_TEST_REGION)
+    url     = sqs_cli.create_queue(QueueName=INTAKE_TEST_QUEUE)['QueueUrl']
+    s3_client(None).create_bucket(Bucket=bucket)
+    test_event = {'Service': 'Amazon S3', 'Event': 's3:TestEvent'}
+    sqs_cli.send_message(QueueUrl=url, MessageBody=json.dumps(test_event))
+    intake = Intake(url, wait=0, sqs_obj=sqs_cli)
+
+    # Only complete submissions are handed out.
+    if True:
+        show_header('Package files only')
+        put_submission_object('sid-1.xml', bucket, sqs_cli, url)
+        put_submission_object('sid 2.xml', bucket, sqs_cli, url, via_sns=True)
+        put_submission_object('control/paused-ia', bucket, sqs_cli, url)
+        tables = intake.poll([bucket])
+        show(tables)
+        show(intake.pending)
+        show('OK' if not tables else 'FAILED')
+
+    # The arrival of the data files completes the submissions.
+    if True:
+        show_header('Data files')
+        put_submission_object('sid-1.zip', bucket, sqs_cli, url)
+        put_submission_object('sid 2.pdf', bucket, sqs_cli, url)
+        tables = intake.poll([bucket])
+        show(tables)
+        table  = tables.get(bucket) or SipTable()
+        show('OK' if sorted(table) == ['sid 2', 'sid-1'] else 'FAILED')
+
+    # Only the messages for acknowledged submissions are deleted.
+    if True:
+        show_header('Acknowledge "sid-1"; release "sid 2"')
+        intake.acknowledge(bucket, ['sid-1'])
+        intake.release(bucket, ['sid 2'])
+        count = queued_message_count(sqs_cli, url)
+        show(f"{count} messages remaining on the queue")
+        show('OK' if count == 2 else 'FAILED')
+
+    show_section()
+
+
+if __name__ == '__main__':
+    trials()
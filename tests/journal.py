@@ -0,0 +1,122 @@
+# tests/journal.py
+#
+# Processing journal trials.
+#
+# These use a temporary journal file and no AWS or IA services:  the journal
+# writes made by a run are replayed directly.
+
+
+import os
+import tempfile
+
+from types import SimpleNamespace
+
+import app.process
+
+from app.process import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Stand-in for the S3 bucket whose queue is journaled.
+JOURNAL_BUCKET = SimpleNamespace(name='emma-journal-trial')
+
+JOURNAL_SID = 'u0000000000001'
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def simulate_run(sid, dry_run) -> bool:
+    """
+    Record the progress of a run which uploads one submission, as
+    upload_submissions() would, after resuming from the journal.
+
+    :param str  sid:
+    :param bool dry_run:
+
+    :return: Whether the submission would have been uploaded by the run.
+    :rtype:  bool
+
+    """
+    app.process.DRY_RUN = dry_run
+    journal = open_journal(JOURNAL_BUCKET)
+    try:
+        entries = [(sid, Sip(package=f"{sid}.xml", data_file=f"{sid}.pdf"))]
+        _, submission = next(app.process._resume_submissions(entries, journal))
+        upload = not submission.completed
+        if upload and journal:
+            journal.record(sid, State.Uploaded)
+    finally:
+        journal and journal.close()
+    return upload
+
+
+def show_dry_run_then_run() -> bool:
+    """
+    A dry run must not cause the following real run to skip uploading.
+
+    :return: Whether the real run uploaded the submission.
+    :rtype:  bool
+
+    """
+    show_header('dry run then real run')
+    dry_run_upload = simulate_run(JOURNAL_SID, dry_run=True)
+    real_run_upload = simulate_run(JOURNAL_SID, dry_run=False)
+    rerun_upload = simulate_run(JOURNAL_SID, dry_run=False)
+    show(f"dry run uploads:  {dry_run_upload}")
+    show(f"real run uploads: {real_run_upload}")
+    show(f"re-run uploads:   {rerun_upload}")
+    success = dry_run_upload and real_run_upload and not rerun_upload
+    show('OK' if success else 'FAILED')
+    return success
+
+
+def show_uploaded_written() -> bool:
+    """
+    Reaching the Uploaded state must be written without waiting for a flush.
+
+    :return: Whether another connection saw the Uploaded state.
+    :rtype:  bool
+
+    """
+    show_header('uploaded state written immediately')
+    path  = app.process.JOURNAL_PATH
+    queue = JOURNAL_BUCKET.name
+    with Journal(queue, path, batch_size=100, interval=3600) as journal:
+        journal.record('u0000000000002', State.Listed)
+        journal.record('u0000000000003', State.Listed)
+        journal.record('u0000000000003', State.Uploaded)
+        with Journal(queue, path) as reader:
+            states = reader.states()
+    show(f"states: {dict((sid, s.name) for sid, s in states.items())}")
+    success = states.get('u0000000000003') == State.Uploaded
+    show('OK' if success else 'FAILED')
+    return success
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials():
+    show_section('JOURNAL TRIALS')
+    saved = (app.process.DRY_RUN, app.process.JOURNAL_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        app.process.JOURNAL_PATH = os.path.join(directory, 'journal.db')
+        try:
+            show_dry_run_then_run()
+            show_uploaded_written()
+        finally:
+            app.process.DRY_RUN, app.process.JOURNAL_PATH = saved
+    show_section()
+
+
+if __name__ == '__main__':
+    trials()
@@ -0,0 +1,112 @@
+# tests/metrics.py
+#
+# Metrics output trials.
+#
+# The Prometheus textfile is checked against the rules of the text exposition
+# format (version 0.0.4) which determine how each sample is typed:  a sample
+# belongs to the family named by a "# TYPE" line only if its name is that
+# name (or, for a histogram, that name with a "_bucket", "_sum" or "_count"
+# suffix); otherwise it is parsed as a separate, untyped metric.
+
+
+import os
+import re
+import tempfile
+
+from app.metrics import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Sample name suffixes for each Prometheus metric type.
+SAMPLE_SUFFIXES = {
+    'counter':   ('',),
+    'gauge':     ('',),
+    'histogram': ('_bucket', '_sum', '_count'),
+}
+
+PROMETHEUS_TYPE   = re.compile(r'^# TYPE (\S+) (\S+)$')
+PROMETHEUS_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? \S+$')
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def textfile_errors(text) -> List[str]:
+    """
+    The lines of a Prometheus textfile which are malformed or whose samples
+    are not part of the metric family declared by a preceding TYPE line.
+
+    :param str text:
+
+    """
+    errors = []
+    types  = {}
+    for line in text.splitlines():
+        declared = PROMETHEUS_TYPE.match(line)
+        sample   = PROMETHEUS_SAMPLE.match(line)
+        if declared:
+            types[declared[1]] = declared[2]
+        elif sample:
+            name   = sample[1]
+            family = [
+                (base, kind)
+                for base, kind in types.items()
+                for suffix in SAMPLE_SUFFIXES.get(kind, ('',))
+                if name == f"{base}{suffix}"
+            ]
+            family or errors.append(f"untyped: {line}")
+        elif line and not line.startswith('#'):
+            errors.append(f"malformed: {line}")
+    return errors
+
+
+def show_textfile() -> bool:
+    """
+    Write the totals of a set of metrics to a textfile and check that every
+    sample is typed.
+
+    :return: Whether the textfile was valid.
+    :rtype:  bool
+
+    """
+    show_header('Prometheus textfile')
+    metrics = Metrics(Repo='ia', Deployment='staging')
+    metrics.count('UploadedSubmissions', 3)
+    metrics.count('UploadedBytes', 4096, BYTES)
+    metrics.observe('UploadLatency', 0.3)
+    metrics.observe('UploadLatency', 12)
+    totals = PrometheusTotals()
+    totals.add(metrics)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'emma_ia.prom')
+        write_textfile(path, totals.lines())
+        with open(path) as file:
+            text = file.read()
+    show(text.rstrip())
+    errors = textfile_errors(text)
+    for error in errors:
+        show(error)
+    success = bool(text) and not errors
+    show('OK' if success else 'FAILED')
+    return success
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials():
+    show_section('METRICS TRIALS')
+    show_textfile()
+    show_section()
+
+
+if __name__ == '__main__':
+    trials()
@@ -0,0 +1,166 @@
+# tests/sip_memory.py
+#
+# Memory benchmarks for SipTable.
+#
+# A table is filled with generated submissions just as a bucket listing would
+# fill it and the memory still allocated afterwards is measured with
+# tracemalloc.  The same is done with a replica of the former layout (an
+# instance dict per entry plus a dict of full object keys) for comparison.
+#
+# Run with `pipenv run python -m tests.sip_memory [COUNT ...]`.
+
+
+import random
+import sys
+import time
+import tracemalloc
+
+from app.sip_table import *
+
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+
+# Table sizes measured by trials().
+SIP_MEMORY_COUNTS = (10 ** 5, 10 ** 6)
+
+# Data file extensions of the generated submissions.
+DATA_EXTENSIONS = ('.pdf', '.epub', '.zip', '.txt')
+
+SIP_MEMORY_SEED = 1
+
+
+# =============================================================================
+# Classes
+# =============================================================================
+
+
+class DictSip:
+    """
+    The former layout of a Sip, for comparison.
+    """
+
+    def __init__(self):
+        self._completed = False
+        self._removed   = False
+        self._error     = None
+        self._metadata  = None
+        self._entry     = {'package': None, 'data_file': None}
+
+    def __setitem__(self, part, value):
+        self._entry[part] = value
+
+
+# =============================================================================
+# Functions
+# =============================================================================
+
+
+def object_keys(count, seed=SIP_MEMORY_SEED) -> Iterator[str]:
+    """
+    Generate the package and data file keys of submissions in the order that
+    they would be listed.
+
+    :param int count:
+    :param int seed:
+
+    """
+    rand = random.Random(seed)
+    for number in range(count):
+        sid = f"u{number:06d}{rand.getrandbits(48):012x}"
+        ext = rand.choice(DATA_EXTENSIONS)
+        yield from sorted([f"{sid}.xml", f"{sid}{ext}"])
+
+
+def fill_table(count) -> SipTable:
+    """
+    :param int count:
+    """
+    table = SipTable()
+    for key in object_keys(count):
+        sid, part = sip_part(key)
+        table.add(sid)[part] = key
+    return table
+
+
+def fill_dict_table(count) -> Dict[str, DictSip]:
+    """
+    :param int count:
+    """
+    table = {}
+    for key in object_keys(count):
+        sid, part = sip_part(key)
+        if sid not in table:
+            table[sid] = DictSip()
+        table[sid][part] = key
+    return table
+
+
+def measure(fill, count) -> Tuple[int, float]:
+    """
+    The memory retained by a filled table and the time taken to fill it.
+
+    :param Callable fill:
+    :param int      count:
+
+    :return: Bytes allocated and seconds (including tracing overhead).
+    :rtype:  tuple[int,float]
+
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        base  = tracemalloc.get_traced_memory()[0]
+        table = fill(count)
+        size  = tracemalloc.get_traced_memory()[0] - base
+        taken = time.perf_counter() - start
+    finally:
+        tracemalloc.stop()
+    assert len(table) == count
+    return size, taken
+
+
+def show_sip_memory(count) -> bool:
+    """
+    Display the memory used by SipTable and the former layout.
+
+    :param int count:
+
+    :return: Whether SipTable used less memory.
+    :rtype:  bool
+
+    """
+    show_header(f"{count} submissions")
+    compact, compact_time = measure(fill_table, count)
+    former, former_time   = measure(fill_dict_table, count)
+    for name, size, taken in [
+        ('SipTable', compact, compact_time),
+        ('former',   former,  former_time),
+    ]:
+        mb = size / (1 << 20)
+        show(f"{name:8} {mb:8.1f} MB {size / count:6.0f} B/entry {taken:.2f}s")
+    show(f"ratio    {compact / former:.2f}")
+    success = compact < former
+    show('OK' if success else 'FAILED')
+    return success
+
+
+# =============================================================================
+# Trials
+# =============================================================================
+
+
+def trials(*counts):
+    """
+    :param int counts:  Table sizes (default: SIP_MEMORY_COUNTS).
+    """
+    show_section('SIP MEMORY BENCHMARKS')
+    for count in (counts or SIP_MEMORY_COUNTS):
+        show_sip_memory(count)
+    show_section()
+
+
+if __name__ == '__main__':
+    trials(*[int(arg) for arg in sys.argv[1:]])